@@ -1,42 +1,604 @@
-from agents import (GuardAgent,
-                    ClassificationAgent,
-                    DetailsAgent,
-                    OrderTakingAgent,
-                    RecommendationAgent,
-                    AgentProtocol
-                    )
+import os
+import time
+import asyncio
+import threading
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+# The agents package imports its modules on first access, so with LAZY_STARTUP the agents (and openai, httpx, numpy)
+# are only imported when the controller is built
+import agents
+from agents.agent_protocol import AgentProtocol, AsyncAgentProtocol, StreamingAgentProtocol
+from agents.conversation import Conversation
+from agents import tracing
+from agents import admission
+from agents.admission import AdmissionError
+
+# The ways the guard decision and the routing decision can be fetched before the chosen agent runs
+#   sequential: guard agent first, then the classification agent (two round-trips one after the other)
+#   parallel: guard agent and classification agent at the same time, the classification is thrown away if the guard rejects
+#   fused: one completion that returns both the guard decision and the routing decision
+GUARD_ROUTING_MODES = ("sequential", "parallel", "fused")
+
+# The answer of a turn the LLM endpoints could not take in time (admission control), the client can send it again
+DEGRADED_MESSAGE = "Sorry, we're very busy right now. Please try again in a moment."
+
+# Where build_recommendation_data.py writes the recommendation files, next to this module whatever the working directory
+RECOMMENDATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendation_data")
+
+# Calls an agent inside a span named after it
+def call_agent(name, method, messages, **kwargs):
+    with tracing.span(name):
+        return method(messages, **kwargs)
+
+async def acall_agent(name, method, messages, **kwargs):
+    with tracing.span(name):
+        return await method(messages, **kwargs)
+
+# Decides whether a message is allowed and which agent should handle it
+class GuardRouter():
+    def __init__(self, mode="sequential", guard_agent=None, classification_agent=None, guard_classification_agent=None, client_registry=None,
+                 fast_router=None):
+        if mode not in GUARD_ROUTING_MODES:
+            raise ValueError(f"Unknown guard routing mode '{mode}', expected one of {GUARD_ROUTING_MODES}")
+        self.mode = mode
+        # Decides the obvious messages locally so the classification agent is only asked about the others (FAST_ROUTER).
+        # The fused mode gets both decisions from one completion anyway, so it does not use it
+        self.fast_router = fast_router if mode != "fused" else None
+
+        # Only build the agents that the selected mode actually needs
+        if mode == "fused":
+            self.guard_classification_agent = guard_classification_agent or agents.GuardClassificationAgent(client_registry)
+        else:
+            self.guard_agent = guard_agent or agents.GuardAgent(client_registry)
+            self.classification_agent = classification_agent or agents.ClassificationAgent(client_registry)
+
+        # A small pool to run the classification agent next to the guard agent in parallel mode
+        self.executor = ThreadPoolExecutor(max_workers=2) if mode == "parallel" else None
+
+    # Returns the guard agent's response and the name of the chosen agent (None when the guard rejects the message).
+    # on_decision is called with the chosen agent as soon as it is known while the guard is still deciding
+    # (fast-path decision or parallel classification), it is not called when the decision only comes after the guard.
+    def route(self, messages, on_decision=None):
+        if self.mode == "fused":
+            guard_agent_response = call_agent("guard_classification_agent", self.guard_classification_agent.get_response, messages)
+            if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+                return guard_agent_response, None
+            return guard_agent_response, guard_agent_response["memory"]["classification_decision"]
+
+        fast_decision = self.fast_route(messages)
+        if fast_decision is not None and on_decision is not None:
+            on_decision(fast_decision)
+
+        if self.mode == "parallel" and fast_decision is None:
+            # The worker thread runs in a copy of the context so the classification's spans join the turn's trace
+            classification_future = self.executor.submit(contextvars.copy_context().run, call_agent, "classification_agent",
+                                                         self.classification_agent.get_response, messages)
+            if on_decision is not None:
+                classification_future.add_done_callback(lambda future: self.notify_decision(future, on_decision))
+            guard_agent_response = call_agent("guard_agent", self.guard_agent.get_response, messages)
+            if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+                # The classification result is not needed anymore, drop it if it has not started yet
+                classification_future.cancel()
+                return guard_agent_response, None
+            classification_agent_response = classification_future.result()
+            return guard_agent_response, classification_agent_response["memory"]["classification_decision"]
+
+        guard_agent_response = call_agent("guard_agent", self.guard_agent.get_response, messages)
+        if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+            return guard_agent_response, None
+        if fast_decision is not None:
+            return guard_agent_response, fast_decision
+        classification_agent_response = call_agent("classification_agent", self.classification_agent.get_response, messages)
+        return guard_agent_response, classification_agent_response["memory"]["classification_decision"]
+
+    # Async version of route, in parallel mode the classification task is cancelled as soon as the guard rejects
+    async def aroute(self, messages, on_decision=None):
+        if self.mode == "fused":
+            guard_agent_response = await acall_agent("guard_classification_agent", self.guard_classification_agent.aget_response, messages)
+            if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+                return guard_agent_response, None
+            return guard_agent_response, guard_agent_response["memory"]["classification_decision"]
+
+        fast_decision = await self.afast_route(messages)
+        if fast_decision is not None and on_decision is not None:
+            on_decision(fast_decision)
+
+        if self.mode == "parallel" and fast_decision is None:
+            classification_task = asyncio.create_task(acall_agent("classification_agent", self.classification_agent.aget_response, messages))
+            if on_decision is not None:
+                classification_task.add_done_callback(lambda task: self.notify_decision(task, on_decision))
+            try:
+                guard_agent_response = await acall_agent("guard_agent", self.guard_agent.aget_response, messages)
+            except BaseException:
+                classification_task.cancel()
+                raise
+            if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+                classification_task.cancel()
+                return guard_agent_response, None
+            classification_agent_response = await classification_task
+            return guard_agent_response, classification_agent_response["memory"]["classification_decision"]
+
+        guard_agent_response = await acall_agent("guard_agent", self.guard_agent.aget_response, messages)
+        if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+            return guard_agent_response, None
+        if fast_decision is not None:
+            return guard_agent_response, fast_decision
+        classification_agent_response = await acall_agent("classification_agent", self.classification_agent.aget_response, messages)
+        return guard_agent_response, classification_agent_response["memory"]["classification_decision"]
+
+    # The fast-path router's decision, None when there is no router or it is not confident enough
+    def fast_route(self, messages):
+        if self.fast_router is None:
+            return None
+        with tracing.span("fast_router") as span:
+            fast_decision = self.fast_router.route(messages)
+            span.set(decision=fast_decision)
+        return fast_decision
+
+    async def afast_route(self, messages):
+        if self.fast_router is None:
+            return None
+        with tracing.span("fast_router") as span:
+            fast_decision = await self.fast_router.aroute(messages)
+            span.set(decision=fast_decision)
+        return fast_decision
+
+    # Passes the decision of a finished classification (future or task) to on_decision
+    @staticmethod
+    def notify_decision(future, on_decision):
+        if future.cancelled() or future.exception() is not None:
+            return
+        on_decision(future.result()["memory"]["classification_decision"])
+
+    # Hits, misses and size of the verdict memos of the agents the mode uses
+    def get_verdict_memo_stats(self):
+        if self.mode == "fused":
+            return {"guard_classification_agent": self.guard_classification_agent.memo.get_stats()}
+        return {"guard_agent": self.guard_agent.memo.get_stats(),
+                "classification_agent": self.classification_agent.memo.get_stats()}
+
+# Metrics of the speculative mode: prefetches started, used, discarded and failed, the seconds of prefetch work that
+# overlapped the routing (latency saved) and the seconds spent on prefetches that were thrown away (wasted work)
+class SpeculationStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {"started": 0, "used": 0, "discarded": 0, "failed": 0, "saved_seconds": 0.0, "wasted_seconds": 0.0}
+
+    def add(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+# The speculative prefetch of one turn. As soon as the routing decision is known the chosen agent's prefetch
+# (embedding and vector lookup, recommendation classification and lookup) starts next to the guard.
+# finish() hands its result to the agent once the guard allows the message, discard() drops it when the guard rejects.
+class Speculation():
+    def __init__(self, agent_dict, conversation, stats, executor=None):
+        self.agent_dict = agent_dict
+        self.conversation = conversation
+        self.stats = stats
+        self.executor = executor
+        self.lock = threading.Lock()
+        # No prefetch starts once the routing is over, a late decision callback is ignored
+        self.closed = False
+        self.agent_name = None
+        # concurrent.futures.Future in the sync pipeline, asyncio.Task in the async one
+        self.future = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self, agent_name):
+        agent = self.agent_dict.get(agent_name)
+        if hasattr(agent, "prefetch"):
+            self.begin(agent_name, lambda: self.executor.submit(contextvars.copy_context().run, self.run, agent.prefetch))
+
+    # Called from the event loop
+    def astart(self, agent_name):
+        agent = self.agent_dict.get(agent_name)
+        if hasattr(agent, "aprefetch"):
+            self.begin(agent_name, lambda: asyncio.ensure_future(self.arun(agent.aprefetch)))
+
+    def begin(self, agent_name, launch):
+        with self.lock:
+            if self.closed or self.future is not None:
+                return
+            self.agent_name = agent_name
+            self.started_at = time.perf_counter()
+            self.future = launch()
+        self.stats.add(started=1)
+
+    def run(self, prefetch):
+        try:
+            with tracing.span("prefetch", agent=self.agent_name):
+                return prefetch(self.conversation)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    async def arun(self, aprefetch):
+        try:
+            with tracing.span("prefetch", agent=self.agent_name):
+                return await aprefetch(self.conversation)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        return self.future is not None
+
+    # Returns the prefetched result for the chosen agent, None when there is none and the agent has to do the work itself
+    def finish(self, chosen_agent):
+        routed_at = time.perf_counter()
+        if not self.close():
+            return None
+        if chosen_agent != self.agent_name:
+            self.discard()
+            return None
+        try:
+            prefetched = self.future.result()
+        except Exception:
+            self.stats.add(failed=1)
+            return None
+        self.record_used(routed_at)
+        return prefetched
+
+    async def afinish(self, chosen_agent):
+        routed_at = time.perf_counter()
+        if not self.close():
+            return None
+        if chosen_agent != self.agent_name:
+            self.discard()
+            return None
+        try:
+            prefetched = await self.future
+        except Exception:
+            self.stats.add(failed=1)
+            return None
+        self.record_used(routed_at)
+        return prefetched
+
+    # The part of the prefetch that ran before the routing was over is latency taken off the turn
+    def record_used(self, routed_at):
+        self.stats.add(used=1, saved_seconds=max(min(self.finished_at, routed_at) - self.started_at, 0.0))
+
+    # Cancels the prefetch (a running sync prefetch can not be stopped and finishes in the background)
+    def discard(self):
+        if not self.close():
+            return
+        self.stats.add(discarded=1)
+        self.future.cancel()
+        self.future.add_done_callback(self.record_wasted)
+
+    def record_wasted(self, future):
+        # Retrieve the exception so a failed prefetch nobody waits for is not reported as unhandled
+        if not future.cancelled():
+            future.exception()
+        self.stats.add(wasted_seconds=(self.finished_at or self.started_at) - self.started_at)
 
 # Controls the flow of agent interactions and responses
 class AgentController():
-    def __init__(self):
-        self.guard_agent = GuardAgent()
-        self.classification_agent = ClassificationAgent()
-        self.recommendation_agent = RecommendationAgent('recommendation_objects/apriori_recommendations.json',
-                                                        'recommendation_objects/popularity_recommendation.csv'
-                                                        )
-        
-        self.agent_dict: dict[str, AgentProtocol] = {
-            "details_agent": DetailsAgent(),
-            "order_taking_agent": OrderTakingAgent(self.recommendation_agent),
-            "recommendation_agent": self.recommendation_agent
-        }
-    
+    def __init__(self,
+                 apriori_recommendation_path=os.path.join(RECOMMENDATION_DIR, 'apriori_recommendations.json'),
+                 popular_recommendation_path=os.path.join(RECOMMENDATION_DIR, 'popularity_recommendation.csv'),
+                 client_registry=None,
+                 snapshot_path=None,
+                 lazy=None,
+                 session_store=None):
+        self.apriori_recommendation_path = apriori_recommendation_path
+        self.popular_recommendation_path = popular_recommendation_path
+        # Compiled recommendation indexes written by build_recommendation_snapshot.py, loaded instead of the json and csv files
+        self.snapshot_path = snapshot_path or os.getenv("RECOMMENDATION_SNAPSHOT_PATH")
+        self.client_registry = client_registry
+        # Histories of the conversations sent as a session id plus the new message (SESSION_STORE_BACKEND)
+        self.session_store = session_store
+        # Messages of a session handed to the agents, the latest order state is always included
+        self.session_history_window = int(os.getenv("SESSION_HISTORY_WINDOW", "20"))
+        # With SPECULATIVE_PREFETCH the chosen agent's retrieval starts while the guard is still deciding
+        self.speculative = os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true"
+        self.speculation_stats = SpeculationStats()
+        self.speculation_executor = None
+        # TRACING logs every turn's spans as a json line, TRACE_TIMINGS adds them to the response's memory["timings"]
+        self.trace_logs = os.getenv("TRACING", "false").lower() == "true"
+        self.trace_timings = os.getenv("TRACE_TIMINGS", "false").lower() == "true"
+        if self.trace_logs:
+            tracing.configure_logging()
+
+        self.build_lock = threading.Lock()
+        self.agent_dict: dict[str, AgentProtocol | AsyncAgentProtocol | StreamingAgentProtocol] | None = None
+
+        # With LAZY_STARTUP the agents, their clients and the recommendation data are built on the first request
+        # (or by warm_up), so the worker can register with RunPod before paying for the heavy imports
+        if lazy is None:
+            lazy = os.getenv("LAZY_STARTUP", "false").lower() == "true"
+        if not lazy:
+            self.build()
+
+    # Builds the clients and the agents once, safe to call from several threads
+    def build(self):
+        if self.agent_dict is not None:
+            return
+        with self.build_lock:
+            if self.agent_dict is not None:
+                return
+
+            # One registry owns the connection pools to the chat and embedding endpoints and is shared by every agent
+            self.client_registry = self.client_registry or agents.ClientRegistry()
+            self.session_store = self.session_store or agents.get_session_store()
+
+            # The guard/routing mode is picked per deployment through the GUARD_ROUTING_MODE environment variable
+            self.guard_router = GuardRouter(os.getenv("GUARD_ROUTING_MODE", "sequential"), client_registry=self.client_registry,
+                                            fast_router=agents.get_fast_router(self.client_registry))
+            self.recommendation_agent = agents.RecommendationAgent(self.apriori_recommendation_path,
+                                                                   self.popular_recommendation_path,
+                                                                   client_registry=self.client_registry,
+                                                                   snapshot_path=self.snapshot_path
+                                                                   )
+
+            if self.speculative:
+                self.speculation_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATIVE_MAX_WORKERS", "8")))
+
+            self.agent_dict = {
+                "details_agent": agents.DetailsAgent(self.client_registry),
+                "order_taking_agent": agents.OrderTakingAgent(self.recommendation_agent, self.client_registry),
+                "recommendation_agent": self.recommendation_agent
+            }
+
+    # Warm-up hook: builds everything and resolves what the agents would otherwise set up on their first call
+    # (the Pinecone index host lookup). Returns the seconds spent on each step.
+    def warm_up(self):
+        timings = {}
+        start = time.perf_counter()
+        self.build()
+        timings["build"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector_store = self.agent_dict["details_agent"].vector_store
+        if hasattr(vector_store, "get_index"):
+            vector_store.get_index()
+        timings["vector_store"] = time.perf_counter() - start
+        return timings
+
+    # Returns the session id, the messages and the order memory of a job. A job is either the whole conversation
+    # ({"messages": [...]}, the order is then in its messages and the order memory is None) or a session id and the new
+    # message ({"session_id": ..., "message": ...}), the history and the order then come from the session store.
+    # A job with a message and no session id starts a new session.
+    def get_messages(self,job_input):
+        if "message" not in job_input:
+            return None, job_input["messages"], None
+
+        message = job_input["message"]
+        if isinstance(message, str):
+            message = {"role": "user", "content": message}
+        session_id = job_input.get("session_id") or uuid.uuid4().hex
+        with tracing.span("session_load"):
+            messages = self.session_store.load(session_id, self.session_history_window)
+            order_memory = self.session_store.load_order(session_id)
+        return session_id, messages + [message], order_memory
+
+    # Stores the new message and the response of a session turn, the client gets the session id back with the response
+    def save_turn(self,session_id,messages,response):
+        if session_id is None:
+            return response
+        with tracing.span("session_save"):
+            self.session_store.append(session_id, [messages[-1], response])
+        return {**response, "session_id": session_id}
+
+    # The trace of one turn, a no-op span unless TRACING or TRACE_TIMINGS is enabled
+    def start_trace(self):
+        return tracing.start_trace("turn", log=self.trace_logs, timings=self.trace_timings)
+
+    # Saves the turn and, with TRACE_TIMINGS, returns the response with the trace summary in memory["timings"].
+    # The session keeps the response without the timings.
+    def finish_turn(self,trace,session_id,messages,response):
+        response = self.save_turn(session_id, messages, response)
+        if not self.trace_timings:
+            return response
+        return {**response, "memory": {**response.get("memory", {}), "timings": trace.summary()}}
+
+    # The Speculation of a turn in speculative mode, None otherwise
+    def begin_speculation(self,conversation):
+        if not self.speculative:
+            return None
+        return Speculation(self.agent_dict, conversation, self.speculation_stats, self.speculation_executor)
+
+    # Ends the speculation of a turn once it is routed, returns the keyword arguments handing the prefetched result
+    # to the chosen agent (none when nothing was prefetched for it)
+    def end_speculation(self,speculation,chosen_agent):
+        if speculation is None:
+            return {}
+        if chosen_agent is None:
+            speculation.discard()
+            return {}
+        prefetched = speculation.finish(chosen_agent)
+        return {} if prefetched is None else {"prefetched": prefetched}
+
+    async def aend_speculation(self,speculation,chosen_agent):
+        if speculation is None:
+            return {}
+        if chosen_agent is None:
+            speculation.discard()
+            return {}
+        prefetched = await speculation.afinish(chosen_agent)
+        return {} if prefetched is None else {"prefetched": prefetched}
+
+    def get_speculation_stats(self):
+        return self.speculation_stats.get_stats()
+
+    # Completions saved: calls shared by concurrent identical prompts and verdicts answered by the memos
+    def get_coalescing_stats(self):
+        self.build()
+        return {"single_flight": agents.get_single_flight_stats(), "verdict_memo": self.guard_router.get_verdict_memo_stats()}
+
+    # Queue depth, wait times and rejections of the admission control per endpoint
+    def get_admission_stats(self):
+        return admission.get_admission_stats()
+
+    # Load, moving average latency, failures, ejections and hedges of every endpoint behind a comma separated url
+    def get_endpoint_stats(self):
+        self.build()
+        return self.client_registry.get_endpoint_stats()
+
+    # Conversations with an order in progress (the last order taking answer has items) are served first
+    def get_turn_priority(self,conversation):
+        if conversation.order_memory is not None:
+            return admission.ORDER_PRIORITY if conversation.order_memory.get("order") else admission.DEFAULT_PRIORITY
+        for message in reversed(conversation):
+            memory = message.get("memory", {})
+            if message["role"] == "assistant" and memory.get("agent", "") == "order_taking_agent":
+                return admission.ORDER_PRIORITY if memory.get("order") else admission.DEFAULT_PRIORITY
+        return admission.DEFAULT_PRIORITY
+
+    def get_degraded_response(self,error):
+        tracing.current().set(degraded=error.reason)
+        return {"role": "assistant", "content": DEGRADED_MESSAGE, "memory": {"agent": "degraded", "reason": error.reason}}
+
+    # The degraded answer of a streamed turn. When part of the agent's answer was sent already a {"reset": True} item
+    # comes first, so the client drops the partial answer instead of showing the degraded one spliced onto it; the
+    # session only keeps the degraded answer.
+    def get_degraded_stream(self,trace,session_id,messages,error,streamed):
+        response = self.get_degraded_response(error)
+        if streamed:
+            yield {"reset": True}
+        yield {"delta": response["content"]}
+        yield self.finish_turn(trace, session_id, messages, response)
+
     def get_response(self,input):
-        # Extract User Input
-        job_input = input["input"]
-        messages = job_input["messages"]
+        self.build()
 
-        # Get GuardAgent's response
-        guard_agent_response = self.guard_agent.get_response(messages)
-        if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+        with self.start_trace() as trace:
+            # Extract User Input
+            job_input = input["input"]
+            session_id, messages, order_memory = self.get_messages(job_input)
+            # Every agent reads the same read-only view of the messages instead of deep copying them
+            conversation = Conversation(messages, order_memory=order_memory)
+
+            # Turns mid-order are admitted first when the endpoints are saturated, a turn that is not admitted in time
+            # gets the degraded response
+            with admission.priority(self.get_turn_priority(conversation)):
+                try:
+                    response = self.run_turn(conversation)
+                except AdmissionError as error:
+                    response = self.get_degraded_response(error)
+
+            return self.finish_turn(trace, session_id, messages, response)
+
+    # The guard's response when it rejects the message, the chosen agent's response otherwise
+    def run_turn(self,conversation):
+        # Get the guard decision and the chosen agent, in speculative mode the chosen agent's prefetch runs next to the guard
+        speculation = self.begin_speculation(conversation)
+        guard_agent_response, chosen_agent = self.guard_router.route(conversation, speculation and speculation.start)
+        prefetch_kwargs = self.end_speculation(speculation, chosen_agent)
+        if chosen_agent is None:
             return guard_agent_response
-        
-        # Get ClassificationAgent's response
-        classification_agent_response = self.classification_agent.get_response(messages)
-        chosen_agent=classification_agent_response["memory"]["classification_decision"]
 
         # Get the chosen agent's response
         agent = self.agent_dict[chosen_agent]
-        response = agent.get_response(messages)
+        return call_agent(chosen_agent, agent.get_response, conversation, **prefetch_kwargs)
+
+    # Async version of get_response, used as the RunPod handler so one worker can serve many conversations at once
+    async def aget_response(self,input):
+        # The first request of a lazy worker builds the agents in a thread instead of blocking the event loop
+        if self.agent_dict is None:
+            await asyncio.to_thread(self.build)
+
+        with self.start_trace() as trace:
+            job_input = input["input"]
+            session_id, messages, order_memory = self.get_messages(job_input)
+            # Every agent reads the same read-only view of the messages instead of deep copying them
+            conversation = Conversation(messages, order_memory=order_memory)
+
+            with admission.priority(self.get_turn_priority(conversation)):
+                try:
+                    response = await self.arun_turn(conversation)
+                except AdmissionError as error:
+                    response = self.get_degraded_response(error)
+
+            return self.finish_turn(trace, session_id, messages, response)
+
+    async def arun_turn(self,conversation):
+        speculation = self.begin_speculation(conversation)
+        guard_agent_response, chosen_agent = await self.guard_router.aroute(conversation, speculation and speculation.astart)
+        prefetch_kwargs = await self.aend_speculation(speculation, chosen_agent)
+        if chosen_agent is None:
+            return guard_agent_response
+
+        agent = self.agent_dict[chosen_agent]
+        return await acall_agent(chosen_agent, agent.aget_response, conversation, **prefetch_kwargs)
+
+    # Generator version of get_response for the streaming RunPod handler. The guard and routing decisions are fetched
+    # whole, then the chosen agent's answer is yielded as {"delta": text} pieces while it is generated and the last item
+    # is the usual message dict with its memory, so clients append that one to the conversation. A {"reset": True} item
+    # tells the client to drop the pieces received so far (see get_degraded_stream).
+    def get_response_stream(self,input):
+        self.build()
+
+        with self.start_trace() as trace:
+            job_input = input["input"]
+            session_id, messages, order_memory = self.get_messages(job_input)
+            # Every agent reads the same read-only view of the messages instead of deep copying them
+            conversation = Conversation(messages, order_memory=order_memory)
+
+            # Whether part of the agent's answer was sent already
+            streamed = False
+            try:
+                with admission.priority(self.get_turn_priority(conversation)):
+                    speculation = self.begin_speculation(conversation)
+                    guard_agent_response, chosen_agent = self.guard_router.route(conversation, speculation and speculation.start)
+                    prefetch_kwargs = self.end_speculation(speculation, chosen_agent)
+                    if chosen_agent is None:
+                        yield {"delta": guard_agent_response["content"]}
+                        yield self.finish_turn(trace, session_id, messages, guard_agent_response)
+                        return
+
+                    agent = self.agent_dict[chosen_agent]
+                    # The agent's span is timed but not made current, the generator yields to the caller while it is open
+                    span = tracing.span(chosen_agent).begin()
+                    for chunk in agent.get_response_stream(conversation, **prefetch_kwargs):
+                        if "delta" in chunk:
+                            streamed = True
+                            yield chunk
+                        else:
+                            span.finish()
+                            yield self.finish_turn(trace, session_id, messages, chunk)
+            except AdmissionError as error:
+                yield from self.get_degraded_stream(trace, session_id, messages, error, streamed)
+
+    async def aget_response_stream(self,input):
+        if self.agent_dict is None:
+            await asyncio.to_thread(self.build)
+
+        with self.start_trace() as trace:
+            job_input = input["input"]
+            session_id, messages, order_memory = self.get_messages(job_input)
+            # Every agent reads the same read-only view of the messages instead of deep copying them
+            conversation = Conversation(messages, order_memory=order_memory)
+
+            # Whether part of the agent's answer was sent already
+            streamed = False
+            try:
+                with admission.priority(self.get_turn_priority(conversation)):
+                    speculation = self.begin_speculation(conversation)
+                    guard_agent_response, chosen_agent = await self.guard_router.aroute(conversation, speculation and speculation.astart)
+                    prefetch_kwargs = await self.aend_speculation(speculation, chosen_agent)
+                    if chosen_agent is None:
+                        yield {"delta": guard_agent_response["content"]}
+                        yield self.finish_turn(trace, session_id, messages, guard_agent_response)
+                        return
 
-        return response
\ No newline at end of file
+                    agent = self.agent_dict[chosen_agent]
+                    span = tracing.span(chosen_agent).begin()
+                    async for chunk in agent.aget_response_stream(conversation, **prefetch_kwargs):
+                        if "delta" in chunk:
+                            streamed = True
+                            yield chunk
+                        else:
+                            span.finish()
+                            yield self.finish_turn(trace, session_id, messages, chunk)
+            except AdmissionError as error:
+                for chunk in self.get_degraded_stream(trace, session_id, messages, error, streamed):
+                    yield chunk
@@ -1,7 +1,58 @@
 #To expose all the modules in the agents package
-from .guard_agent import GuardAgent
-from .classification_agent import ClassificationAgent
-from .details_agent import DetailsAgent
-from .order_taking_agent import OrderTakingAgent
-from .recommendation_agent import RecommendationAgent
-from .agent_protocol import AgentProtocol
\ No newline at end of file
+#The modules are imported on first access (PEP 562), so `import agents` does not pull in openai, httpx and numpy
+#until an agent or a helper is actually used. `from agents import GuardAgent` works like before.
+import importlib
+
+_exports = {
+    "GuardAgent": ".guard_agent",
+    "ClassificationAgent": ".classification_agent",
+    "GuardClassificationAgent": ".guard_classification_agent",
+    "DecisionAgent": ".decision_agent",
+    "DetailsAgent": ".details_agent",
+    "OrderTakingAgent": ".order_taking_agent",
+    "RecommendationAgent": ".recommendation_agent",
+    "AgentProtocol": ".agent_protocol",
+    "AsyncAgentProtocol": ".agent_protocol",
+    "ClientRegistry": ".client_registry",
+    "get_default_registry": ".client_registry",
+    "parse_json_output": ".json_repair",
+    "get_json_repair_stats": ".json_repair",
+    "ResponseCache": ".response_cache",
+    "EmbeddingCache": ".embedding_cache",
+    "EmbeddingService": ".embedding_cache",
+    "PineconeVectorStore": ".vector_store",
+    "LocalVectorStore": ".vector_store",
+    "get_vector_store": ".vector_store",
+    "AprioriIndex": ".recommendation_store",
+    "PopularityIndex": ".recommendation_store",
+    "Menu": ".order_state",
+    "OrderState": ".order_state",
+    "InMemorySessionStore": ".session_store",
+    "SQLiteSessionStore": ".session_store",
+    "get_session_store": ".session_store",
+    "Conversation": ".conversation",
+    "RuleBasedRouter": ".fast_router",
+    "EmbeddingCentroidRouter": ".fast_router",
+    "get_fast_router": ".fast_router",
+    "PromptTemplate": ".prompt_templates",
+    "get_prompt_stats": ".prompt_templates",
+    "SingleFlight": ".single_flight",
+    "get_single_flight_stats": ".single_flight",
+    "VerdictMemo": ".verdict_memo",
+    "AdmissionScheduler": ".admission",
+    "AdmissionError": ".admission",
+    "get_admission_stats": ".admission",
+    "BalancedClient": ".load_balancer",
+}
+
+__all__ = list(_exports)
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,252 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from . import tracing
+
+#Admission control between the agents and the chat and embedding endpoints.
+#Every endpoint (base url) gets at most max_concurrency requests in flight from this worker, the requests over the cap
+#wait in a bounded queue ordered by priority and then arrival. A request that finds the queue full, or waits longer than
+#queue_timeout, fails with an AdmissionError instead of piling up on the model server, and the controller answers the
+#turn with a degraded response. When the queue is full a request of a better priority takes the place of the last
+#waiting one of a worse priority, so turns already mid-order keep going while new sessions back off.
+#The priority of a turn is held in a context variable, it follows the turn into its threads and tasks.
+#Configured with LLM_MAX_CONCURRENCY (0 is no cap), LLM_ENDPOINT_CONCURRENCY (url=cap,... for single endpoints),
+#LLM_MAX_QUEUE and LLM_QUEUE_TIMEOUT.
+
+#Lower is served first
+ORDER_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+
+turn_priority = contextvars.ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+#Wait times kept per endpoint for the percentiles of get_stats()
+WAIT_SAMPLES = 1000
+
+class AdmissionError(Exception):
+    #reason is "queue_full", "queue_timeout" or "shed" (dropped from a full queue for a request of a better priority)
+    def __init__(self, endpoint, reason):
+        super().__init__(f"Request to {endpoint} not admitted: {reason}")
+        self.endpoint = endpoint
+        self.reason = reason
+
+#The priority of the LLM requests made inside the block
+@contextmanager
+def priority(level):
+    token = turn_priority.set(level)
+    try:
+        yield
+    finally:
+        turn_priority.reset(token)
+
+#A request waiting for a slot, woken by a thread (threading.Event) or on its event loop (asyncio.Future)
+class Waiter():
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        #Set under the limiter's lock: the slot was handed over, or the request was dropped from the queue
+        self.granted = False
+        self.shed = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.resolve)
+
+    def resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class EndpointLimiter():
+    def __init__(self, endpoint, max_concurrency, max_queue, queue_timeout):
+        self.endpoint = endpoint
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.lock = threading.Lock()
+        self.active = 0
+        #Heap of (priority, arrival, waiter)
+        self.queue = []
+        self.arrivals = itertools.count()
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "shed": 0, "timed_out": 0, "max_queue_depth": 0,
+                      "max_wait_ms": 0.0}
+
+    #Takes a slot and returns None, or returns the Waiter of the request in the queue
+    def enqueue(self, priority, loop=None):
+        with self.lock:
+            if self.active < self.max_concurrency and not self.queue:
+                self.active += 1
+                self.stats["admitted"] += 1
+                self.waits.append(0.0)
+                return None
+            if len(self.queue) >= self.max_queue:
+                #The last waiting request of the worst priority, dropped if it is worse than this one.
+                #With no queue at all (LLM_MAX_QUEUE=0) there is nobody to drop.
+                worst = max(self.queue) if self.queue else None
+                if worst is None or worst[0] <= priority:
+                    self.stats["rejected"] += 1
+                    raise AdmissionError(self.endpoint, "queue_full")
+                self.queue.remove(worst)
+                heapq.heapify(self.queue)
+                worst[2].shed = True
+                worst[2].wake()
+                self.stats["shed"] += 1
+            waiter = Waiter(loop)
+            heapq.heappush(self.queue, (priority, next(self.arrivals), waiter))
+            self.stats["queued"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self.queue))
+            return waiter
+
+    #Called with the lock held: hands the slot to the first waiting request, or frees it
+    def hand_over(self):
+        if self.queue:
+            _, _, waiter = heapq.heappop(self.queue)
+            waiter.granted = True
+            waiter.wake()
+        else:
+            self.active -= 1
+
+    def release(self):
+        with self.lock:
+            self.hand_over()
+
+    #Called once the wait is over (woken or timed out), raises unless the request got its slot
+    def finish_wait(self, waiter, start):
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            if waiter.granted:
+                self.stats["admitted"] += 1
+                self.waits.append(wait_ms)
+                self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+                return
+            if waiter.shed:
+                raise AdmissionError(self.endpoint, "shed")
+            self.remove(waiter)
+            self.stats["timed_out"] += 1
+        raise AdmissionError(self.endpoint, "queue_timeout")
+
+    #Called with the lock held
+    def remove(self, waiter):
+        self.queue = [entry for entry in self.queue if entry[2] is not waiter]
+        heapq.heapify(self.queue)
+
+    def acquire(self, priority):
+        waiter = self.enqueue(priority)
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        with tracing.span("llm_queue", endpoint=self.endpoint, priority=priority):
+            waiter.event.wait(self.queue_timeout)
+            self.finish_wait(waiter, start)
+
+    async def aacquire(self, priority):
+        waiter = self.enqueue(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        with tracing.span("llm_queue", endpoint=self.endpoint, priority=priority):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                #The slot may have been handed over in the meantime, it goes to the next request then
+                with self.lock:
+                    if waiter.granted:
+                        self.hand_over()
+                    elif not waiter.shed:
+                        self.remove(waiter)
+                raise
+            self.finish_wait(waiter, start)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["max_concurrency"] = self.max_concurrency
+            stats["in_flight"] = self.active
+            stats["queue_depth"] = len(self.queue)
+            waits = sorted(self.waits)
+        stats["wait_ms_p50"] = waits[len(waits) // 2] if waits else 0.0
+        stats["wait_ms_p95"] = waits[min(int(round(0.95 * (len(waits) - 1))), len(waits) - 1)] if waits else 0.0
+        return stats
+
+class AdmissionScheduler():
+    def __init__(self, max_concurrency=0, max_queue=100, queue_timeout=5.0, endpoint_concurrency=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        #base url -> cap, in place of max_concurrency
+        self.endpoint_concurrency = endpoint_concurrency or {}
+        self.lock = threading.Lock()
+        self.limiters = {}
+
+    @classmethod
+    def from_env(cls):
+        endpoint_concurrency = {}
+        for entry in os.getenv("LLM_ENDPOINT_CONCURRENCY", "").split(","):
+            if "=" in entry:
+                url, cap = entry.rsplit("=", 1)
+                endpoint_concurrency[url.strip().rstrip("/")] = int(cap)
+        return cls(max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "0")),
+                   max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+                   queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "5")),
+                   endpoint_concurrency=endpoint_concurrency)
+
+    #The limiter of an endpoint, None when it has no cap
+    def get_limiter(self, client):
+        endpoint = str(client.base_url).rstrip("/")
+        limiter = self.limiters.get(endpoint)
+        if limiter is not None:
+            return limiter
+        max_concurrency = self.endpoint_concurrency.get(endpoint, self.max_concurrency)
+        if max_concurrency <= 0:
+            return None
+        with self.lock:
+            return self.limiters.setdefault(endpoint, EndpointLimiter(endpoint, max_concurrency, self.max_queue,
+                                                                      self.queue_timeout))
+
+    #Holds a slot of the client's endpoint for the block
+    @contextmanager
+    def admit(self, client):
+        limiter = self.get_limiter(client)
+        if limiter is None:
+            yield
+            return
+        limiter.acquire(turn_priority.get())
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    @asynccontextmanager
+    async def aadmit(self, client):
+        limiter = self.get_limiter(client)
+        if limiter is None:
+            yield
+            return
+        await limiter.aacquire(turn_priority.get())
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    #Queue depth, in flight requests, wait times and rejections per endpoint
+    def get_stats(self):
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return {limiter.endpoint: limiter.get_stats() for limiter in limiters}
+
+#The process wide scheduler the helpers of utils go through
+scheduler = AdmissionScheduler.from_env()
+
+def get_admission_stats():
+    return scheduler.get_stats()
@@ -1,7 +1,30 @@
 #To define the protocol standards for agents response handling both the input and output formats
 
-from typing import Protocol, List, Dict, Any
+from typing import Protocol, List, Dict, Any, Iterator, AsyncIterator
 
 class AgentProtocol(Protocol):
     def get_response(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        ...
\ No newline at end of file
+        ...
+
+#Same standard for the async pipeline, the agents await their completions instead of blocking the worker
+class AsyncAgentProtocol(Protocol):
+    async def aget_response(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ...
+
+#Agents whose final completion can be streamed: they yield {"delta": text} pieces as they are generated
+#and then the same message dict get_response returns, memory included
+class StreamingAgentProtocol(Protocol):
+    def get_response_stream(self, messages: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        ...
+
+    def aget_response_stream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+#Agents that can fetch what their answer needs (retrieval, lookups) ahead of time.
+#get_response(messages, prefetched=...) then skips that work, the AgentController's speculative mode uses it.
+class PrefetchingAgentProtocol(Protocol):
+    def prefetch(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ...
+
+    async def aprefetch(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ...
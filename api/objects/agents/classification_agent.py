@@ -1,22 +1,22 @@
-from dotenv import load_dotenv
-import os
-import json
-from copy import deepcopy
-from .utils import get_chatbot_response
-from openai import OpenAI
-load_dotenv()
+from .decision_agent import DecisionAgent
+from .json_repair import parse_json_output
 
-class ClassificationAgent():
-    def __init__(self):
-        #Initialize the OpenAI client with the RunPod API key and the deployed chatbot URL
-        #Initialize the model name being used
-        self.client = OpenAI(
-            api_key=os.getenv("RUNPOD_TOKEN"),
-            base_url=os.getenv("RUNPOD_CHATBOT_URL"),
-        )
-        self.model_name = os.getenv("MODEL_NAME")
+#The agents a message can be routed to, the keys of the controller's agent_dict
+ROUTED_AGENTS = ("details_agent", "order_taking_agent", "recommendation_agent")
+#Takes the messages whose routing decision is missing, empty or names no agent, it answers anything about the shop
+FALLBACK_AGENT = "details_agent"
 
-        #To get the system prompt for the classification agent allowing it to classify the user input into one of the three agents
+#The routed agent named by the decision in the model's output
+def get_routed_agent(decision):
+    decision = str(decision or "").strip().lower()
+    return decision if decision in ROUTED_AGENTS else FALLBACK_AGENT
+
+class ClassificationAgent(DecisionAgent):
+    prompt_name = "classification"
+    profile_prefix = "CLASSIFICATION"
+    compact_max_tokens = 32
+
+    #To get the system prompt for the classification agent allowing it to classify the user input into one of the three agents
     def get_system_prompt(self):
         return """ 
         You are a helpful AI assistant for a coffee shop application.
@@ -42,6 +42,17 @@ class ClassificationAgent():
         - If the request contains multiple possible categories, choose the one that best represents the **main intent** of the message.  
         - Do not mix agents or create new ones.  
 
+        """ + self.get_output_format()
+
+    #The compact format asks for the decision only, the chain of thought is not generated at all
+    def get_output_format(self):
+        if self.profile.compact:
+            return """
+        OUTPUT FORMAT:
+        Return only a JSON object with the decision, nothing before or after it:
+        {"decision": "details_agent" or "order_taking_agent" or "recommendation_agent"}
+        """
+        return """
         OUTPUT FORMAT:  
         Return a JSON object with this exact structure:  
         {
@@ -51,33 +62,15 @@ class ClassificationAgent():
         } """
 
         
-    def get_response(self,messages):
-        # Deep copy the messages to avoid modifying the original list
-        messages = deepcopy(messages)
-        
-        #Get the designed system prompt to fetch accurate responses from the llm
-        system_prompt = self.get_system_prompt()
-
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
-
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
-        output = self.postprocess(chatbot_output)
-        
-        return output
-
 #To postprocess the ouput from the llm to have the role, content and memory attributes.
     def postprocess(self,output):
-        output = json.loads(output)
+        output = parse_json_output(output)
 
         dict_output = {
             "role": "assistant",
-            "content": output['message'],
+            "content": output.get('message', ''),
             "memory": {"agent":"classification_agent",
-                       "classification_decision": output['decision']
+                       "classification_decision": get_routed_agent(output.get('decision'))
                       }
         }
         return dict_output
-
-
-
-    
\ No newline at end of file
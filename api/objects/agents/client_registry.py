@@ -0,0 +1,260 @@
+from dotenv import load_dotenv
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from .embedding_cache import EmbeddingService, get_embedding_cache
+from .load_balancer import BalancedClient, EndpointState
+from . import tracing
+load_dotenv()
+
+#Counters shared by the sync and the async transports of one base url
+class PoolStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_opened = 0
+        self.seen_connections = weakref.WeakSet()
+
+    def request_started(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, pool, failed):
+        with self.lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+            #Every connection object the pool has not handed out before is a new TCP (and TLS) handshake
+            for connection in getattr(pool, "connections", []):
+                if connection not in self.seen_connections:
+                    self.seen_connections.add(connection)
+                    self.connections_opened += 1
+
+    def as_dict(self, pools):
+        connections = [connection for pool in pools for connection in getattr(pool, "connections", [])]
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "connections_opened": self.connections_opened,
+                "open_connections": len(connections),
+                "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            }
+
+#httpx transports that keep the pool counters up to date around every request
+class PooledTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.request_started()
+        #Every attempt of the client's retry loop goes through here, more than one request in a span means retries
+        tracing.current().add("http_requests")
+        failed = True
+        try:
+            response = super().handle_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.request_finished(self._pool, failed)
+
+class AsyncPooledTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        self.stats.request_started()
+        tracing.current().add("http_requests")
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.request_finished(self._pool, failed)
+
+#Owns one keep-alive connection pool per base url (chat and embedding endpoints) and hands the same
+#OpenAI clients to every agent, instead of every agent building its own client from the environment.
+#Pool size, timeouts and retries can be tuned through the constructor or the LLM_* environment variables.
+#A base url can be a comma separated list of equivalent endpoints, its client is then a BalancedClient over the
+#clients of every endpoint (LLM_LOAD_BALANCER, LLM_HEDGE_DELAY_MS, LLM_EJECT_FAILURES, LLM_EJECT_SECONDS).
+class ClientRegistry():
+    def __init__(self,
+                 api_key=None,
+                 chatbot_url=None,
+                 embedding_url=None,
+                 model_name=None,
+                 max_connections=None,
+                 max_keepalive_connections=None,
+                 keepalive_expiry=None,
+                 timeout=None,
+                 connect_timeout=None,
+                 max_retries=None,
+                 connect_retries=None,
+                 load_balancer=None,
+                 hedge_delay=None,
+                 eject_failures=None,
+                 eject_seconds=None):
+        self.api_key = api_key or os.getenv("RUNPOD_TOKEN")
+        self.chatbot_url = chatbot_url or os.getenv("RUNPOD_CHATBOT_URL")
+        self.embedding_url = embedding_url or os.getenv("RUNPOD_EMBEDDING_URL")
+        self.model_name = model_name or os.getenv("MODEL_NAME")
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=keepalive_expiry or float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+        )
+        self.timeout = httpx.Timeout(
+            timeout or float(os.getenv("LLM_TIMEOUT", "60")),
+            connect=connect_timeout or float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+        )
+        #max_retries is the OpenAI client's retry with exponential backoff on 429/5xx and timeouts,
+        #connect_retries are retried connection attempts at the transport level
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.connect_retries = connect_retries if connect_retries is not None else int(os.getenv("LLM_CONNECT_RETRIES", "1"))
+
+        #Balancing over several endpoints of one base url, hedge_delay is in seconds and 0 turns hedging off
+        self.load_balancer = load_balancer or os.getenv("LLM_LOAD_BALANCER", "least_outstanding")
+        self.hedge_delay = hedge_delay if hedge_delay is not None else float(os.getenv("LLM_HEDGE_DELAY_MS", "0")) / 1000
+        self.eject_failures = eject_failures or int(os.getenv("LLM_EJECT_FAILURES", "3"))
+        self.eject_seconds = eject_seconds if eject_seconds is not None else float(os.getenv("LLM_EJECT_SECONDS", "30"))
+
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.stats = {}
+        self.transports = {}
+        self.embedding_service = None
+        #url -> EndpointState, the load and health of every endpoint of the balanced clients
+        self.endpoint_states = {}
+        #Runs the hedged requests of the sync balanced clients
+        self.hedge_executor = None
+
+    #Returns the client for a base url, building it (and its connection pool) the first time it is asked for
+    def get_client(self, base_url, is_async=False):
+        key = (base_url, is_async)
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        if "," in base_url:
+            return self.get_balanced_client(base_url, is_async)
+
+        with self.lock:
+            if key in self.clients:
+                return self.clients[key]
+
+            stats = self.stats.setdefault(base_url, PoolStats())
+            if is_async:
+                transport = AsyncPooledTransport(stats, limits=self.limits, retries=self.connect_retries)
+                http_client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+                client = AsyncOpenAI(api_key=self.api_key, base_url=base_url, http_client=http_client,
+                                     max_retries=self.max_retries, timeout=self.timeout)
+            else:
+                transport = PooledTransport(stats, limits=self.limits, retries=self.connect_retries)
+                http_client = httpx.Client(transport=transport, timeout=self.timeout)
+                client = OpenAI(api_key=self.api_key, base_url=base_url, http_client=http_client,
+                                max_retries=self.max_retries, timeout=self.timeout)
+            self.transports.setdefault(base_url, []).append(transport)
+            self.clients[key] = client
+            return client
+
+    #A BalancedClient over the clients of every endpoint of a comma separated base url
+    def get_balanced_client(self, base_url, is_async=False):
+        urls = [url.strip() for url in base_url.split(",") if url.strip()]
+        if len(urls) == 1:
+            return self.get_client(urls[0], is_async)
+        clients = [self.get_client(url, is_async) for url in urls]
+
+        with self.lock:
+            key = (base_url, is_async)
+            if key in self.clients:
+                return self.clients[key]
+            states = [self.endpoint_states.setdefault(url, EndpointState(url)) for url in urls]
+            executor = None
+            if self.hedge_delay > 0 and not is_async:
+                if self.hedge_executor is None:
+                    self.hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")))
+                executor = self.hedge_executor
+            client = BalancedClient(base_url, states, clients, balancer=self.load_balancer,
+                                    hedge_delay=self.hedge_delay if self.hedge_delay > 0 else None,
+                                    eject_failures=self.eject_failures, eject_seconds=self.eject_seconds,
+                                    executor=executor)
+            self.clients[key] = client
+            return client
+
+    def get_chat_client(self):
+        return self.get_client(self.chatbot_url)
+
+    def get_embedding_client(self):
+        return self.get_client(self.embedding_url)
+
+    def get_async_chat_client(self):
+        return self.get_client(self.chatbot_url, is_async=True)
+
+    def get_async_embedding_client(self):
+        return self.get_client(self.embedding_url, is_async=True)
+
+    #The cached and batched front end to the embedding endpoint, configured by the EMBEDDING_* environment variables
+    def get_embedding_service(self):
+        if self.embedding_service is None:
+            embedding_client = self.get_embedding_client()
+            async_embedding_client = self.get_async_embedding_client()
+            with self.lock:
+                if self.embedding_service is None:
+                    self.embedding_service = EmbeddingService(
+                        embedding_client,
+                        async_embedding_client,
+                        self.model_name,
+                        cache=get_embedding_cache(),
+                        max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+                        max_wait=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")) / 1000,
+                    )
+        return self.embedding_service
+
+    #Pool usage per base url: requests sent, requests in flight, connections opened, open and idle connections
+    def get_pool_stats(self):
+        pool_stats = {}
+        for base_url, stats in self.stats.items():
+            pools = [transport._pool for transport in self.transports.get(base_url, [])]
+            pool_stats[base_url] = stats.as_dict(pools)
+        return pool_stats
+
+    #Requests in flight, moving average latency, failures, ejections and hedges per balanced endpoint
+    def get_endpoint_stats(self):
+        with self.lock:
+            states = list(self.endpoint_states.values())
+        return {state.url: state.get_stats() for state in states}
+
+    def close(self):
+        for (_, is_async), client in self.clients.items():
+            if not is_async:
+                client.close()
+        self.clients = {}
+        self.transports = {}
+        if self.hedge_executor is not None:
+            self.hedge_executor.shutdown(wait=False)
+            self.hedge_executor = None
+
+default_registry = None
+default_registry_lock = threading.Lock()
+
+#The registry used by agents that are built without one, so they still share connection pools
+def get_default_registry():
+    global default_registry
+    if default_registry is None:
+        with default_registry_lock:
+            if default_registry is None:
+                default_registry = ClientRegistry()
+    return default_registry
@@ -0,0 +1,59 @@
+from collections.abc import Sequence
+from types import MappingProxyType
+
+#A read-only view of the conversation the agents get instead of copying it.
+#It wraps the message list without copying it: slicing returns another view in O(1), messages are handed out as
+#read-only mappings, and with_last_content() replaces the last message in a new view (copy-on-write) instead of
+#rewriting it in place. The wrapped list must not be modified while views of it are in use.
+#order_memory is the session's order as the session store keeps it, None when the conversation came whole from the
+#client and the order is in its messages. It belongs to the conversation, every view of it carries it.
+class Conversation(Sequence):
+    __slots__ = ("messages", "start", "stop", "overrides", "order_memory")
+
+    def __init__(self, messages, start=0, stop=None, overrides=None, order_memory=None):
+        self.messages = messages
+        self.start = start
+        self.stop = len(messages) if stop is None else stop
+        #position in messages -> message replacing the original in this view
+        self.overrides = overrides or {}
+        self.order_memory = order_memory
+
+    #Wraps a message list, a conversation is returned as is
+    @classmethod
+    def of(cls, messages):
+        return messages if isinstance(messages, Conversation) else cls(messages)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("Conversation slices do not support a step")
+            stop = max(start, stop)
+            overrides = {position: message for position, message in self.overrides.items()
+                         if self.start + start <= position < self.start + stop}
+            return Conversation(self.messages, self.start + start, self.start + stop, overrides, self.order_memory)
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Conversation index out of range")
+        position = self.start + index
+        return MappingProxyType(self.overrides.get(position, self.messages[position]))
+
+    #A view whose last message has the given content, the message itself is shallow copied, nothing else is
+    def with_last_content(self, content):
+        position = self.stop - 1
+        last_message = self.overrides.get(position, self.messages[position])
+        overrides = dict(self.overrides)
+        overrides[position] = {**last_message, "content": content}
+        return Conversation(self.messages, self.start, self.stop, overrides, self.order_memory)
+
+    #The messages of the view as a list, ready to be put behind a system prompt
+    def to_messages(self):
+        return list(self)
+
+    def __repr__(self):
+        return f"Conversation({self.to_messages()!r})"
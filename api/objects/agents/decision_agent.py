@@ -0,0 +1,78 @@
+from abc import ABC, abstractmethod
+from .conversation import Conversation
+from .utils import get_chatbot_response, async_get_chatbot_response
+from .client_registry import get_default_registry
+from .prompt_templates import PromptTemplate
+from .generation_profile import GenerationProfile
+from .verdict_memo import VerdictMemo
+
+#Base of the agents that return a short decision about the last messages instead of an answer: the guard agent, the
+#classification agent and the fused guard and classification agent. A subclass names its prompt and environment
+#variables and supplies the system prompt, the output format and the parsing of the output (postprocess).
+class DecisionAgent(ABC):
+    #Name of the compiled system prompt in the prompt stats
+    prompt_name = None
+    #Prefix of the <PREFIX>_* variables the generation profile is read from
+    profile_prefix = None
+    #max_tokens of the compact output, which only holds the decision
+    compact_max_tokens = 32
+
+    def __init__(self, client_registry=None, profile=None, memo=None):
+        #Get the shared OpenAI client for the deployed chatbot URL from the client registry
+        client_registry = client_registry or get_default_registry()
+        #Model, endpoint, max_tokens, temperature and compact output from the <PREFIX>_* variables
+        self.profile = profile or GenerationProfile.from_env(self.profile_prefix, client_registry,
+                                                             compact_max_tokens=self.compact_max_tokens)
+        #Async client for the async pipeline (aget_response)
+        self.client, self.async_client = self.profile.get_clients(client_registry)
+        self.model_name = self.profile.model_name
+        #The system prompt is compiled once and sent as the same prefix on every call
+        self.prompt = PromptTemplate(self.prompt_name, self.get_system_prompt())
+        #Verdicts of the last message windows already seen (VERDICT_MEMO_SIZE, VERDICT_MEMO_TTL)
+        self.memo = memo or VerdictMemo.from_env()
+
+    #The system prompt, ending with get_output_format()
+    @abstractmethod
+    def get_system_prompt(self):
+        pass
+
+    #The compact format asks for the decision only, the chain of thought is not generated at all
+    @abstractmethod
+    def get_output_format(self):
+        pass
+
+    #The message dict with the decision in its memory, from the raw completion
+    @abstractmethod
+    def postprocess(self,output):
+        pass
+
+    def get_input_messages(self,messages):
+        # A read-only view of the conversation, only the last messages are sent so nothing is copied
+        messages = Conversation.of(messages)
+
+        return self.prompt.get_messages(messages[-3:].to_messages())
+
+    def get_response(self,messages):
+        input_messages = self.get_input_messages(messages)
+        #The same window of messages gets the same verdict, a memoized one skips the completion
+        memo_key, output = self.memo.lookup(input_messages[1:])
+        if output is not None:
+            return output
+
+        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        output = self.postprocess(chatbot_output)
+        self.memo.store(memo_key, output)
+
+        return output
+
+    async def aget_response(self,messages):
+        input_messages = self.get_input_messages(messages)
+        memo_key, output = self.memo.lookup(input_messages[1:])
+        if output is not None:
+            return output
+
+        chatbot_output =await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        output = self.postprocess(chatbot_output)
+        self.memo.store(memo_key, output)
+
+        return output
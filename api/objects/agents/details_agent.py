@@ -1,32 +1,37 @@
-from dotenv import load_dotenv
-import os
-import json
-from copy import deepcopy
-from .utils import get_chatbot_response,get_embedding
-from openai import OpenAI
-from pinecone import Pinecone
-load_dotenv()
+from .conversation import Conversation
+from .utils import get_chatbot_response,async_get_chatbot_response,get_chatbot_response_stream,async_get_chatbot_response_stream
+from .client_registry import get_default_registry
+from .generation_profile import GenerationProfile
+from .response_cache import get_details_response_cache
+from .vector_store import get_vector_store
+from .prompt_templates import PromptTemplate
+from . import tracing
 
 
 class DetailsAgent():
-    def __init__(self):
-        # Initialize the OpenAI client with the RunPod API key and the deployed chatbot URL
-        self.client = OpenAI(
-            api_key=os.getenv("RUNPOD_TOKEN"),
-            base_url=os.getenv("RUNPOD_CHATBOT_URL"),
-        )
-        #Initialize the embedding client with the RunPod API key and the deployed embedding URL
-        self.embedding_client = OpenAI(
-            api_key=os.getenv("RUNPOD_TOKEN"),
-            base_url=os.getenv("RUNPOD_EMBEDDING_URL"),
-        )
-        self.model_name = os.getenv("MODEL_NAME")
+    def __init__(self, client_registry=None, response_cache=None, vector_store=None, profile=None):
+        # Get the shared clients for the deployed chatbot URL and the deployed embedding URL from the client registry
+        client_registry = client_registry or get_default_registry()
+        #Model, endpoint, max_tokens and temperature from the DETAILS_* variables
+        self.profile = profile or GenerationProfile.from_env("DETAILS", client_registry)
+        #Async client for the async pipeline (aget_response)
+        self.client, self.async_client = self.profile.get_clients(client_registry)
+        #Embeddings go through the shared cache and the request batcher in front of the embedding endpoint
+        self.embedding_service = client_registry.get_embedding_service()
+        self.model_name = self.profile.model_name
         
-        # Initialize Pinecone client to store and access the vector storage
-        self.pinecone_client = Pinecone(
-            api_key=os.getenv("PINECONE_API_KEY")
-        )
-        self.index_name = os.getenv("PINECONE_INDEX_NAME")
+        # The vector storage holding the knowledge base, Pinecone or the local index depending on VECTOR_STORE_BACKEND
+        self.vector_store = vector_store if vector_store is not None else get_vector_store()
+
+        #Cache of the answers to repeated questions (opening hours, prices...), configured by the DETAILS_CACHE_* variables
+        self.response_cache = response_cache if response_cache is not None else get_details_response_cache()
+
+        #The answering system prompt is compiled once, the contexts and the query go in the last user message after it
+        self.prompt = PromptTemplate("details", """
+        You are a customer support agent for a coffee shop called Joy's Cafe. 
+        Answer every question as if you are a friendly waiter. 
+        Provide the user with accurate and helpful information regarding their orders, menu items, recommendations, and general shop details.
+        """)
 
     def get_system_prompt(self):
         return """ 
@@ -47,25 +52,14 @@ class DetailsAgent():
             "message": If decision is "allowed", provide the answer. If "not allowed", set to "Sorry, I can't help with that."
         }"""
 
-    def get_nearest_match(self,index_name,embeddings,top_k=1):
-        # Use the Pinecone client to query the index for the nearest match
-        response = self.pinecone_client.query(
-            index_name=index_name,
-            namespace="ns1",
-            vector=embeddings,
-            top_k=top_k,
-            include_values=False,
-            include_metadata=True
-        )
-        return response
-
-    def get_response(self, messages):
-        messages = deepcopy(messages)
+    def get_nearest_match(self,embeddings,top_k=1):
+        # Query the vector storage for the nearest match
+        return self.vector_store.query(embeddings, top_k=top_k)
 
-        #Get the embeddings for the user message first, and then we will fetch the nearest match from the vector storage
+    #Builds the messages sent to the llm from the conversation and the matches fetched from the vector storage
+    def get_input_messages(self, messages, closest_match):
+        messages = Conversation.of(messages)
         user_message = messages[-1]['content']
-        embeddings = get_embedding(self.embedding_client, self.model_name, user_message)
-        closest_match = self.get_nearest_match(self.index_name, embeddings)
 
         #Creating a source knowledge object by going over all the matches and concatenating their text (information) stored in the metadata field
         source_knowledge = "\n".join([x['metadata']['text'].strip()+'\n' for x in closest_match['matches'] ])
@@ -80,24 +74,126 @@ class DetailsAgent():
         {user_message}
         """
 
-        system_prompt = """
-        You are a customer support agent for a coffee shop called Joy's Cafe. 
-        Answer every question as if you are a friendly waiter. 
-        Provide the user with accurate and helpful information regarding their orders, menu items, recommendations, and general shop details.
-        """
+        # The prompt replaces the last message in a new view, the conversation itself is left untouched
+        messages = messages.with_last_content(prompt)
+        return self.prompt.get_messages(messages[-3:].to_messages())
+
+    #Everything the answer needs before the completion: a cached answer, or the question's embedding and the closest match.
+    #The AgentController's speculative mode runs it (prefetch) while the guard is still deciding.
+    #The cache is keyed on the messages the answer is generated from, not only the question.
+    def retrieve(self, messages):
+        user_message = messages[-1]['content']
+        #The same question asked before, after the same messages, is answered straight from the cache
+        if self.response_cache is not None:
+            cached_output = self.response_cache.get_exact(messages)
+            if cached_output is not None:
+                tracing.current().set(response_cache="exact")
+                return {"cached_output": cached_output}
 
-        messages[-1]=prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        #Get the embeddings for the user message first, and then we will fetch the nearest match from the vector storage
+        embeddings = self.embedding_service.get_embedding(user_message)[0]
+
+        #A question close enough to one asked before is answered from the cache as well
+        if self.response_cache is not None:
+            cached_output = self.response_cache.get_semantic(messages, embeddings)
+            if cached_output is not None:
+                tracing.current().set(response_cache="semantic")
+                return {"cached_output": cached_output}
+
+        with tracing.span("vector_query"):
+            closest_match = self.get_nearest_match(embeddings)
+        return {"embeddings": embeddings, "closest_match": closest_match}
+
+    async def aretrieve(self, messages):
+        user_message = messages[-1]['content']
+        if self.response_cache is not None:
+            cached_output = self.response_cache.get_exact(messages)
+            if cached_output is not None:
+                tracing.current().set(response_cache="exact")
+                return {"cached_output": cached_output}
+
+        embeddings = (await self.embedding_service.async_get_embedding(user_message))[0]
+
+        if self.response_cache is not None:
+            cached_output = self.response_cache.get_semantic(messages, embeddings)
+            if cached_output is not None:
+                tracing.current().set(response_cache="semantic")
+                return {"cached_output": cached_output}
+
+        with tracing.span("vector_query"):
+            closest_match = await self.vector_store.aquery(embeddings, top_k=1)
+        return {"embeddings": embeddings, "closest_match": closest_match}
+
+    def prefetch(self, messages):
+        return self.retrieve(messages)
+
+    async def aprefetch(self, messages):
+        return await self.aretrieve(messages)
+
+    #prefetched is the result of prefetch() for the same messages, the retrieval is skipped when it is given
+    def get_response(self, messages, prefetched=None):
+        retrieved = prefetched or self.retrieve(messages)
+        if "cached_output" in retrieved:
+            return self.postprocess(retrieved["cached_output"])
+
+        input_messages = self.get_input_messages(messages, retrieved["closest_match"])
+        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        if self.response_cache is not None:
+            self.response_cache.put(messages, retrieved["embeddings"], chatbot_output)
         output = self.postprocess(chatbot_output)
         
         return output
 
+    async def aget_response(self, messages, prefetched=None):
+        retrieved = prefetched or await self.aretrieve(messages)
+        if "cached_output" in retrieved:
+            return self.postprocess(retrieved["cached_output"])
+
+        input_messages = self.get_input_messages(messages, retrieved["closest_match"])
+        chatbot_output =await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        if self.response_cache is not None:
+            self.response_cache.put(messages, retrieved["embeddings"], chatbot_output)
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    #Streaming version of get_response: yields {"delta": text} pieces of the answer and then the final message.
+    #A cached answer is yielded as a single piece.
+    def get_response_stream(self, messages, prefetched=None):
+        retrieved = prefetched or self.retrieve(messages)
+        if "cached_output" in retrieved:
+            yield {"delta": retrieved["cached_output"]}
+            yield self.postprocess(retrieved["cached_output"])
+            return
+
+        input_messages = self.get_input_messages(messages, retrieved["closest_match"])
+        chatbot_output = ""
+        for delta in get_chatbot_response_stream(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens):
+            chatbot_output += delta
+            yield {"delta": delta}
+        if self.response_cache is not None:
+            self.response_cache.put(messages, retrieved["embeddings"], chatbot_output)
+        yield self.postprocess(chatbot_output)
+
+    async def aget_response_stream(self, messages, prefetched=None):
+        retrieved = prefetched or await self.aretrieve(messages)
+        if "cached_output" in retrieved:
+            yield {"delta": retrieved["cached_output"]}
+            yield self.postprocess(retrieved["cached_output"])
+            return
+
+        input_messages = self.get_input_messages(messages, retrieved["closest_match"])
+        chatbot_output = ""
+        async for delta in async_get_chatbot_response_stream(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens):
+            chatbot_output += delta
+            yield {"delta": delta}
+        if self.response_cache is not None:
+            self.response_cache.put(messages, retrieved["embeddings"], chatbot_output)
+        yield self.postprocess(chatbot_output)
+
 
 #To postprocess the ouput from the llm to have the role, content and memory attributes.
     def postprocess(self,output):
-        output = json.loads(output)
-
         dict_output = {
             "role": "assistant",
             "content": output,
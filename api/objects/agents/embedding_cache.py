@@ -0,0 +1,259 @@
+import os
+import asyncio
+import contextvars
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from .utils import get_embedding, async_get_embedding
+from .admission import turn_priority, DEFAULT_PRIORITY
+from . import tracing
+
+#Embeddings keyed on a hash of the model name and the text, so repeated phrasing and knowledge base rebuilds
+#never embed the same text twice.
+#   memory: LRU dict of float32 vectors
+#   disk: optional SQLite file that survives restarts and is shared by the workers of one machine, only with an explicit
+#   path (EMBEDDING_CACHE_PATH)
+class EmbeddingCache():
+    def __init__(self, max_size=10000, disk_path=None):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self.disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self.disk.commit()
+
+    @staticmethod
+    def get_key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    #Returns {key: vector} for the keys found in memory or on disk
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                vector = self.memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                    continue
+                self.memory.move_to_end(key)
+                found[key] = vector
+                self.stats["memory_hits"] += 1
+
+            if missing and self.disk is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self.disk.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self.store_in_memory(key, vector)
+                    self.stats["disk_hits"] += 1
+
+            self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            rows = []
+            for key, vector in items.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                self.store_in_memory(key, vector)
+                rows.append((key, vector.tobytes()))
+            if rows and self.disk is not None:
+                self.disk.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self.disk.commit()
+
+    def store_in_memory(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_size"] = len(self.memory)
+        return stats
+
+#Coalesces the embed requests of concurrent threads into one embeddings.create call.
+#A batch is sent once it holds max_batch_size texts or max_wait seconds after its first text arrived.
+#Every request carries a copy of its caller's context, the batch is sent in the one of the best priority so the call is
+#admitted at that turn's priority and its spans join that turn's trace.
+class EmbeddingBatcher():
+    def __init__(self, client, model_name, max_batch_size=32, max_wait=0.005, max_concurrent_batches=4):
+        self.client = client
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+        #Batches are sent from a small pool so the next batch can be collected while one is in flight
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self.lock = threading.Lock()
+        self.stats = {"texts": 0, "api_calls": 0}
+
+    def embed(self, texts):
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def submit(self, text):
+        future = Future()
+        self.queue.put((text, future, contextvars.copy_context()))
+        if self.thread is None:
+            with self.thread_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, daemon=True)
+                    self.thread.start()
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            context = min((context for _, _, context in batch),
+                          key=lambda context: context.get(turn_priority, DEFAULT_PRIORITY))
+            self.executor.submit(context.run, self.send, batch)
+
+    def send(self, batch):
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            embeddings = dict(zip(texts, get_embedding(self.client, self.model_name, texts)))
+        except Exception as error:
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+        with self.lock:
+            self.stats["texts"] += len(batch)
+            self.stats["api_calls"] += 1
+        for text, future, _ in batch:
+            future.set_result(embeddings[text])
+
+#Same as EmbeddingBatcher for coroutines running on one event loop
+class AsyncEmbeddingBatcher():
+    def __init__(self, client, model_name, max_batch_size=32, max_wait=0.005):
+        self.client = client
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.pending = []
+        self.flush_handle = None
+        #The event loop of the pending texts and of the flush handle
+        self.loop = None
+        self.stats = {"texts": 0, "api_calls": 0}
+
+    async def embed(self, texts):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            #A later asyncio.run() in the same process: what was left on the previous loop died with it
+            self.loop = loop
+            self.pending = []
+            self.flush_handle = None
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.pending.append((text, future))
+            futures.append(future)
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_wait, self.flush)
+        return await asyncio.gather(*futures)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            batch = self.pending[:self.max_batch_size]
+            self.pending = self.pending[self.max_batch_size:]
+            asyncio.ensure_future(self.send(batch))
+
+    async def send(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = dict(zip(texts, await async_get_embedding(self.client, self.model_name, texts)))
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.stats["texts"] += len(batch)
+        self.stats["api_calls"] += 1
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[text])
+
+#Front end for the embeddings used by the agents: cached texts are answered locally, the rest goes through the batchers.
+#get_embedding and async_get_embedding take a string or a list of strings and return a list of embeddings like utils.get_embedding.
+class EmbeddingService():
+    def __init__(self, client, async_client, model_name, cache=None, max_batch_size=32, max_wait=0.005):
+        self.model_name = model_name
+        self.cache = cache
+        self.batcher = EmbeddingBatcher(client, model_name, max_batch_size, max_wait)
+        self.async_batcher = AsyncEmbeddingBatcher(async_client, model_name, max_batch_size, max_wait)
+
+    def split_cached(self, input_data):
+        texts = [input_data] if isinstance(input_data, str) else list(input_data)
+        keys = [EmbeddingCache.get_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys) if self.cache is not None else {}
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        return texts, keys, found, missing
+
+    def merge(self, texts, keys, found, missing, embeddings):
+        fetched = {EmbeddingCache.get_key(self.model_name, text): embedding for text, embedding in zip(missing, embeddings)}
+        if self.cache is not None and fetched:
+            self.cache.put_many(fetched)
+        found.update(fetched)
+        return [np.asarray(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def get_embedding(self, input_data):
+        with tracing.span("embedding") as span:
+            texts, keys, found, missing = self.split_cached(input_data)
+            span.set(texts=len(texts), cache_hits=len(texts) - len(missing))
+            embeddings = self.batcher.embed(missing) if missing else []
+            return self.merge(texts, keys, found, missing, embeddings)
+
+    async def async_get_embedding(self, input_data):
+        with tracing.span("embedding") as span:
+            texts, keys, found, missing = self.split_cached(input_data)
+            span.set(texts=len(texts), cache_hits=len(texts) - len(missing))
+            embeddings = await self.async_batcher.embed(missing) if missing else []
+            return self.merge(texts, keys, found, missing, embeddings)
+
+    def get_stats(self):
+        stats = {
+            "batched_texts": self.batcher.stats["texts"] + self.async_batcher.stats["texts"],
+            "api_calls": self.batcher.stats["api_calls"] + self.async_batcher.stats["api_calls"],
+        }
+        if self.cache is not None:
+            stats.update(self.cache.get_stats())
+        return stats
+
+#Builds the embedding cache from the EMBEDDING_CACHE_* environment variables, None when it is disabled.
+#The disk tier is only used with EMBEDDING_CACHE_PATH, nothing is written to the working directory by default.
+def get_embedding_cache():
+    max_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    if max_size <= 0:
+        return None
+    return EmbeddingCache(max_size=max_size, disk_path=os.getenv("EMBEDDING_CACHE_PATH") or None)
@@ -0,0 +1,214 @@
+import os
+import re
+import asyncio
+import json
+import threading
+import numpy as np
+from .order_state import Menu
+from .conversation import Conversation
+from .classification_agent import ROUTED_AGENTS
+
+PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "products", "products.jsonl")
+
+#Phrasings that settle the intent on their own, with the confidence they give
+RECOMMENDATION_PATTERNS = [
+    (r"\brecommend|\bsuggest|\bsurprise me\b|\bany ideas?\b", 0.95),
+    (r"\bwhat should i (get|have|try|order|drink|eat)\b", 0.95),
+    (r"\b(best ?sellers?|most popular|popular)\b|\bwhat('s| is) (good|your best)\b", 0.9),
+    (r"\b(goes?|go) (well )?with\b|\bpairs? (well )?with\b", 0.85),
+    (r"\b(is|are) (the|it|they) .*\b(good|nice|worth)\b|\bworth (it|trying)\b", 0.85),
+]
+DETAILS_PATTERNS = [
+    (r"\bwhat('s| is| are) in\b|\bingredients?\b|\bmade (of|with|from)\b|\bcontains?\b", 0.9),
+    (r"\ballerg|\bgluten\b|\bvegan\b|\bdairy\b|\blactose\b|\bcalories?\b|\bcaffeine\b", 0.9),
+    (r"\bhow much (is|are|does|do)\b|\bprices?\b|\bcosts?\b", 0.85),
+    (r"\b(open|opening|close|closing)\b|\bhours\b|\bwhere (are|is)\b|\blocation\b|\baddress\b|\bdeliver(y)?\b|\bwifi\b|\bparking\b", 0.9),
+    (r"\bwhat do you (have|sell|serve|offer)\b|\bmenu\b|\btell me (more )?about\b|\bdescribe\b|\bratings?\b", 0.9),
+]
+ORDER_VERBS = r"\b(i'?d like|i would like|i want|i'?ll (have|take|get)|can i (get|have|order)|could i (get|have)|may i have|give me|get me|order|add|remove|cancel|make it|change|instead|one more|another)\b"
+ORDER_DONE = r"\b(that'?s (all|it)|that is (all|it)|nothing else|no(pe)?,? (that'?s|thanks|thank you)|check ?out|place (the|my) order|confirm)\b"
+QUANTITY = r"\b(\d+|a|an|one|two|three|four|five|six|a couple of)\b"
+QUESTION_START = r"^\s*(what|how|which|do|does|is|are|can you|could you|where|when|why|who)\b"
+SHORT_REPLY = r"^\s*(yes|yeah|yep|no|nope|sure|ok(ay)?|please|thanks|thank you)\b"
+
+#Labelled phrasings the embedding centroids are built from
+ROUTING_EXAMPLES = {
+    "details_agent": [
+        "What are your opening hours?", "What is in a cappuccino?", "How much is a latte?", "Where are you located?",
+        "Do you deliver?", "What pastries do you have?", "Does the almond croissant contain nuts?", "Tell me about the ginger scone",
+    ],
+    "order_taking_agent": [
+        "I'd like a latte please", "Can I get two croissants?", "Add an espresso shot", "2 cappuccinos and a scone",
+        "Remove the biscotti from my order", "That's all, thanks", "Make it a large", "I'll have the chocolate croissant",
+    ],
+    "recommendation_agent": [
+        "What do you recommend?", "What should I get?", "Any suggestions for a pastry?", "What is your most popular coffee?",
+        "What goes well with a latte?", "Surprise me", "What's good here?", "Recommend me a drink",
+    ],
+}
+
+#Local classifier in front of the ClassificationAgent: menu item and keyword rules decide the obvious messages,
+#classify() returns (agent name, confidence) and the caller asks the llm when the confidence is below the threshold.
+class RuleBasedRouter():
+    def __init__(self, menu=None, products_path=PRODUCTS_PATH, threshold=0.8):
+        self.init_state(threshold)
+
+        #Item names from the OrderTakingAgent menu and products.jsonl, plus the single words people order by
+        names = list((menu or Menu()).prices)
+        if products_path and os.path.exists(products_path):
+            with open(products_path, "r") as file:
+                names += [json.loads(line)["name"] for line in file if line.strip()]
+        words = set()
+        for name in names:
+            name = re.sub(r"\(.*?\)", "", name.lower())
+            words.add(" ".join(name.split()))
+            words.update(word for word in name.split() if len(word) > 3 and word not in ("free", "shot"))
+        alternatives = "|".join(sorted((re.escape(word) for word in words), key=len, reverse=True))
+        self.item_pattern = re.compile(rf"\b({alternatives})(e?s)?\b")
+
+    #The threshold and the decision stats every router keeps
+    def init_state(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.stats = {"decisions": 0, "fast_path": 0, "fallback": 0}
+
+    #Returns {agent: confidence} of every rule that matched the message
+    def score(self, user_message, previous_agent):
+        text = user_message.lower().strip()
+        scores = {}
+
+        def vote(agent, confidence):
+            scores[agent] = max(scores.get(agent, 0), confidence)
+
+        for pattern, confidence in RECOMMENDATION_PATTERNS:
+            if re.search(pattern, text):
+                vote("recommendation_agent", confidence)
+        for pattern, confidence in DETAILS_PATTERNS:
+            if re.search(pattern, text):
+                vote("details_agent", confidence)
+
+        mentions_item = self.item_pattern.search(text) is not None
+        if re.search(ORDER_VERBS, text) and mentions_item:
+            vote("order_taking_agent", 0.95)
+        elif re.search(ORDER_DONE, text):
+            vote("order_taking_agent", 0.9)
+        elif mentions_item and re.search(QUANTITY, text) and "?" not in text and not re.search(QUESTION_START, text):
+            #"2 lattes and a croissant"
+            vote("order_taking_agent", 0.85)
+
+        #"yes" / "no thanks" while an order is being taken
+        if previous_agent == "order_taking_agent" and not scores and re.search(SHORT_REPLY, text) and len(text.split()) <= 6:
+            vote("order_taking_agent", 0.85)
+        return scores
+
+    def classify(self, messages):
+        messages = Conversation.of(messages)
+        previous_agent = None
+        for message in reversed(messages[:-1]):
+            if message["role"] == "assistant":
+                previous_agent = message.get("memory", {}).get("agent")
+                break
+
+        scores = self.score(messages[-1]["content"], previous_agent)
+        if not scores:
+            return self.record(None, 0.0)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        agent, confidence = ranked[0]
+        #Rules pointing to different agents cancel each other out
+        if len(ranked) > 1:
+            confidence -= ranked[1][1]
+        return self.record(agent, confidence)
+
+    async def aclassify(self, messages):
+        return self.classify(messages)
+
+    def record(self, agent, confidence):
+        with self.lock:
+            self.stats["decisions"] += 1
+            self.stats["fast_path" if agent is not None and confidence >= self.threshold else "fallback"] += 1
+        return agent, confidence
+
+    #The decision to use without asking the llm, None when the llm has to decide
+    def route(self, messages):
+        agent, confidence = self.classify(messages)
+        return agent if agent is not None and confidence >= self.threshold else None
+
+    async def aroute(self, messages):
+        agent, confidence = await self.aclassify(messages)
+        return agent if agent is not None and confidence >= self.threshold else None
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["llm_calls_avoided"] = stats["fast_path"] / stats["decisions"] if stats["decisions"] else 0.0
+        return stats
+
+#Nearest centroid over embeddings of labelled examples. The confidence is the margin between the closest and the second
+#closest centroid relative to the room left above the second one. The message embedding goes through the shared
+#EmbeddingService, so the DetailsAgent finds it in the cache afterwards.
+class EmbeddingCentroidRouter(RuleBasedRouter):
+    def __init__(self, embedding_service, examples=None, threshold=0.8):
+        self.init_state(threshold)
+        self.embedding_service = embedding_service
+        self.examples = examples or ROUTING_EXAMPLES
+        self.agents = list(self.examples)
+        self.centroids = None
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def build_centroids(self, embeddings):
+        start = 0
+        centroids = []
+        for agent in self.agents:
+            count = len(self.examples[agent])
+            centroids.append(self.normalize(embeddings[start:start + count]).mean(axis=0))
+            start += count
+        return self.normalize(centroids)
+
+    def get_example_texts(self):
+        return [text for agent in self.agents for text in self.examples[agent]]
+
+    def decide(self, embedding):
+        similarities = self.centroids @ self.normalize(embedding)
+        order = np.argsort(-similarities)
+        top, second = float(similarities[order[0]]), float(similarities[order[1]])
+        confidence = (top - second) / max(1 - second, 1e-6)
+        return self.record(self.agents[order[0]], confidence)
+
+    #The centroids are built on the first request, once: concurrent first requests wait for the one embedding the examples
+    def get_centroids(self):
+        if self.centroids is None:
+            with self.lock:
+                if self.centroids is None:
+                    self.centroids = self.build_centroids(self.embedding_service.get_embedding(self.get_example_texts()))
+        return self.centroids
+
+    def classify(self, messages):
+        self.get_centroids()
+        embedding = self.embedding_service.get_embedding(Conversation.of(messages)[-1]["content"])[0]
+        return self.decide(embedding)
+
+    async def aclassify(self, messages):
+        #The lock is not held across an await, the first request builds them in a thread
+        if self.centroids is None:
+            await asyncio.to_thread(self.get_centroids)
+        embedding = (await self.embedding_service.async_get_embedding(Conversation.of(messages)[-1]["content"]))[0]
+        return self.decide(embedding)
+
+FAST_ROUTER_MODES = ("off", "rules", "centroid")
+
+#Builds the fast-path router from the FAST_ROUTER* environment variables, None when it is off
+def get_fast_router(client_registry, mode=None):
+    mode = mode or os.getenv("FAST_ROUTER", "off")
+    threshold = float(os.getenv("FAST_ROUTER_THRESHOLD", "0.8"))
+    if mode == "off":
+        return None
+    if mode == "rules":
+        return RuleBasedRouter(threshold=threshold)
+    if mode == "centroid":
+        return EmbeddingCentroidRouter(client_registry.get_embedding_service(), threshold=threshold)
+    raise ValueError(f"Unknown fast router mode '{mode}', expected one of {FAST_ROUTER_MODES}")
@@ -0,0 +1,38 @@
+import os
+
+#How an agent's completions are generated: the model and the endpoint serving it, max_tokens and temperature.
+#Every agent reads its own profile from <PREFIX>_MODEL, <PREFIX>_CHATBOT_URL, <PREFIX>_MAX_TOKENS and <PREFIX>_TEMPERATURE
+#(GUARD, CLASSIFICATION, GUARD_CLASSIFICATION, DETAILS, ORDER_TAKING, RECOMMENDATION) and falls back to MODEL_NAME on
+#RUNPOD_CHATBOT_URL, so the guard and the routing can run on a smaller model of their own endpoint.
+#The guard and routing agents also take <PREFIX>_COMPACT: their prompt then asks for the decision only, without the
+#"chain of thought" that postprocess throws away, and max_tokens defaults to what the decision needs.
+
+DEFAULT_MAX_TOKENS = 2000
+
+class GenerationProfile():
+    def __init__(self, model_name, chatbot_url=None, max_tokens=DEFAULT_MAX_TOKENS, temperature=0, compact=False):
+        self.model_name = model_name
+        #None is the registry's chat endpoint
+        self.chatbot_url = chatbot_url
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.compact = compact
+
+    #compact_max_tokens is given by the agents that have a compact output, it is the max_tokens default in compact mode
+    @classmethod
+    def from_env(cls, prefix, client_registry, compact_max_tokens=None):
+        compact = compact_max_tokens is not None and os.getenv(f"{prefix}_COMPACT", "false").lower() == "true"
+        return cls(os.getenv(f"{prefix}_MODEL") or client_registry.model_name,
+                   chatbot_url=os.getenv(f"{prefix}_CHATBOT_URL") or None,
+                   max_tokens=int(os.getenv(f"{prefix}_MAX_TOKENS", compact_max_tokens if compact else DEFAULT_MAX_TOKENS)),
+                   temperature=float(os.getenv(f"{prefix}_TEMPERATURE", "0")),
+                   compact=compact)
+
+    #The sync and async clients of the profile's endpoint, shared through the registry like every other client
+    def get_clients(self, client_registry):
+        chatbot_url = self.chatbot_url or client_registry.chatbot_url
+        return client_registry.get_client(chatbot_url), client_registry.get_client(chatbot_url, is_async=True)
+
+    def as_dict(self):
+        return {"model_name": self.model_name, "chatbot_url": self.chatbot_url, "max_tokens": self.max_tokens,
+                "temperature": self.temperature, "compact": self.compact}
@@ -0,0 +1,183 @@
+import json
+import re
+import threading
+from .utils import jsonValidation, async_jsonValidation
+from . import tracing
+
+#Parses the json the llm generates without paying for an extra completion when it is not needed.
+#The output goes through three tiers and the first one that works wins:
+#   strict: json.loads on the raw output
+#   tolerant: a local repair for code fences, prose around the object, single quotes, trailing commas,
+#             python literals, bare keys and unbalanced braces/strings
+#   llm: the old jsonValidation round-trip, only when a client is given and the local repair failed
+#Counters of how often each tier was needed are kept in json_repair_stats.
+
+json_repair_stats = {"strict": 0, "tolerant": 0, "llm": 0, "failed": 0}
+json_repair_stats_lock = threading.Lock()
+
+CODE_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+CLOSERS = {"{": "}", "[": "]"}
+
+def count_tier(tier):
+    with json_repair_stats_lock:
+        json_repair_stats[tier] += 1
+    tracing.current().set(json_repair=tier)
+
+def get_json_repair_stats():
+    with json_repair_stats_lock:
+        return dict(json_repair_stats)
+
+def reset_json_repair_stats():
+    with json_repair_stats_lock:
+        for tier in json_repair_stats:
+            json_repair_stats[tier] = 0
+
+#Drops everything before the first '{' or '[' (a code fence's content wins if there is one)
+def extract_json_text(text):
+    fenced = CODE_FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        return None
+    return text[min(starts):]
+
+#Removes a dangling comma (and the whitespace around it) from the end of the repaired output
+def strip_trailing_comma(output):
+    while output and output[-1].isspace():
+        output.pop()
+    if output and output[-1] == ",":
+        output.pop()
+
+#Walks the text once and rewrites it into valid json, stopping after the top-level value is closed
+def repair_json(text):
+    text = extract_json_text(text)
+    if text is None:
+        return None
+
+    output = []
+    stack = []
+    quote = None
+    index = 0
+    while index < len(text):
+        char = text[index]
+
+        #Inside a string: normalise the quote to '"' and escape what json does not allow raw
+        if quote is not None:
+            if char == "\\" and index + 1 < len(text):
+                next_char = text[index + 1]
+                output.append("'" if next_char == "'" else char + next_char)
+                index += 2
+                continue
+            if char == quote:
+                output.append('"')
+                quote = None
+            elif char == '"':
+                output.append('\\"')
+            elif char == "\n":
+                output.append("\\n")
+            elif char == "\t":
+                output.append("\\t")
+            else:
+                output.append(char)
+            index += 1
+            continue
+
+        if char in ('"', "'"):
+            quote = char
+            output.append('"')
+        elif char in CLOSERS:
+            stack.append(char)
+            output.append(char)
+        elif char in ("}", "]"):
+            strip_trailing_comma(output)
+            if stack:
+                output.append(CLOSERS[stack.pop()])
+            if not stack:
+                break
+        elif char.isalpha() or char == "_":
+            #Bare words are python literals or unquoted keys
+            word = re.match(r"[A-Za-z_][A-Za-z0-9_ ]*?(?=\s*[:,}\]]|$)", text[index:])
+            word = word.group(0) if word else char
+            if word in LITERALS:
+                output.append(LITERALS[word])
+            else:
+                output.append(json.dumps(word.strip()))
+            index += len(word)
+            continue
+        else:
+            output.append(char)
+        index += 1
+
+    #Close whatever the model left open
+    if quote is not None:
+        output.append('"')
+    strip_trailing_comma(output)
+    if output and output[-1] == ":":
+        output.append("null")
+    while stack:
+        output.append(CLOSERS[stack.pop()])
+    return "".join(output)
+
+def tolerant_loads(text):
+    repaired = repair_json(text)
+    if repaired is None:
+        raise json.JSONDecodeError("No json object found", text, 0)
+    return json.loads(repaired)
+
+#Tries the local tiers and returns the parsed object, or None when they both fail
+def parse_locally(text):
+    try:
+        output = json.loads(text)
+        count_tier("strict")
+        return output
+    except (json.JSONDecodeError, TypeError):
+        pass
+    try:
+        output = tolerant_loads(text)
+        count_tier("tolerant")
+        return output
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+#The llm's fix still goes through the local parsers, but it is counted as an llm repair
+def parse_locally_after_llm(text):
+    try:
+        output = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        try:
+            output = tolerant_loads(text)
+        except (json.JSONDecodeError, TypeError):
+            return None
+    count_tier("llm")
+    return output
+
+#Returns the parsed json output of the llm, the client is only used as a last resort to have the llm fix it
+def parse_json_output(text, client=None, model_name=None):
+    output = parse_locally(text)
+    if output is not None:
+        return output
+
+    if client is not None:
+        fixed_text = jsonValidation(client, model_name, text)
+        output = parse_locally_after_llm(fixed_text)
+        if output is not None:
+            return output
+
+    count_tier("failed")
+    raise json.JSONDecodeError("Could not repair the json output", text or "", 0)
+
+async def async_parse_json_output(text, client=None, model_name=None):
+    output = parse_locally(text)
+    if output is not None:
+        return output
+
+    if client is not None:
+        fixed_text = await async_jsonValidation(client, model_name, text)
+        output = parse_locally_after_llm(fixed_text)
+        if output is not None:
+            return output
+
+    count_tier("failed")
+    raise json.JSONDecodeError("Could not repair the json output", text or "", 0)
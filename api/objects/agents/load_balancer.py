@@ -0,0 +1,421 @@
+import asyncio
+import contextvars
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, wait
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from .admission import AdmissionError
+
+#Load balancing over equivalent endpoints (RunPod replicas serving the same model), given as a comma separated list in
+#RUNPOD_CHATBOT_URL, RUNPOD_EMBEDDING_URL or <AGENT>_CHATBOT_URL. The ClientRegistry hands a BalancedClient to the
+#agents in place of the OpenAI client, and the helpers of utils send every request to one of its endpoints:
+#   least_outstanding: the endpoint with the fewest requests in flight from this worker
+#   ewma: the endpoint with the lowest moving average latency, weighted by its requests in flight
+#   round_robin: every endpoint in turn whatever its load, what a DNS or a plain proxy would do
+#A request holds its admission slot (admission.py) before it is counted in the endpoint's load and timed, so the wait
+#in the queue is neither the endpoint's latency nor a reason to hedge.
+#With a hedge delay a request that has not answered that long after it was sent is sent again to another endpoint, the
+#first answer wins and the other request is cancelled (the async pipeline cancels the http request, the sync one stops
+#waiting for it and no longer counts it in its endpoint's load). A request that fails on one endpoint is sent to the
+#next one. An endpoint that fails eject_failures times in a row is left out for eject_seconds, unless every endpoint is.
+#Streams are balanced but not hedged, part of the answer has been shown by the time a second stream would win.
+
+LOAD_BALANCERS = ("least_outstanding", "ewma", "round_robin")
+
+#Weight of the last request in the moving average latency
+EWMA_ALPHA = 0.3
+#The average of an endpoint that gets no traffic fades over this many seconds, so one slow answer does not keep it
+#out of rotation for good
+EWMA_DECAY_SECONDS = 10.0
+
+#Errors of the request itself (4xx other than timeouts and rate limits) are not the endpoint's fault,
+#they are not retried elsewhere and do not count toward ejection
+def is_endpoint_error(error):
+    status_code = getattr(error, "status_code", None)
+    return status_code is None or status_code >= 500 or status_code in (408, 429)
+
+#An endpoint that failed or could not admit the request (a full admission queue) may still answer on another one
+def should_fail_over(error):
+    return isinstance(error, AdmissionError) or is_endpoint_error(error)
+
+#Health and load of one endpoint, shared by its sync and async clients
+class EndpointState():
+    def __init__(self, url):
+        self.url = url
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        #Moving average latency in seconds, None until the first answer
+        self.ewma = None
+        self.ewma_updated_at = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.stats = {"requests": 0, "failures": 0, "ejections": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+    def is_ejected(self, now):
+        return self.ejected_until > now
+
+    #Lower is better
+    def get_cost(self, balancer):
+        if balancer == "ewma":
+            #An endpoint without an answer yet is tried first, it has no latency to compare
+            if self.ewma is None:
+                return 0.0
+            decay = math.exp(-(time.monotonic() - self.ewma_updated_at) / EWMA_DECAY_SECONDS)
+            return self.ewma * decay * (self.outstanding + 1)
+        if balancer == "round_robin":
+            return self.stats["requests"]
+        return self.outstanding
+
+    def started(self):
+        with self.lock:
+            self.outstanding += 1
+            self.stats["requests"] += 1
+
+    def succeeded(self, seconds):
+        with self.lock:
+            self.outstanding -= 1
+            self.consecutive_failures = 0
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+            self.ewma_updated_at = time.monotonic()
+
+    def failed(self, eject_failures, eject_seconds):
+        with self.lock:
+            self.outstanding -= 1
+            self.stats["failures"] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= eject_failures:
+                self.consecutive_failures = 0
+                self.ejected_until = time.monotonic() + eject_seconds
+                self.stats["ejections"] += 1
+
+    #A request that was cancelled or not admitted says nothing about the endpoint
+    def abandoned(self):
+        with self.lock:
+            self.outstanding -= 1
+
+    def add(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["outstanding"] = self.outstanding
+            stats["ewma_ms"] = round(self.ewma * 1000, 3) if self.ewma is not None else None
+            stats["ejected"] = self.is_ejected(time.monotonic())
+        return stats
+
+#The admission of the requests that wait for no slot
+def no_admission(client):
+    return nullcontext()
+
+#One request of call() / acall() on an endpoint, counted in the endpoint's load from when it got its admission slot
+#(sent_at). A sync request that lost a hedge cannot be stopped: it is dropped from its endpoint's load as soon as the
+#other answer won, and its own end is not recorded.
+class EndpointRequest():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.sent_at = None
+        self.over = False
+
+    #False when the request was dropped before it was sent
+    def sent(self, state):
+        with self.lock:
+            if self.over:
+                return False
+            state.started()
+            self.state = state
+            self.sent_at = time.monotonic()
+            return True
+
+    #True for the first of finished() and drop(), the end of a request is recorded once
+    def finished(self):
+        with self.lock:
+            over, self.over = self.over, True
+        return not over
+
+    def drop(self):
+        if self.finished() and self.state is not None:
+            self.state.abandoned()
+
+#Stands in for an OpenAI or AsyncOpenAI client in the helpers of utils, which call call() / acall() with a function
+#taking the client of the chosen endpoint
+class BalancedClient():
+    def __init__(self, base_url, states, clients, balancer="least_outstanding", hedge_delay=None, eject_failures=3,
+                 eject_seconds=30.0, executor=None):
+        if balancer not in LOAD_BALANCERS:
+            raise ValueError(f"Unknown load balancer '{balancer}', expected one of {LOAD_BALANCERS}")
+        #The comma separated urls, what single-flight keys and logs see
+        self.base_url = base_url
+        self.endpoints = list(zip(states, clients))
+        self.balancer = balancer
+        #Seconds before a request is hedged, None never hedges
+        self.hedge_delay = hedge_delay
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        #Runs the sync requests when they are hedged, the caller waits for the first answer
+        self.executor = executor
+        self.random = random.Random()
+
+    #The endpoint for the next request among the ones not tried yet: the healthy ones first, ties broken at random
+    #so a burst of requests does not all go to the first endpoint. None when every endpoint was tried.
+    def pick(self, tried=()):
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint[0] not in tried]
+        if not candidates:
+            return None
+        healthy = [endpoint for endpoint in candidates if not endpoint[0].is_ejected(now)]
+        if healthy:
+            return min(healthy, key=lambda endpoint: (endpoint[0].get_cost(self.balancer), self.random.random()))
+        #Every endpoint left is ejected, the one coming back first is the best guess
+        return min(candidates, key=lambda endpoint: endpoint[0].ejected_until)
+
+    #Cancellations (asyncio.CancelledError, a stream closed early) and errors that are not the endpoint's fault
+    #only end the request, the other errors count toward ejection
+    def record(self, state, start, error=None):
+        if error is None:
+            state.succeeded(time.perf_counter() - start)
+        elif not isinstance(error, Exception) or isinstance(error, AdmissionError) or not is_endpoint_error(error):
+            state.abandoned()
+        else:
+            state.failed(self.eject_failures, self.eject_seconds)
+
+    #admit holds the endpoint's admission slot, the request is counted and timed once it has it
+    def run(self, endpoint, function, admit=no_admission, request=None):
+        state, client = endpoint
+        request = request or EndpointRequest()
+        with admit(client):
+            if not request.sent(state):
+                raise CancelledError()
+            start = time.perf_counter()
+            try:
+                result = function(client)
+            except BaseException as error:
+                if request.finished():
+                    self.record(state, start, error)
+                raise
+            if request.finished():
+                self.record(state, start)
+        return result
+
+    async def arun(self, endpoint, function, admit=no_admission, request=None):
+        state, client = endpoint
+        request = request or EndpointRequest()
+        async with admit(client):
+            if not request.sent(state):
+                raise asyncio.CancelledError()
+            start = time.perf_counter()
+            try:
+                result = await function(client)
+            except BaseException as error:
+                if request.finished():
+                    self.record(state, start, error)
+                raise
+            if request.finished():
+                self.record(state, start)
+        return result
+
+    def can_hedge(self):
+        return self.hedge_delay is not None and len(self.endpoints) > 1
+
+    #Seconds left before the first request is hedged, the delay counts from when it was sent. A request still waiting
+    #for its admission slot is checked again after a full delay.
+    def get_hedge_wait(self, request):
+        if request.sent_at is None:
+            return self.hedge_delay
+        return self.hedge_delay - (time.monotonic() - request.sent_at)
+
+    #Sends the request to the best endpoint, hedges it after hedge_delay and fails over to the next endpoint on errors
+    def call(self, function, admit=no_admission):
+        tried = []
+        last_error = None
+        if not self.can_hedge():
+            endpoint = self.pick(tried)
+            while endpoint is not None:
+                tried.append(endpoint[0])
+                try:
+                    return self.run(endpoint, function, admit)
+                except Exception as error:
+                    if not should_fail_over(error):
+                        raise
+                    last_error = error
+                endpoint = self.pick(tried)
+                if endpoint is not None:
+                    endpoint[0].add("failovers")
+            raise last_error
+
+        #future -> (endpoint, sent as a hedge, request)
+        pending = {}
+
+        def send(endpoint, counter=None):
+            tried.append(endpoint[0])
+            if counter is not None:
+                endpoint[0].add(counter)
+            request = EndpointRequest()
+            #The request runs in a copy of the context so its spans join the turn's trace
+            future = self.executor.submit(contextvars.copy_context().run, self.run, endpoint, function, admit, request)
+            pending[future] = (endpoint, counter == "hedges", request)
+            return request
+
+        #The requests still running are not waited for, they stop counting as their endpoints' load
+        def drop_pending():
+            for future, (_, _, request) in pending.items():
+                future.cancel()
+                request.drop()
+
+        first = send(self.pick(tried))
+        #A request is hedged once, the wait has no timeout after that
+        timeout = self.hedge_delay
+        while pending:
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                timeout = self.get_hedge_wait(first)
+                if first.sent_at is None or timeout > 0:
+                    continue
+                #No answer after the hedge delay: the same request goes to another endpoint, once
+                endpoint = self.pick(tried)
+                if endpoint is not None:
+                    send(endpoint, "hedges")
+                timeout = None
+                continue
+
+            for future in done:
+                endpoint, hedged, _ = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    drop_pending()
+                    if hedged:
+                        endpoint[0].add("hedge_wins")
+                    return future.result()
+                if not should_fail_over(error):
+                    drop_pending()
+                    raise error
+                last_error = error
+
+            if not pending:
+                endpoint = self.pick(tried)
+                if endpoint is not None:
+                    first = send(endpoint, "failovers")
+        raise last_error
+
+    async def acall(self, function, admit=no_admission):
+        tried = []
+        last_error = None
+        #task -> (endpoint, sent as a hedge)
+        pending = {}
+
+        def send(endpoint, counter=None):
+            tried.append(endpoint[0])
+            if counter is not None:
+                endpoint[0].add(counter)
+            request = EndpointRequest()
+            task = asyncio.ensure_future(self.arun(endpoint, function, admit, request))
+            #The loser's error (or cancellation) is not awaited by anyone
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            pending[task] = (endpoint, counter == "hedges")
+            return request
+
+        first = send(self.pick(tried))
+        timeout = self.hedge_delay if self.can_hedge() else None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    timeout = self.get_hedge_wait(first)
+                    if first.sent_at is None or timeout > 0:
+                        continue
+                    endpoint = self.pick(tried)
+                    if endpoint is not None:
+                        send(endpoint, "hedges")
+                    timeout = None
+                    continue
+
+                for task in done:
+                    endpoint, hedged = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedged:
+                            endpoint[0].add("hedge_wins")
+                        return task.result()
+                    if not should_fail_over(error):
+                        raise error
+                    last_error = error
+
+                if not pending:
+                    endpoint = self.pick(tried)
+                    if endpoint is not None:
+                        first = send(endpoint, "failovers")
+            raise last_error
+        finally:
+            #The losing request, or every request when the caller is cancelled
+            for task in pending:
+                task.cancel()
+
+    #The client of the endpoint a stream goes to, held until the stream is over
+    @contextmanager
+    def pick_client(self, admit=no_admission):
+        state, client = self.pick()
+        with admit(client):
+            state.started()
+            start = time.perf_counter()
+            try:
+                yield client
+            except BaseException as error:
+                self.record(state, start, error)
+                raise
+            self.record(state, start)
+
+    @asynccontextmanager
+    async def apick_client(self, admit=no_admission):
+        state, client = self.pick()
+        async with admit(client):
+            state.started()
+            start = time.perf_counter()
+            try:
+                yield client
+            except BaseException as error:
+                self.record(state, start, error)
+                raise
+            self.record(state, start)
+
+    #The registry closes the endpoints' own clients
+    def close(self):
+        pass
+
+    def get_stats(self):
+        return {state.url: state.get_stats() for state, _ in self.endpoints}
+
+#Calls function with the client, or with the client of the best endpoint when it is a BalancedClient, once admit has
+#given it a slot of that endpoint
+def call(client, function, admit=no_admission):
+    if isinstance(client, BalancedClient):
+        return client.call(function, admit)
+    with admit(client):
+        return function(client)
+
+async def acall(client, function, admit=no_admission):
+    if isinstance(client, BalancedClient):
+        return await client.acall(function, admit)
+    async with admit(client):
+        return await function(client)
+
+@contextmanager
+def pick_client(client, admit=no_admission):
+    if not isinstance(client, BalancedClient):
+        with admit(client):
+            yield client
+        return
+    with client.pick_client(admit) as endpoint_client:
+        yield endpoint_client
+
+@asynccontextmanager
+async def apick_client(client, admit=no_admission):
+    if not isinstance(client, BalancedClient):
+        async with admit(client):
+            yield client
+        return
+    async with client.apick_client(admit) as endpoint_client:
+        yield endpoint_client
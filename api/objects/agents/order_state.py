@@ -0,0 +1,162 @@
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+#The menu the OrderTakingAgent sells from. It is shown to the model as is and parsed into the price table,
+#so the prices the model sees and the totals computed locally can not drift apart.
+MENU = """
+Cappuccino - $4.50
+Jumbo Savory Scone - $3.25
+Latte - $4.75
+Chocolate Chip Biscotti - $2.50
+Espresso shot - $2.00
+Hazelnut Biscotti - $2.75
+Chocolate Croissant - $3.75
+Dark chocolate (Drinking Chocolate) - $5.00
+Cranberry Scone - $3.50
+Croissant - $3.25
+Almond Croissant - $4.00
+Ginger Biscotti - $2.50
+Oatmeal Scone - $3.25
+Ginger Scone - $3.50
+Chocolate syrup - $1.50
+Hazelnut syrup - $1.50
+Carmel syrup - $1.50
+Sugar Free Vanilla syrup - $1.50
+Dark chocolate (Packaged Chocolate) - $3.00
+"""
+
+#Returns {item name: unit price} from "name - $price" lines
+def parse_menu(menu_text):
+    prices = {}
+    for line in menu_text.splitlines():
+        match = re.match(r"\s*(.+?)\s+-\s+\$(\d+(?:\.\d+)?)\s*$", line)
+        if match:
+            prices[match.group(1)] = Decimal(match.group(2))
+    return prices
+
+def format_price(price):
+    return f"{price:.2f}"
+
+#Item names as the model writes them ("latte", "Lattes", "Dark chocolate") mapped to menu names
+class Menu():
+    def __init__(self, menu_text=MENU):
+        self.text = menu_text
+        self.prices = parse_menu(menu_text)
+
+        self.aliases = {}
+        for name in self.prices:
+            self.aliases.setdefault(self.normalize(name), name)
+            #"Dark chocolate (Drinking Chocolate)" is also ordered as "Dark chocolate", the first one listed wins
+            self.aliases.setdefault(self.normalize(re.sub(r"\s*\(.*\)", "", name)), name)
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(str(name).lower().split())
+
+    #Returns the menu name of an item, None when it is not on the menu
+    def resolve(self, name):
+        name = self.normalize(name)
+        if name in self.aliases:
+            return self.aliases[name]
+        if name.endswith("s") and name[:-1] in self.aliases:
+            return self.aliases[name[:-1]]
+        return None
+
+@dataclass
+class OrderItem():
+    item: str
+    quantity: int
+    unit_price: Decimal
+
+    @property
+    def price(self):
+        return self.unit_price * self.quantity
+
+    #Same shape as the order the model used to return, which the app reads to fill the cart
+    def to_memory(self):
+        return {"item": self.item, "quantity": self.quantity, "price": format_price(self.price)}
+
+#The order of one conversation. It is carried from turn to turn in the memory of the OrderTakingAgent's messages,
+#the model only reports which items and quantities are ordered, prices and the total come from the menu.
+@dataclass
+class OrderState():
+    step_number: str = "1"
+    items: list = field(default_factory=list)
+    asked_recommendation_before: bool = False
+
+    @property
+    def total(self):
+        return sum((item.price for item in self.items), Decimal("0"))
+
+    #Rebuilds the state from the memory of an OrderTakingAgent message
+    @classmethod
+    def from_memory(cls, memory, menu):
+        state = cls(step_number=str(memory.get("step number", "1")),
+                    asked_recommendation_before=bool(memory.get("asked_recommendation_before", False)))
+        state.set_items(memory.get("order", []), menu)
+        return state
+
+    #The session's order kept by the session store (Conversation.order_memory), otherwise the state of the last
+    #OrderTakingAgent message in the messages
+    @classmethod
+    def of(cls, messages, menu):
+        order_memory = getattr(messages, "order_memory", None)
+        if order_memory is not None:
+            return cls.from_memory(order_memory, menu)
+        return cls.from_messages(messages, menu)
+
+    #The state of the last OrderTakingAgent message in the conversation, a new order when there is none
+    @classmethod
+    def from_messages(cls, messages, menu):
+        for message in reversed(messages):
+            memory = message.get("memory", {})
+            if message["role"] == "assistant" and memory.get("agent", "") == "order_taking_agent":
+                return cls.from_memory(memory, menu)
+        return cls()
+
+    #Replaces the items with the order the model returned, priced from the menu.
+    #Items that are not on the menu are dropped and the same item ordered twice is merged.
+    def set_items(self, order, menu):
+        items = {}
+        for entry in order or []:
+            if not isinstance(entry, dict):
+                continue
+            name = menu.resolve(entry.get("item", ""))
+            if name is None:
+                continue
+            quantity = parse_quantity(entry.get("quantity", entry.get("quanitity", 1)))
+            if quantity <= 0:
+                continue
+            if name in items:
+                items[name].quantity += quantity
+            else:
+                items[name] = OrderItem(name, quantity, menu.prices[name])
+        self.items = list(items.values())
+
+    def to_memory(self):
+        return {
+            "step number": self.step_number,
+            "order": [item.to_memory() for item in self.items],
+            "total": format_price(self.total),
+            "asked_recommendation_before": self.asked_recommendation_before,
+        }
+
+    #The state as the model sees it at the start of the user's message
+    def render(self):
+        if not self.items:
+            order = "empty"
+        else:
+            order = "; ".join(f"{item.quantity} x {item.item} (${format_price(item.price)})" for item in self.items)
+        return f"step number: {self.step_number}\norder: {order}\ntotal: ${format_price(self.total)}"
+
+    #The order summary appended to the model's closing message, so the customer always sees the computed prices
+    def render_summary(self):
+        lines = [f"- {item.quantity} x {item.item}: ${format_price(item.price)}" for item in self.items]
+        return "\n".join(lines + [f"Total: ${format_price(self.total)}"])
+
+def parse_quantity(value):
+    try:
+        return int(Decimal(str(value).strip()))
+    except (InvalidOperation, ValueError):
+        return 1
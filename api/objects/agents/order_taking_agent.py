@@ -1,56 +1,44 @@
+from .utils import get_chatbot_response,async_get_chatbot_response
+from .json_repair import parse_json_output, async_parse_json_output
+from .client_registry import get_default_registry
+from .generation_profile import GenerationProfile
+from .order_state import Menu, OrderState
+from .conversation import Conversation
+from .prompt_templates import PromptTemplate
 import os
-import json
-from .utils import get_chatbot_response,jsonValidation
-from openai import OpenAI
-from copy import deepcopy
-from dotenv import load_dotenv
-load_dotenv()
 
 
 class OrderTakingAgent():
-    def __init__(self, recommendation_agent):
-        self.client = OpenAI(
-            api_key=os.getenv("RUNPOD_TOKEN"),
-            base_url=os.getenv("RUNPOD_CHATBOT_URL"),
-        )
-        self.model_name = os.getenv("MODEL_NAME")
-
+    def __init__(self, recommendation_agent, client_registry=None, menu=None, history_window=None, profile=None):
+        client_registry = client_registry or get_default_registry()
+        #Model, endpoint, max_tokens and temperature from the ORDER_TAKING_* variables
+        self.profile = profile or GenerationProfile.from_env("ORDER_TAKING", client_registry)
+        #Async client for the async pipeline (aget_response)
+        self.client, self.async_client = self.profile.get_clients(client_registry)
+        self.model_name = self.profile.model_name
+
+        #The menu the order is validated and priced against
+        self.menu = menu or Menu()
+        #Only the order state and this many recent messages are sent to the model, whatever the conversation length
+        self.history_window = history_window or int(os.getenv("ORDER_HISTORY_WINDOW", "6"))
 
         self.recommendation_agent = recommendation_agent
-    
-    def get_response(self,messages):
-        messages = deepcopy(messages)
 
+        #The system prompt with the menu is compiled once, the order state goes in the last user message after it
+        self.prompt = PromptTemplate("order_taking", self.get_system_prompt())
+
+    def get_system_prompt(self):
         # Designing the system prompt to guide the order taking agent
-        system_prompt = """
+        return """
             You are a customer support Bot for a coffee shop called "Joy's Cafe."
 
             here is the menu for this coffee shop.
-
-            Cappuccino - $4.50
-            Jumbo Savory Scone - $3.25
-            Latte - $4.75
-            Chocolate Chip Biscotti - $2.50
-            Espresso shot - $2.00
-            Hazelnut Biscotti - $2.75
-            Chocolate Croissant - $3.75
-            Dark chocolate (Drinking Chocolate) - $5.00
-            Cranberry Scone - $3.50
-            Croissant - $3.25
-            Almond Croissant - $4.00
-            Ginger Biscotti - $2.50
-            Oatmeal Scone - $3.25
-            Ginger Scone - $3.50
-            Chocolate syrup - $1.50
-            Hazelnut syrup - $1.50
-            Carmel syrup - $1.50
-            Sugar Free Vanilla syrup - $1.50
-            Dark chocolate (Packaged Chocolate) - $3.00
-
+            """ + self.menu.text + """
             Things to NOT DO:
             * DON't ask how to pay by cash or Card.
             * Don't tell the user to go to the counter
             * Don't tell the user to go to place to get the order
+            * Don't write prices or totals, they are computed from the menu and added to your response
 
 
             You're task is as follows:
@@ -59,87 +47,141 @@ class OrderTakingAgent():
             3. if an item is not in the menu let the user and repeat back the remaining valid order
             4. Ask them if they need anything else.
             5. If they do then repeat starting from step 3
-            6. If they don't want anything else. Using the "order" object that is in the output. Make sure to hit all three points
-                1. list down all the items and their prices
-                2. calculate the total. 
-                3. Thank the user for the order and close the conversation with no more questions
+            6. If they don't want anything else, set "order complete" to "yes", thank the user for the order and close the conversation with no more questions.
+               The list of items with their prices and the total are added after your response.
 
-            The user message will contain a section called memory. This section will contain the following:
-            "order"
+            The user message will start with the current state of the order:
             "step number"
-            please utilize this information to determine the next step in the process.
+            "order"
+            please utilize this information to determine the next step in the process, it is more recent than the earlier messages.
             
             produce the following output without any additions, not a single letter outside of the structure bellow.
             Your output should be in a structured json format like so. each key is a string and each value is a string. Make sure to follow the format exactly:
             {
             "chain of thought": Write down your critical thinking about what is the maximum task number the user is on write now. Then write down your critical thinking about the user input and it's relation to the coffee shop process. Then write down your thinking about how you should respond in the response parameter taking into consideration the Things to NOT DO section. and Focus on the things that you should not do. 
             "step number": Determine which task you are on based on the conversation.
-            "order": this is going to be a list of jsons like so. [{"item":put the item name, "quanitity": put the number that the user wants from this item, "price":put the total price of the item }]
+            "order": this is going to be the full updated order, a list of jsons like so. [{"item":put the item name exactly as on the menu, "quantity": put the number that the user wants from this item}]
+            "order complete": "yes" if the user does not want anything else, otherwise "no"
             "response": write the a response to the user
             }
         """
 
-        last_order_taking_status = ""
-        asked_recommendation_before = False
+    #Builds the messages sent to the llm: the system prompt, then a bounded window of recent messages whose last one
+    #starts with the order state. Returns them with the window they were built from and the state.
+    def get_input_messages(self,messages):
+        messages = Conversation.of(messages)
+        state = OrderState.of(messages, self.menu)
 
-        #Looping over all the messages starting from the last one to find the last order taking status
-        for message_index in range(len(messages)-1,0,-1):
-            message = messages[message_index]
-            
-            #Retrieve the agent name from the message memory
-            agent_name = message.get("memory",{}).get("agent","")
+        #A view of the window whose last message starts with the order state, nothing is copied
+        recent_messages = messages[-self.history_window:]
+        recent_messages = recent_messages.with_last_content(state.render() + " \n "+ recent_messages[-1]['content'])
 
-            #We only care about the last order taking agent message, and we are retireving the way we have post processed the llm output
-            if message["role"] == "assistant" and agent_name == "order_taking_agent":
-                step_number = message["memory"]["step number"]
-                order = message["memory"]["order"]
-                asked_recommendation_before = message["memory"]["asked_recommendation_before"]
-                last_order_taking_status = f"""
-                step number: {step_number}
-                order: {order}
-                """
-                break
+        input_messages = self.prompt.get_messages(recent_messages.to_messages())
 
-        messages[-1]['content'] = last_order_taking_status + " \n "+ messages[-1]['content']
+        return input_messages, recent_messages, state
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages        
+    #Applies the model's output to the order state and returns the response to show
+    def update_state(self,state,output):
+        state.step_number = str(output.get("step number", state.step_number))
+        state.set_items(output.get("order", []), self.menu)
 
-        chatbot_output = get_chatbot_response(self.client,self.model_name,input_messages)
+        response = output['response']
+        if str(output.get("order complete", "no")).strip().lower() in ("yes", "true") and state.items:
+            response += "\n\n" + state.render_summary()
+        return response
 
-        # double check json 
-        chatbot_output = jsonValidation(self.client,self.model_name,chatbot_output)
+    def get_response(self,messages):
+        input_messages, messages, state = self.get_input_messages(messages)
 
-        output = self.postprocess(chatbot_output,messages,asked_recommendation_before)
+        chatbot_output = get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
 
-        return output
+        # double check json, the llm is only asked to fix it when the local repair fails
+        chatbot_output = parse_json_output(chatbot_output,self.client,self.model_name)
 
-    def postprocess(self,output,messages,asked_recommendation_before):
-        output = json.loads(output)
+        output = self.parse_output(chatbot_output)
+        response = self.update_state(state,output)
 
-        if type(output["order"]) == str:
-            output["order"] = json.loads(output["order"])
+        #If the user has not asked for recommendations before, we will ask the recommendation agent to get recommendations based on the order
+        if not state.asked_recommendation_before and len(state.items)>0:
+            recommendation_output = self.recommendation_agent.get_recommendations_from_order(messages,state.to_memory()['order'])
+            response = recommendation_output['content']
+            state.asked_recommendation_before = True
 
-        response = output['response']
+        return self.postprocess(state,response)
 
-        #If the user has not asked for recommendations before, we will ask the recommendation agent to get recommendations based on the order
-        if not asked_recommendation_before and len(output["order"])>0:
-            recommendation_output = self.recommendation_agent.get_recommendations_from_order(messages,output['order'])
+    async def aget_response(self,messages):
+        input_messages, messages, state = self.get_input_messages(messages)
+
+        chatbot_output = await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        chatbot_output = await async_parse_json_output(chatbot_output,self.async_client,self.model_name)
+
+        output = self.parse_output(chatbot_output)
+        response = self.update_state(state,output)
+
+        if not state.asked_recommendation_before and len(state.items)>0:
+            recommendation_output = await self.recommendation_agent.aget_recommendations_from_order(messages,state.to_memory()['order'])
             response = recommendation_output['content']
-            asked_recommendation_before = True
+            state.asked_recommendation_before = True
+
+        return self.postprocess(state,response)
+
+    #Streaming version of get_response. The order itself is a json completion and is fetched whole, the
+    #recommendations made from the order are streamed. Without them the response is yielded as a single piece.
+    def get_response_stream(self,messages):
+        input_messages, messages, state = self.get_input_messages(messages)
+
+        chatbot_output = get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        chatbot_output = parse_json_output(chatbot_output,self.client,self.model_name)
+
+        output = self.parse_output(chatbot_output)
+        response = self.update_state(state,output)
+
+        if not state.asked_recommendation_before and len(state.items)>0:
+            for chunk in self.recommendation_agent.get_recommendations_from_order_stream(messages,state.to_memory()['order']):
+                if "delta" in chunk:
+                    yield chunk
+                else:
+                    response = chunk['content']
+            state.asked_recommendation_before = True
+        else:
+            yield {"delta": response}
+
+        yield self.postprocess(state,response)
 
+    async def aget_response_stream(self,messages):
+        input_messages, messages, state = self.get_input_messages(messages)
 
-        #Constructing the final output dictionary with the required structure
+        chatbot_output = await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        chatbot_output = await async_parse_json_output(chatbot_output,self.async_client,self.model_name)
+
+        output = self.parse_output(chatbot_output)
+        response = self.update_state(state,output)
+
+        if not state.asked_recommendation_before and len(state.items)>0:
+            async for chunk in self.recommendation_agent.aget_recommendations_from_order_stream(messages,state.to_memory()['order']):
+                if "delta" in chunk:
+                    yield chunk
+                else:
+                    response = chunk['content']
+            state.asked_recommendation_before = True
+        else:
+            yield {"delta": response}
+
+        yield self.postprocess(state,response)
+
+    def parse_output(self,output):
+        if type(output["order"]) == str:
+            output["order"] = parse_json_output(output["order"])
+        return output
+
+    def postprocess(self,state,response):
+        #Constructing the final output dictionary with the required structure, the order state is kept in the memory
         dict_output = {
             "role": "assistant",
             "content": response ,
             "memory": {"agent":"order_taking_agent",
-                       "step number": output["step number"],
-                       "order": output["order"],
-                       "asked_recommendation_before": asked_recommendation_before
+                       **state.to_memory()
                       }
         }
 
-        
         return dict_output
-
-    
\ No newline at end of file
@@ -0,0 +1,55 @@
+import threading
+
+#System prompts compiled once when an agent is built instead of being rebuilt on every call.
+#A compiled prompt is the same string for every request, so it is a byte-identical prefix of the input that an
+#OpenAI-compatible backend with prefix caching (vLLM --enable-prefix-caching) keeps in its KV cache; everything that
+#changes per turn (order state, retrieved contexts, the conversation) goes in the messages after it.
+#The prompts are written indented inside the agents' methods, compiling strips that indentation and the blank line runs,
+#which are sent (and prefilled) as tokens on every call otherwise.
+
+#name -> the last PromptTemplate compiled under that name, for get_prompt_stats()
+prompt_templates = {}
+prompt_templates_lock = threading.Lock()
+
+#Strips the indentation and trailing spaces of every line and keeps at most one blank line in a row
+def compile_prompt(text):
+    lines = []
+    for line in text.strip().splitlines():
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+#Tokens of a prompt with tiktoken's cl100k_base when it is installed, otherwise estimated at 4 characters per token.
+#The deployed model has its own tokenizer, the counts are meant to compare prompts, not to bill them.
+#The first call downloads the encoding, so it is only made for the stats (get_prompt_stats), never while the agents are
+#built or serve a request.
+def count_tokens(text):
+    try:
+        import tiktoken
+    except ImportError:
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+class PromptTemplate():
+    def __init__(self, name, system_prompt):
+        self.name = name
+        self.system_prompt = compile_prompt(system_prompt)
+        #What the prompt cost before compiling, reported next to the compiled count
+        self.source_prompt = system_prompt
+
+        with prompt_templates_lock:
+            prompt_templates[name] = self
+
+    #The system message followed by the turn's messages, the prompt string itself is shared by every call
+    def get_messages(self, messages):
+        return [{"role": "system", "content": self.system_prompt}] + messages
+
+    def get_stats(self):
+        return {"characters": len(self.system_prompt), "tokens": count_tokens(self.system_prompt),
+                "source_tokens": count_tokens(self.source_prompt)}
+
+#Token counts of every compiled system prompt
+def get_prompt_stats():
+    with prompt_templates_lock:
+        return {name: template.get_stats() for name, template in prompt_templates.items()}
@@ -1,108 +1,133 @@
-import json
-import pandas as pd
 import os
-from .utils import get_chatbot_response, jsonValidation
-from openai import OpenAI
-from copy import deepcopy
-from dotenv import load_dotenv
-load_dotenv()
-
+import time
+import logging
+import threading
+from .utils import get_chatbot_response, async_get_chatbot_response, get_chatbot_response_stream, async_get_chatbot_response_stream
+from .json_repair import parse_json_output, async_parse_json_output
+from .recommendation_store import load_indexes
+from .client_registry import get_default_registry
+from .generation_profile import GenerationProfile
+from .conversation import Conversation
+from .prompt_templates import PromptTemplate
+from . import tracing
+
+logger = logging.getLogger("brewbot.recommendation")
 
 class RecommendationAgent():
-    def __init__(self,apriori_recommendation_path,popular_recommendation_path):
-
-        #Load the client with the runpod api key and the deployed chatbot url
-        self.client = OpenAI(
-            api_key=os.getenv("RUNPOD_TOKEN"),
-            base_url=os.getenv("RUNPOD_CHATBOT_URL"),
-        )
-        self.model_name = os.getenv("MODEL_NAME")
-
-        #Store the recommendations data from the file that was generated using the apriori algorithm
-        with open(apriori_recommendation_path, 'r') as file:
-            self.apriori_recommendations = json.load(file)
-
-        #Store the popular recommendations data from the file that was generated using the popularity algorithm
-        self.popular_recommendations = pd.read_csv(popular_recommendation_path)
-        #Read the products and product categories from the popular recommendations dataframe
-        self.products = self.popular_recommendations['product'].tolist()
-        self.product_categories = self.popular_recommendations['product_category'].tolist()
-    
-    # Function to get the apriori recommendations based on the products that are provided
-    def get_apriori_recommendation(self,products,top_k=5):
-        recommendation_list = []
+    def __init__(self,apriori_recommendation_path,popular_recommendation_path,client_registry=None,snapshot_path=None,profile=None):
+
+        #Get the shared client for the deployed chatbot url from the client registry
+        client_registry = client_registry or get_default_registry()
+        #Model, endpoint, max_tokens and temperature from the RECOMMENDATION_* variables
+        self.profile = profile or GenerationProfile.from_env("RECOMMENDATION", client_registry)
+        #Async client for the async pipeline (aget_response)
+        self.client, self.async_client = self.profile.get_clients(client_registry)
+        self.model_name = self.profile.model_name
+
+        self.apriori_recommendation_path = apriori_recommendation_path
+        self.popular_recommendation_path = popular_recommendation_path
+        self.snapshot_path = snapshot_path
+
+        #The files are checked for changes at most every RECOMMENDATION_RELOAD_INTERVAL seconds (0 turns it off),
+        #so the artifacts updated by build_recommendation_data.py are picked up without restarting the worker
+        self.reload_interval = float(os.getenv("RECOMMENDATION_RELOAD_INTERVAL", "60"))
+        self.reload_lock = threading.Lock()
+        self.next_reload_check = time.monotonic() + self.reload_interval
+        #Files found missing by the last check, warned about once until they are back
+        self.missing_sources = set()
+        self.source_versions = self.get_source_versions()
+        self.load_recommendation_data()
+
+        #The system prompts of the answers are compiled once, the recommended items go in the last user message after them
+        self.recommendation_prompt = PromptTemplate("recommendation", """
+        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
+        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
 
-        #Check whichever products is there in the apriori recommendations list, then add the recommendations to the recommendation list
-        for product in products:
-            if product in self.apriori_recommendations:
-                recommendation_list += self.apriori_recommendations[product]
-        
-        # Sort recommendation list by "confidence" to have the most confident recommendations first
-        recommendation_list = sorted(recommendation_list,key=lambda x: x['confidence'],reverse=True)
+        I will provide what items you should recommend to the user based on their order in the user message. 
+        """)
+        self.order_recommendation_prompt = PromptTemplate("order_recommendation", """
+        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
+        your task is to recommend items to the user based on their order.
 
-        recommendations = []
-        recommendations_per_category = {}
-
-        # Iterate through the sorted recommendation list and add recommendations to the final list having k recommendations
-        for recommendation in recommendation_list:
-            # If Duplicated recommendations then skip
-            if recommendation in recommendations:
-                continue 
-
-            # Fetch the product category and check if it is not in the recommendations_per_category dictionary
-            # If it is already in the dictionary and the count is greater than or equal to 2 then skip the recommendation
-            product_category = recommendation['product_category']
-            if product_category not in recommendations_per_category:
-                recommendations_per_category[product_category] = 0
-            
-            if recommendations_per_category[product_category] >= 2:
+        I will provide what items you should recommend to the user based on their order in the user message. 
+        """)
+
+    #Store the recommendations data from the files that were generated using the apriori and popularity algorithms.
+    #With a fresh snapshot (build_recommendation_snapshot.py) the compiled indexes are unpickled instead of rebuilt.
+    def load_recommendation_data(self):
+        apriori_index, popularity_index = load_indexes(self.apriori_recommendation_path,
+                                                       self.popular_recommendation_path,
+                                                       self.snapshot_path)
+        self.apriori_index, self.popularity_index = apriori_index, popularity_index
+        #Read the products and product categories from the popular recommendations file
+        self.products = popularity_index.products
+        self.product_categories = popularity_index.product_categories
+        #The classification prompt lists the catalog, so it is compiled again whenever the data is (re)loaded
+        self.classification_prompt = PromptTemplate("recommendation_classification", self.get_classification_system_prompt())
+
+    #(mtime, size) of both files, None when one is missing (a worker shipping only the snapshot, or a wrong path:
+    #nothing is reloaded then, so it is logged)
+    def get_source_versions(self):
+        versions = []
+        missing = set()
+        for path in (self.apriori_recommendation_path, self.popular_recommendation_path):
+            try:
+                stat = os.stat(path)
+            except OSError as error:
+                missing.add(path)
+                if path not in self.missing_sources:
+                    logger.warning("Recommendation source %s is missing, it will not be reloaded: %s", path, error)
                 continue
-
-            recommendations_per_category[product_category]+=1
-
-            # Add recommendation
-            recommendations.append(recommendation['product'])
-
-            if len(recommendations) >= top_k:
-                break
-
-        return recommendations 
+            versions.append((stat.st_mtime_ns, stat.st_size))
+        self.missing_sources = missing
+        return None if missing else versions
+
+    #Rebuilds the indexes when the files changed since they were loaded. Checking is two stat calls, and while one
+    #thread reloads the others keep answering with the previous indexes.
+    def reload_if_changed(self):
+        if self.reload_interval <= 0 or time.monotonic() < self.next_reload_check:
+            return False
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.next_reload_check = time.monotonic() + self.reload_interval
+            source_versions = self.get_source_versions()
+            if source_versions is None or source_versions == self.source_versions:
+                return False
+            self.load_recommendation_data()
+            self.source_versions = source_versions
+            return True
+        finally:
+            self.reload_lock.release()
+    
+    # Function to get the apriori recommendations based on the products that are provided
+    # The rules are compiled into an AprioriIndex at load time, so this only walks the best rules of each product
+    def get_apriori_recommendation(self,products,top_k=5):
+        return self.apriori_index.recommend(products, top_k=top_k)
 
 
     #Function to generate the popular recommendations according to the product categories
     #If the product categories are not provided then it will return the top k popular recommendations
     def get_popular_recommendation(self,product_categories=None,top_k=5):
-        recommendations_df = self.popular_recommendations
-        
         #If there is only one product category provided then we put it in a list for the further processing part
         if type(product_categories) == str:
             product_categories = [product_categories]
 
-        #Retrieve the product recommendations based on the product categories that are provided and sort them by the number of transactions
-        if product_categories is not None:
-            recommendations_df = self.popular_recommendations[self.popular_recommendations['product_category'].isin(product_categories)]
-        recommendations_df = recommendations_df.sort_values(by='number_of_transactions',ascending=False)
-        
-        #If there are no recommendations then return an empty list
-        if recommendations_df.shape[0] == 0:
-            return []
+        #The rankings are compiled at load time, so this is a slice (or a merge for several categories)
+        return self.popularity_index.recommend(product_categories, top_k=top_k)
 
-        #Get the top k recommendations from the recommendations dataframe
-        recommendations = recommendations_df['product'].tolist()[:top_k]
-        return recommendations
-
-    #Function to classify the type of recommendation that is needed based on the user's message
-    def recommendation_classification(self,messages):
-        system_prompt = """ You are a helpful AI assistant for a coffee shop application which serves drinks and pastries. We have 3 types of recommendations:
+    #The popularity file has a row per product and category, every product and category is listed once
+    def get_classification_system_prompt(self):
+        return """ You are a helpful AI assistant for a coffee shop application which serves drinks and pastries. We have 3 types of recommendations:
 
         1. Apriori Recommendations: These are recommendations based on the user's order history. We recommend items that are frequently bought together with the items in the user's order.
         2. Popular Recommendations: These are recommendations based on the popularity of items in the coffee shop. We recommend items that are popular among customers.
         3. Popular Recommendations by Category: Here the user asks to recommend them product in a category. Like what coffee do you recommend me to get?. We recommend items that are popular in the category of the user's requested category.
         
         Here is the list of items in the coffee shop:
-        """+ ",".join(self.products) + """
+        """+ ",".join(dict.fromkeys(self.products)) + """
         Here is the list of Categories we have in the coffee shop:
-        """ + ",".join(self.product_categories) + """
+        """ + ",".join(dict.fromkeys(self.product_categories)) + """
 
         Your task is to determine which type of recommendation to provide based on the user's message.
 
@@ -114,43 +139,49 @@ class RecommendationAgent():
         }
         """
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+    #Builds the messages used to classify the type of recommendation that is needed based on the user's message
+    def get_classification_messages(self,messages):
+        self.reload_if_changed()
+        return self.classification_prompt.get_messages(Conversation.of(messages)[-3:].to_messages())
+
+    #Function to classify the type of recommendation that is needed based on the user's message
+    def recommendation_classification(self,messages):
+        input_messages = self.get_classification_messages(messages)
 
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
-        chatbot_output = jsonValidation(self.client,self.model_name,chatbot_output)
+        with tracing.span("recommendation_classification"):
+            chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+            #Parse the json locally, the llm is only asked to fix it when the local repair fails
+            chatbot_output = parse_json_output(chatbot_output,self.client,self.model_name)
         output = self.postprocess_classfication(chatbot_output)
         return output
 
-    def get_response(self,messages):
-        messages = deepcopy(messages)
+    async def arecommendation_classification(self,messages):
+        input_messages = self.get_classification_messages(messages)
 
-        #First we classify the type of recommendation that is needed based on the user's message
-        recommendation_classification = self.recommendation_classification(messages)
+        with tracing.span("recommendation_classification"):
+            chatbot_output =await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+            chatbot_output = await async_parse_json_output(chatbot_output,self.async_client,self.model_name)
+        output = self.postprocess_classfication(chatbot_output)
+        return output
+
+    #Based on the recommendation type we get the recommendations from the respective function
+    def get_classified_recommendations(self,recommendation_classification):
         recommendation_type = recommendation_classification['recommendation_type']
         recommendations = []
 
-        #Based on the recommendation type we get the recommendations from the respective function
         if recommendation_type == "apriori":
             recommendations = self.get_apriori_recommendation(recommendation_classification['parameters'])
         elif recommendation_type == "popular":
             recommendations = self.get_popular_recommendation()
         elif recommendation_type == "popular by category":
             recommendations = self.get_popular_recommendation(recommendation_classification['parameters'])
-        
-        # If there are no recommendations then return a message saying that we can't help with that
-        if recommendations == []:
-            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
-        
+        return recommendations
+
+    def get_recommendation_messages(self,messages,recommendations):
+        messages = Conversation.of(messages)
+
         # Respond to User
         recommendations_str = ", ".join(recommendations)
-        
-        #Creating a system prompt for the chatbot to recommend items based on the user's order with a small description
-        system_prompt = f"""
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
-
-        I will provide what items you should recommend to the user based on their order in the user message. 
-        """
 
         prompt = f"""
         {messages[-1]['content']}
@@ -158,27 +189,103 @@ class RecommendationAgent():
         Please recommend me those items exactly: {recommendations_str}
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        # The prompt replaces the last message in a new view, the conversation itself is left untouched
+        messages = messages.with_last_content(prompt)
+        return self.recommendation_prompt.get_messages(messages[-3:].to_messages())
+
+    #The classification call and the recommendation lookup, everything before the final completion.
+    #The AgentController's speculative mode runs it while the guard is still deciding.
+    def prefetch(self,messages):
+        recommendation_classification = self.recommendation_classification(messages)
+        return {"recommendations": self.get_classified_recommendations(recommendation_classification)}
+
+    async def aprefetch(self,messages):
+        recommendation_classification = await self.arecommendation_classification(messages)
+        return {"recommendations": self.get_classified_recommendations(recommendation_classification)}
+
+    #prefetched is the result of prefetch() for the same messages, the classification is skipped when it is given
+    def get_response(self,messages,prefetched=None):
+        #First we classify the type of recommendation that is needed based on the user's message
+        recommendations = (prefetched or self.prefetch(messages))["recommendations"]
+        
+        # If there are no recommendations then return a message saying that we can't help with that
+        if recommendations == []:
+            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
+        
+        input_messages = self.get_recommendation_messages(messages,recommendations)
+
+        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    async def aget_response(self,messages,prefetched=None):
+        recommendations = (prefetched or await self.aprefetch(messages))["recommendations"]
 
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        if recommendations == []:
+            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
+
+        input_messages = self.get_recommendation_messages(messages,recommendations)
+
+        chatbot_output =await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
         output = self.postprocess(chatbot_output)
 
         return output
 
+    #Streaming version of get_response: the classification is fetched whole, the recommendation message is yielded
+    #as {"delta": text} pieces while it is generated, followed by the final message
+    def get_response_stream(self,messages,prefetched=None):
+        recommendations = (prefetched or self.prefetch(messages))["recommendations"]
+
+        if recommendations == []:
+            content = "Sorry, I can't help with that. Can I help you with your order?"
+            yield {"delta": content}
+            yield {"role": "assistant", "content": content}
+            return
+
+        input_messages = self.get_recommendation_messages(messages,recommendations)
+        yield from self.stream_completion(input_messages)
+
+    async def aget_response_stream(self,messages,prefetched=None):
+        recommendations = (prefetched or await self.aprefetch(messages))["recommendations"]
+
+        if recommendations == []:
+            content = "Sorry, I can't help with that. Can I help you with your order?"
+            yield {"delta": content}
+            yield {"role": "assistant", "content": content}
+            return
+
+        input_messages = self.get_recommendation_messages(messages,recommendations)
+        async for chunk in self.astream_completion(input_messages):
+            yield chunk
+
+    #Yields the pieces of a recommendation completion and then its postprocessed message
+    def stream_completion(self,input_messages):
+        chatbot_output = ""
+        for delta in get_chatbot_response_stream(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens):
+            chatbot_output += delta
+            yield {"delta": delta}
+        yield self.postprocess(chatbot_output)
+
+    async def astream_completion(self,input_messages):
+        chatbot_output = ""
+        async for delta in async_get_chatbot_response_stream(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens):
+            chatbot_output += delta
+            yield {"delta": delta}
+        yield self.postprocess(chatbot_output)
 
     #Function to postprocess the recommendation classification llm output to have the type and parameters of the recommendation.
     def postprocess_classfication(self,output):
-        output = json.loads(output)
-
         dict_output = {
             "recommendation_type": output['recommendation_type'],
             "parameters": output['parameters'],
         }
         return dict_output
 
-    #To generate recommendations based on whatever the user has ordered
-    def get_recommendations_from_order(self,messages,order):
+    #Builds the messages to recommend items based on whatever the user has ordered
+    def get_order_recommendation_messages(self,messages,order):
+        self.reload_if_changed()
+        messages = Conversation.of(messages)
         products = []
         #First we extract the products from the order
         for product in order:
@@ -188,27 +295,41 @@ class RecommendationAgent():
         recommendations = self.get_apriori_recommendation(products)
         recommendations_str = ", ".join(recommendations)
 
-        #And then we design a system prompt to return the recommendations to the user based on their order
-        system_prompt = f"""
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their order.
-
-        I will provide what items you should recommend to the user based on their order in the user message. 
-        """
-
         prompt = f"""
         {messages[-1]['content']}
 
         Please recommend me those items exactly: {recommendations_str}
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        # The prompt replaces the last message in a new view, the conversation itself is left untouched
+        messages = messages.with_last_content(prompt)
+        return self.order_recommendation_prompt.get_messages(messages[-3:].to_messages())
 
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+    #To generate recommendations based on whatever the user has ordered
+    def get_recommendations_from_order(self,messages,order):
+        with tracing.span("recommendations_from_order"):
+            input_messages = self.get_order_recommendation_messages(messages,order)
+            chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
         output = self.postprocess(chatbot_output)
 
         return output
+
+    async def aget_recommendations_from_order(self,messages,order):
+        with tracing.span("recommendations_from_order"):
+            input_messages = self.get_order_recommendation_messages(messages,order)
+            chatbot_output =await async_get_chatbot_response(self.async_client,self.model_name,input_messages,self.profile.temperature,self.profile.max_tokens)
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    def get_recommendations_from_order_stream(self,messages,order):
+        input_messages = self.get_order_recommendation_messages(messages,order)
+        yield from self.stream_completion(input_messages)
+
+    async def aget_recommendations_from_order_stream(self,messages,order):
+        input_messages = self.get_order_recommendation_messages(messages,order)
+        async for chunk in self.astream_completion(input_messages):
+            yield chunk
     
     def postprocess(self,output):
         output = {
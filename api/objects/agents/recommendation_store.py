@@ -0,0 +1,188 @@
+import os
+import csv
+import heapq
+import hashlib
+import json
+import pickle
+from array import array
+from itertools import islice
+
+#The apriori rules from apriori_recommendations.json compiled once at load time.
+#Product and category names are interned to small integer ids and every antecedent keeps its rules in
+#confidence order, so a lookup only walks the head of the pre-sorted lists instead of sorting all rules per call.
+class AprioriIndex():
+    def __init__(self, apriori_recommendations):
+        self.product_names = []
+        self.product_ids = {}
+        self.category_names = []
+        self.category_ids = {}
+
+        #antecedent product id -> (confidences, consequent product ids, consequent category ids), ordered by confidence
+        self.rules = {}
+        for antecedent, recommendations in apriori_recommendations.items():
+            #sorted() is stable, so rules with the same confidence keep the order they had in the file
+            recommendations = sorted(recommendations, key=lambda x: x['confidence'], reverse=True)
+            self.rules[self.intern_product(antecedent)] = (
+                array('d', [recommendation['confidence'] for recommendation in recommendations]),
+                array('I', [self.intern_product(recommendation['product']) for recommendation in recommendations]),
+                array('I', [self.intern_category(recommendation['product_category']) for recommendation in recommendations]),
+            )
+
+    def intern_product(self, product):
+        product_id = self.product_ids.get(product)
+        if product_id is None:
+            product_id = len(self.product_names)
+            self.product_ids[product] = product_id
+            self.product_names.append(product)
+        return product_id
+
+    def intern_category(self, category):
+        category_id = self.category_ids.get(category)
+        if category_id is None:
+            category_id = len(self.category_names)
+            self.category_ids[category] = category_id
+            self.category_names.append(category)
+        return category_id
+
+    #Yields (-confidence, position, product id, category id) of one antecedent's rules, best first
+    @staticmethod
+    def iterate_rules(rules, position):
+        confidences, product_ids, category_ids = rules
+        for index in range(len(confidences)):
+            yield (-confidences[index], position, product_ids[index], category_ids[index])
+
+    #Returns the top_k recommended products for the products in the order, at most max_per_category per category.
+    #Several antecedents are combined with a k-way merge of their sorted rules, which stops as soon as top_k are picked.
+    def recommend(self, products, top_k=5, max_per_category=2):
+        rule_lists = []
+        for product in products:
+            product_id = self.product_ids.get(product)
+            if product_id is not None and product_id in self.rules:
+                rule_lists.append(self.rules[product_id])
+
+        if not rule_lists:
+            return []
+        if len(rule_lists) == 1:
+            candidates = self.iterate_rules(rule_lists[0], 0)
+        else:
+            #The position keeps ties in the order the products were given, like the original concatenate and stable sort
+            candidates = heapq.merge(*[self.iterate_rules(rules, position) for position, rules in enumerate(rule_lists)])
+
+        recommendations = []
+        picked = set()
+        recommendations_per_category = {}
+        for _, _, product_id, category_id in candidates:
+            # If Duplicated recommendations then skip
+            if product_id in picked:
+                continue
+
+            # Skip the recommendation once its category already has max_per_category recommendations
+            if recommendations_per_category.get(category_id, 0) >= max_per_category:
+                continue
+            recommendations_per_category[category_id] = recommendations_per_category.get(category_id, 0) + 1
+
+            picked.add(product_id)
+            recommendations.append(self.product_names[product_id])
+            if len(recommendations) >= top_k:
+                break
+
+        return recommendations
+
+#The popularity table (product, product_category, number_of_transactions) compiled once at load time into
+#plain lists sorted by number of transactions, one per category plus a global one.
+#A lookup is a slice of one list, or a merge of the lists of the requested categories.
+class PopularityIndex():
+    def __init__(self, rows):
+        #Every row is (product, product_category, number_of_transactions)
+        rows = [(product, category, int(number_of_transactions)) for product, category, number_of_transactions in rows]
+
+        #The catalog in the file order, used to build the prompts
+        self.products = [product for product, _, _ in rows]
+        self.product_categories = [category for _, category, _ in rows]
+
+        #sorted() is stable, so products with the same number of transactions keep the file order
+        ranked = sorted(rows, key=lambda row: row[2], reverse=True)
+        self.global_ranking = [product for product, _, _ in ranked]
+        #category -> [(-number_of_transactions, product)] best first
+        self.category_rankings = {}
+        for product, category, number_of_transactions in ranked:
+            self.category_rankings.setdefault(category, []).append((-number_of_transactions, product))
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, 'r', newline='') as file:
+            reader = csv.DictReader(file)
+            return cls([(row['product'], row['product_category'], row['number_of_transactions']) for row in reader])
+
+    #Returns the top_k most popular products, in the given categories when there are any
+    def recommend(self, product_categories=None, top_k=5):
+        if product_categories is None:
+            return self.global_ranking[:top_k]
+
+        rankings = [self.category_rankings[category] for category in dict.fromkeys(product_categories)
+                    if category in self.category_rankings]
+        if not rankings:
+            return []
+        if len(rankings) == 1:
+            return [product for _, product in rankings[0][:top_k]]
+        return [product for _, product in islice(heapq.merge(*[ranking[:top_k] for ranking in rankings]), top_k)]
+
+#Version of the snapshot layout, bumped whenever AprioriIndex or PopularityIndex change shape
+SNAPSHOT_VERSION = 1
+
+#Hash of a source file's contents, a snapshot built from other contents is stale.
+#Hashing is much cheaper than parsing and survives copying the files into an image (mtimes may not).
+def get_source_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_indexes(apriori_recommendation_path, popular_recommendation_path):
+    with open(apriori_recommendation_path, 'r') as file:
+        apriori_index = AprioriIndex(json.load(file))
+    return apriori_index, PopularityIndex.from_csv(popular_recommendation_path)
+
+#Pickles the compiled indexes next to the fingerprints of the files they were built from.
+#Written to a temporary file and renamed, so a worker never loads a half written snapshot.
+def save_snapshot(path, apriori_recommendation_path, popular_recommendation_path):
+    apriori_index, popularity_index = build_indexes(apriori_recommendation_path, popular_recommendation_path)
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "sources": [get_source_fingerprint(apriori_recommendation_path), get_source_fingerprint(popular_recommendation_path)],
+        "apriori_index": apriori_index,
+        "popularity_index": popularity_index,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+    return apriori_index, popularity_index
+
+#Returns (apriori_index, popularity_index) from the snapshot, None when it is missing, from another version or stale.
+#The snapshot is a pickle, only load files written by save_snapshot.
+def load_snapshot(path, apriori_recommendation_path, popular_recommendation_path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        snapshot = pickle.load(file)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    try:
+        sources = [get_source_fingerprint(apriori_recommendation_path), get_source_fingerprint(popular_recommendation_path)]
+    except OSError:
+        #The worker may ship the snapshot without the source files
+        sources = None
+    if sources is not None and snapshot["sources"] != sources:
+        return None
+    return snapshot["apriori_index"], snapshot["popularity_index"]
+
+#Loads the indexes from the snapshot when it is fresh, otherwise compiles them from the source files
+def load_indexes(apriori_recommendation_path, popular_recommendation_path, snapshot_path=None):
+    indexes = load_snapshot(snapshot_path, apriori_recommendation_path, popular_recommendation_path)
+    if indexes is not None:
+        return indexes
+    return build_indexes(apriori_recommendation_path, popular_recommendation_path)
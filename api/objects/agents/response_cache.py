@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+PRODUCTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "products")
+DEFAULT_SOURCE_PATHS = [
+    os.path.join(PRODUCTS_DIR, "products.jsonl"),
+    os.path.join(PRODUCTS_DIR, "Store_Description.txt"),
+]
+
+#Two level cache for answers that only depend on the last messages of the conversation (e.g. the DetailsAgent answers,
+#generated from the last context_window messages). It is shared by every session, so an answer is only reused for the
+#same window: a follow-up like "how much is it?" is keyed on the messages before it too.
+#   exact: keyed on the normalized window, a hit skips the embedding, the vector lookup and the completion
+#   semantic (off unless similarity_threshold is set): a question asked after the same earlier messages whose embedding
+#   is above the similarity threshold, and which names the same menu items (item_names), skips the vector lookup and the
+#   completion. Without the item guard "price of latte" and "price of cappuccino" are close enough to share an answer.
+#Entries are evicted least recently used first once max_size is reached and expire after ttl seconds.
+#Everything is dropped when one of the knowledge base source files changes.
+class ResponseCache():
+    def __init__(self, max_size=1000, ttl=3600, similarity_threshold=None, source_paths=None, source_check_interval=1.0,
+                 context_window=3, item_names=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.source_paths = source_paths if source_paths is not None else DEFAULT_SOURCE_PATHS
+        self.source_check_interval = source_check_interval
+        self.context_window = context_window
+        self.item_names = [self.normalize_query(name) for name in item_names or []]
+
+        self.lock = threading.Lock()
+        #(normalized earlier messages, normalized question) -> (answer, normalized embedding or None, items named, time stored)
+        self.entries = OrderedDict()
+        #Embedding matrix of the entries, rebuilt lazily after the entries change
+        self.matrix = None
+        self.matrix_keys = []
+
+        self.source_fingerprint = self.get_source_fingerprint()
+        self.last_source_check = time.monotonic()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize_query(query):
+        query = query.lower().strip()
+        query = re.sub(r"[^\w\s]", "", query)
+        return re.sub(r"\s+", " ", query)
+
+    #The earlier messages of the window (role and normalized content) and the normalized question
+    def get_key(self, messages):
+        window = messages[-self.context_window:]
+        context = tuple((message["role"], self.normalize_query(message["content"])) for message in window[:-1])
+        return context, self.normalize_query(window[-1]["content"])
+
+    #The menu items a normalized question names
+    def get_items(self, question):
+        question = f" {question} "
+        return frozenset(name for name in self.item_names if f" {name} " in question)
+
+    def get_source_fingerprint(self):
+        fingerprint = []
+        for path in self.source_paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    #Drops every entry when the knowledge base files changed, checked at most once per source_check_interval
+    def check_sources(self):
+        now = time.monotonic()
+        if now - self.last_source_check < self.source_check_interval:
+            return
+        self.last_source_check = now
+        fingerprint = self.get_source_fingerprint()
+        if fingerprint != self.source_fingerprint:
+            self.source_fingerprint = fingerprint
+            self.clear()
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.matrix = None
+        self.matrix_keys = []
+
+    def is_expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get_exact(self, messages):
+        key = self.get_key(messages)
+        with self.lock:
+            self.check_sources()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self.is_expired(entry[3]):
+                self.remove(key)
+                self.stats["expirations"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry[0]
+
+    #Looks up the closest cached question asked after the same messages and naming the same items, by cosine similarity.
+    #Counted as a miss when nothing is close enough or the semantic level is off.
+    def get_semantic(self, messages, embedding):
+        context, question = self.get_key(messages)
+        query_vector = self.normalize_vector(embedding)
+        items = self.get_items(question)
+        with self.lock:
+            if self.similarity_threshold is not None and query_vector is not None:
+                if self.matrix is None:
+                    self.build_matrix()
+                candidates = [index for index, key in enumerate(self.matrix_keys)
+                              if key[0] == context and self.entries[key][2] == items]
+                if candidates:
+                    similarities = self.matrix[candidates] @ query_vector
+                    best = int(np.argmax(similarities))
+                    key = self.matrix_keys[candidates[best]]
+                    entry = self.entries[key]
+                    if similarities[best] >= self.similarity_threshold:
+                        if self.is_expired(entry[3]):
+                            self.remove(key)
+                            self.stats["expirations"] += 1
+                        else:
+                            self.entries.move_to_end(key)
+                            self.stats["semantic_hits"] += 1
+                            return entry[0]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, messages, embedding, answer):
+        key = self.get_key(messages)
+        with self.lock:
+            self.entries[key] = (answer, self.normalize_vector(embedding), self.get_items(key[1]), time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self.matrix = None
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        self.matrix = None
+
+    def build_matrix(self):
+        self.matrix_keys = [key for key, entry in self.entries.items() if entry[1] is not None]
+        if self.matrix_keys:
+            self.matrix = np.stack([self.entries[key][1] for key in self.matrix_keys])
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def normalize_vector(embedding):
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+#The names of the products on the menu, for the item guard of the semantic level
+def load_item_names(products_path=DEFAULT_SOURCE_PATHS[0]):
+    try:
+        with open(products_path, "r") as file:
+            return [json.loads(line)["name"] for line in file if line.strip()]
+    except OSError:
+        return []
+
+#Builds the DetailsAgent cache from the DETAILS_CACHE_* environment variables, None when it is disabled.
+#The semantic level is only on with DETAILS_CACHE_SEMANTIC.
+def get_details_response_cache():
+    if os.getenv("DETAILS_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    semantic = os.getenv("DETAILS_CACHE_SEMANTIC", "false").lower() == "true"
+    source_paths = os.getenv("DETAILS_CACHE_SOURCES")
+    return ResponseCache(
+        max_size=int(os.getenv("DETAILS_CACHE_MAX_SIZE", "1000")),
+        ttl=float(os.getenv("DETAILS_CACHE_TTL", "3600")),
+        similarity_threshold=float(os.getenv("DETAILS_CACHE_SIMILARITY_THRESHOLD", "0.97")) if semantic else None,
+        source_paths=source_paths.split(",") if source_paths else None,
+        item_names=load_item_names() if semantic else None,
+    )
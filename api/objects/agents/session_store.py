@@ -0,0 +1,211 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+#Agents whose latest message carries state later turns need (the order), it is loaded with the window even when it is older
+PINNED_AGENTS = ("order_taking_agent",)
+#The agent whose latest memory is the session's order state
+ORDER_AGENT = "order_taking_agent"
+
+#Conversation histories kept on the worker, so a client only sends its session id and the new message.
+#Both backends expire a session ttl seconds after its last turn and answer load() with the last `window` messages
+#plus the latest message of every PINNED_AGENTS agent that fell out of the window.
+#The memory of the latest ORDER_AGENT answer is also kept on its own, updated by append() on every turn, so the
+#order is read with load_order() instead of being looked for in the history.
+#   memory: LRU dict of message lists, local to one worker process
+#   sqlite: a SQLite file, shared by the workers of one machine (or a network volume) and surviving restarts
+class InMemorySessionStore():
+    def __init__(self, max_sessions=10000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        #session id -> {"messages": [...], "pinned": {agent: position}, "order": memory, "expires_at": timestamp}
+        self.sessions = OrderedDict()
+        self.stats = {"loads": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        if session["expires_at"] <= time.monotonic():
+            del self.sessions[session_id]
+            self.stats["expired"] += 1
+            return None
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def load(self, session_id, window=20):
+        with self.lock:
+            self.stats["loads"] += 1
+            session = self.get_session(session_id)
+            if session is None:
+                self.stats["misses"] += 1
+                return []
+            return get_window(session["messages"], session["pinned"], window)
+
+    #The memory of the session's latest order taking answer, {} when there is no order yet
+    def load_order(self, session_id):
+        with self.lock:
+            session = self.get_session(session_id)
+            return dict(session["order"]) if session is not None else {}
+
+    def append(self, session_id, messages):
+        with self.lock:
+            session = self.get_session(session_id)
+            if session is None:
+                session = {"messages": [], "pinned": {}, "order": {}}
+                self.sessions[session_id] = session
+            for message in messages:
+                agent = message.get("memory", {}).get("agent", "")
+                if agent in PINNED_AGENTS:
+                    session["pinned"][agent] = len(session["messages"])
+                session["messages"].append(message)
+            order = get_order(messages)
+            if order is not None:
+                session["order"] = order
+            session["expires_at"] = time.monotonic() + self.ttl
+
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["sessions"] = len(self.sessions)
+        return stats
+
+class SQLiteSessionStore():
+    def __init__(self, path="sessions.sqlite", ttl=3600, cleanup_interval=60):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.next_cleanup = 0
+        self.lock = threading.Lock()
+        self.stats = {"loads": 0, "misses": 0, "expired": 0}
+
+        self.database = sqlite3.connect(path, check_same_thread=False)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self.database.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, expires_at REAL, length INTEGER, "
+                              "order_memory TEXT)")
+        #Files written before the order was kept in its own column
+        columns = [row[1] for row in self.database.execute("PRAGMA table_info(sessions)")]
+        if "order_memory" not in columns:
+            self.database.execute("ALTER TABLE sessions ADD COLUMN order_memory TEXT")
+        self.database.execute("CREATE TABLE IF NOT EXISTS messages (session_id TEXT, position INTEGER, agent TEXT, message TEXT, "
+                              "PRIMARY KEY (session_id, position))")
+        #Finds the latest pinned message of a session without scanning its history
+        self.database.execute("CREATE INDEX IF NOT EXISTS messages_by_agent ON messages (session_id, agent, position)")
+        self.database.commit()
+
+    #Wall clock time since the expiry is shared with other processes
+    def get_length(self, session_id):
+        row = self.database.execute("SELECT expires_at, length FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if row[0] <= time.time():
+            self.delete_rows(session_id)
+            self.stats["expired"] += 1
+            return None
+        return row[1]
+
+    def load(self, session_id, window=20):
+        with self.lock:
+            self.stats["loads"] += 1
+            length = self.get_length(session_id)
+            if length is None:
+                self.stats["misses"] += 1
+                return []
+
+            #Only the window and the pinned messages are read, whatever the length of the conversation
+            start = max(length - window, 0)
+            rows = self.database.execute("SELECT position, message FROM messages WHERE session_id = ? AND position >= ? "
+                                         "ORDER BY position", (session_id, start)).fetchall()
+            placeholders = ",".join("?" * len(PINNED_AGENTS))
+            pinned_rows = self.database.execute(f"SELECT MAX(position), message FROM messages WHERE session_id = ? AND position < ? "
+                                                f"AND agent IN ({placeholders}) GROUP BY agent",
+                                                (session_id, start, *PINNED_AGENTS)).fetchall()
+            rows = sorted(pinned_rows) + rows
+            return [json.loads(message) for _, message in rows]
+
+    def load_order(self, session_id):
+        with self.lock:
+            if self.get_length(session_id) is None:
+                return {}
+            row = self.database.execute("SELECT order_memory FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            return json.loads(row[0]) if row[0] else {}
+
+    def append(self, session_id, messages):
+        with self.lock:
+            length = self.get_length(session_id) or 0
+            rows = [(session_id, length + index, message.get("memory", {}).get("agent", ""), json.dumps(message))
+                    for index, message in enumerate(messages)]
+            order = get_order(messages)
+            self.database.executemany("INSERT OR REPLACE INTO messages (session_id, position, agent, message) VALUES (?, ?, ?, ?)", rows)
+            #A turn without an order taking answer keeps the order of the previous ones
+            self.database.execute("INSERT INTO sessions (session_id, expires_at, length, order_memory) VALUES (?, ?, ?, ?) "
+                                  "ON CONFLICT (session_id) DO UPDATE SET expires_at = excluded.expires_at, length = excluded.length, "
+                                  "order_memory = COALESCE(excluded.order_memory, sessions.order_memory)",
+                                  (session_id, time.time() + self.ttl, length + len(messages),
+                                   json.dumps(order) if order is not None else None))
+            self.database.commit()
+            self.cleanup()
+
+    #Drops the expired sessions at most once every cleanup_interval seconds
+    def cleanup(self):
+        now = time.time()
+        if now < self.next_cleanup:
+            return
+        self.next_cleanup = now + self.cleanup_interval
+        expired = [row[0] for row in self.database.execute("SELECT session_id FROM sessions WHERE expires_at <= ?", (now,))]
+        for session_id in expired:
+            self.delete_rows(session_id)
+        self.stats["expired"] += len(expired)
+        self.database.commit()
+
+    def delete_rows(self, session_id):
+        self.database.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        self.database.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id):
+        with self.lock:
+            self.delete_rows(session_id)
+            self.database.commit()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["sessions"] = self.database.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return stats
+
+#The memory of the latest order taking answer among the messages of a turn, None when there is none
+def get_order(messages):
+    for message in reversed(messages):
+        memory = message.get("memory", {})
+        if message.get("role") == "assistant" and memory.get("agent", "") == ORDER_AGENT:
+            return memory
+    return None
+
+#The last `window` messages, preceded by the pinned messages that are older than the window
+def get_window(messages, pinned, window):
+    start = max(len(messages) - window, 0)
+    older = [messages[position] for position in sorted(pinned.values()) if position < start]
+    return older + messages[start:]
+
+SESSION_STORE_BACKENDS = ("memory", "sqlite")
+
+#Builds the session store from the SESSION_* environment variables
+def get_session_store(backend=None):
+    backend = backend or os.getenv("SESSION_STORE_BACKEND", "memory")
+    ttl = float(os.getenv("SESSION_TTL", "3600"))
+    if backend == "memory":
+        return InMemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")), ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path=os.getenv("SESSION_STORE_PATH", "sessions.sqlite"), ttl=ttl)
+    raise ValueError(f"Unknown session store backend '{backend}', expected one of {SESSION_STORE_BACKENDS}")
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from . import tracing
+
+#Lets concurrent identical completions share one call to the endpoint.
+#A call is identified by the endpoint, the model, the generation parameters and the role and content of every message.
+#The first caller (the leader) makes the call, the callers that arrive while it is in flight wait for its result (or its
+#error) instead of sending the same prompt again. Nothing is kept once the call is done, repeated prompts that do not
+#overlap in time are what the verdict memo and the response cache are for.
+#Async calls are shared between the coroutines of the same event loop, the shared call runs as its own task so a caller
+#that is cancelled (a discarded speculative prefetch) does not cancel it for the others; it is cancelled with the last one.
+
+class SingleFlight():
+    def __init__(self):
+        self.lock = threading.Lock()
+        #key -> Future of the call in flight
+        self.calls = {}
+        #(event loop, key) -> [task of the call in flight, number of callers waiting on it]
+        self.async_calls = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    @staticmethod
+    def get_key(client, model_name, messages, temperature, max_tokens):
+        return (str(client.base_url), model_name, temperature, max_tokens,
+                tuple((message["role"], message["content"]) for message in messages))
+
+    def do(self, key, function):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            with tracing.span("coalesced_completion"):
+                return future.result()
+
+        try:
+            result = function()
+        except BaseException as exception:
+            self.forget(key)
+            future.set_exception(exception)
+            raise
+        self.forget(key)
+        future.set_result(result)
+        return result
+
+    def forget(self, key):
+        with self.lock:
+            self.calls.pop(key, None)
+
+    async def ado(self, key, coroutine_function):
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self.lock:
+            entry = self.async_calls.get(loop_key)
+            leader = entry is None
+            if leader:
+                entry = [asyncio.ensure_future(coroutine_function()), 0]
+                self.async_calls[loop_key] = entry
+                entry[0].add_done_callback(lambda task: self.aforget(loop_key, entry))
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            entry[1] += 1
+        task = entry[0]
+
+        try:
+            if leader:
+                return await asyncio.shield(task)
+            with tracing.span("coalesced_completion"):
+                return await asyncio.shield(task)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                abandoned = entry[1] == 0 and not task.done()
+                #A caller arriving after this starts a new call instead of waiting on the cancelled one
+                if abandoned and self.async_calls.get(loop_key) is entry:
+                    del self.async_calls[loop_key]
+            if abandoned:
+                task.cancel()
+
+    def aforget(self, loop_key, entry):
+        with self.lock:
+            if self.async_calls.get(loop_key) is entry:
+                del self.async_calls[loop_key]
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.calls) + len(self.async_calls)
+        return stats
+
+    def reset_stats(self):
+        with self.lock:
+            for name in self.stats:
+                self.stats[name] = 0
+
+#The process wide instance get_chatbot_response goes through, None when LLM_SINGLE_FLIGHT is false
+single_flight = SingleFlight() if os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true" else None
+
+def get_single_flight_stats():
+    if single_flight is None:
+        return {"calls": 0, "coalesced": 0, "in_flight": 0}
+    return single_flight.get_stats()
@@ -0,0 +1,165 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+
+#Per-turn tracing of the agent pipeline: a trace is the tree of spans of one turn (guard, classification, the chosen
+#agent, every completion, embedding and vector query), each with its duration and attributes such as token counts,
+#http requests (more than one is a retry) and cache hits.
+#A finished trace is logged as one json line on the "brewbot.tracing" logger and/or summarised into the response's
+#memory["timings"]. Without an active trace span() returns a shared no-op span, so the instrumentation costs a
+#context variable lookup per call when tracing is off.
+
+logger = logging.getLogger("brewbot.tracing")
+
+#The span the code currently runs in, spans opened with `with span(...)` become its children
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class NoopSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def begin(self):
+        return self
+
+    def finish(self, error=None):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+    def summary(self):
+        return None
+
+NOOP_SPAN = NoopSpan()
+
+class Span():
+    __slots__ = ("trace", "name", "parent", "attributes", "start", "end", "token")
+
+    def __init__(self, trace, name, parent, attributes):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = None
+        self.end = None
+        self.token = None
+
+    #`with` makes the span current, so the spans opened inside become its children
+    def __enter__(self):
+        self.begin()
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            current_span.reset(self.token)
+        except ValueError:
+            #A stream closed from another task than the one that opened it, its context is gone anyway
+            pass
+        self.finish(exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    #begin() and finish() time the span without making it current, for code that yields in between (streams)
+    def begin(self):
+        self.start = time.perf_counter()
+        self.trace.add_span(self)
+        return self
+
+    def finish(self, error=None):
+        self.end = time.perf_counter()
+        if error is not None:
+            self.attributes["error"] = error
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, value=1):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "ms": round((end - self.start) * 1000, 3),
+            **self.attributes,
+        }
+
+#The root span of a turn, it keeps every span opened below it
+class Trace(Span):
+    __slots__ = ("trace_id", "spans", "lock", "log")
+
+    def __init__(self, name, attributes, log=True):
+        super().__init__(self, name, None, attributes)
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        self.lock = threading.Lock()
+        self.log = log
+
+    def add_span(self, span):
+        #Spans are opened from the worker threads of the parallel and speculative modes as well
+        with self.lock:
+            self.spans.append(span)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if self.log:
+            logger.info(json.dumps(self.summary()))
+        return False
+
+    #Every span with its timing plus the totals of the turn, also available while the trace is still open
+    def summary(self):
+        with self.lock:
+            spans = [span.to_dict(self.start) for span in self.spans]
+        totals = {"llm_calls": 0, "embedding_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "http_requests": 0}
+        for span in spans:
+            if span["name"].startswith("chat_completion"):
+                totals["llm_calls"] += 1
+            elif span["name"] == "embedding":
+                totals["embedding_calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "http_requests"):
+                totals[key] += span.get(key, 0)
+        root = spans[0]
+        return {"trace_id": self.trace_id, "trace": self.name, "total_ms": root["ms"], **totals, "spans": spans[1:]}
+
+#Opens the root span of a turn, the no-op span when neither the log nor the timings are wanted
+def start_trace(name, log=True, timings=False, **attributes):
+    if not log and not timings:
+        return NOOP_SPAN
+    return Trace(name, attributes, log=log)
+
+#A child of the current span, the no-op span outside of a trace
+def span(name, **attributes):
+    parent = current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent, attributes)
+
+#The current span to add attributes to, the no-op span outside of a trace
+def current():
+    return current_span.get() or NOOP_SPAN
+
+#Records the token usage an endpoint returned with a completion or embeddings response
+def record_usage(span, usage):
+    if usage is None:
+        return
+    span.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    span.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+#Makes sure the trace lines are printed when the worker did not configure logging itself
+def configure_logging():
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
@@ -1,30 +1,165 @@
-def get_chatbot_response(client,messages,model_name,temperature,maxTokens):
+import time
+from . import tracing
+from .single_flight import single_flight
+from .admission import scheduler
+from .load_balancer import call, acall, pick_client, apick_client
+
+def get_chatbot_response(client,model_name,messages,temperature=0,maxTokens=2000):
+    messages_list = []
+    for message in messages:
+        messages_list.append({"role": message['role'], "content": message['content']})
+    #client is the endpoint's own client, the one chosen when there are several (a BalancedClient)
+    def create(client):
+        with tracing.span("chat_completion", model=model_name) as span:
+            response = client.chat.completions.create(
+                model=model_name,
+                messages=messages_list,
+                temperature=temperature,
+                max_tokens=maxTokens,
+                top_p=0.7
+            )
+            tracing.record_usage(span, response.usage)
+        return response.choices[0].message.content
+
+    #With several endpoints the completion goes to the best one and may be hedged on a second one. It waits for a slot
+    #of the endpoint first (LLM_MAX_CONCURRENCY), the span and the endpoint's latency only time the completion.
+    def send():
+        return call(client, create, scheduler.admit)
+
+    #Concurrent identical prompts share one call (LLM_SINGLE_FLIGHT)
+    if single_flight is None:
+        return send()
+    return single_flight.do(single_flight.get_key(client, model_name, messages_list, temperature, maxTokens), send)
+
+#Streaming version of get_chatbot_response, yields the pieces of the completion text as the endpoint generates them
+def get_chatbot_response_stream(client,model_name,messages,temperature=0,maxTokens=2000):
     messages_list = []
     for message in messages:
         messages_list.append({"role": message['role'], "content": message['content']})
-    response = client.chatCompletion(
-        model=model_name,
-        messages=messages_list,
-        temperature=temperature,
-        max_tokens=maxTokens,
-        top_p=0.7
-    )
-    return response.choices[0].message.content
+    #The stream holds its endpoint and its slot of the endpoint until it is read to the end or closed
+    with pick_client(client, scheduler.admit) as client:
+        #The span is not made current since the generator yields to the caller while it is open.
+        #Streams report no usage, the number of chunks and the time to the first one are recorded instead.
+        span = tracing.span("chat_completion_stream", model=model_name).begin()
+        error = None
+        try:
+            stream = client.chat.completions.create(
+                model=model_name,
+                messages=messages_list,
+                temperature=temperature,
+                max_tokens=maxTokens,
+                top_p=0.7,
+                stream=True
+            )
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        record_chunk(span)
+                        yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            #The consumer closed the stream before its end, it did not fail
+            raise
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            span.finish(error)
+
+def record_chunk(span):
+    if span is tracing.NOOP_SPAN:
+        return
+    if "chunks" not in span.attributes:
+        span.set(first_chunk_ms=round((time.perf_counter() - span.start) * 1000, 3))
+    span.add("chunks")
 
 def get_embedding(client,model_name,input_data):
-    response = client.embeddings.create(
-        model=model_name,
-        input=input_data
-    )
+    def create(client):
+        with tracing.span("embedding", model=model_name) as span:
+            response = client.embeddings.create(
+                model=model_name,
+                input=input_data
+            )
+            tracing.record_usage(span, response.usage)
+        return response
+    response = call(client, create, scheduler.admit)
+    embeddings=[]
+    for obj in response.data:
+        embeddings.append(obj.embedding)
+    return embeddings
+
+#Async versions of the helpers above, they take an AsyncOpenAI client so a single worker can wait on many completions at once
+async def async_get_chatbot_response(client,model_name,messages,temperature=0,maxTokens=2000):
+    messages_list = []
+    for message in messages:
+        messages_list.append({"role": message['role'], "content": message['content']})
+    async def create(client):
+        with tracing.span("chat_completion", model=model_name) as span:
+            response = await client.chat.completions.create(
+                model=model_name,
+                messages=messages_list,
+                temperature=temperature,
+                max_tokens=maxTokens,
+                top_p=0.7
+            )
+            tracing.record_usage(span, response.usage)
+        return response.choices[0].message.content
+
+    async def send():
+        return await acall(client, create, scheduler.aadmit)
+
+    if single_flight is None:
+        return await send()
+    return await single_flight.ado(single_flight.get_key(client, model_name, messages_list, temperature, maxTokens), send)
+
+async def async_get_chatbot_response_stream(client,model_name,messages,temperature=0,maxTokens=2000):
+    messages_list = []
+    for message in messages:
+        messages_list.append({"role": message['role'], "content": message['content']})
+    async with apick_client(client, scheduler.aadmit) as client:
+        span = tracing.span("chat_completion_stream", model=model_name).begin()
+        error = None
+        try:
+            stream = await client.chat.completions.create(
+                model=model_name,
+                messages=messages_list,
+                temperature=temperature,
+                max_tokens=maxTokens,
+                top_p=0.7,
+                stream=True
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        record_chunk(span)
+                        yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            #The consumer closed the stream before its end, it did not fail
+            raise
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            span.finish(error)
+
+async def async_get_embedding(client,model_name,input_data):
+    async def create(client):
+        with tracing.span("embedding", model=model_name) as span:
+            response = await client.embeddings.create(
+                model=model_name,
+                input=input_data
+            )
+            tracing.record_usage(span, response.usage)
+        return response
+    response = await acall(client, create, scheduler.aadmit)
     embeddings=[]
-    for obj in response:
+    for obj in response.data:
         embeddings.append(obj.embedding)
     return embeddings
 
 #Function to make sure the right json string is generated to be processed by the postProcess function for each agent.
 # Each agent generates a json object based on the conditions and is post processed to create a standard final object,
 # But this might fail if the llm does not generate a valid json string, so before post processing this jsonValidation function can be used.
-def jsonValidation(client,model_name,json_string):
+def get_json_validation_messages(json_string):
     prompt = f""" You will check this json string and correct any mistakes that will make it invalid. Then you will return the corrected json string. Nothing else. 
     If the Json is correct just return it.
 
@@ -33,8 +168,20 @@ def jsonValidation(client,model_name,json_string):
     {json_string}
     """
 
-    messages = [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+def jsonValidation(client,model_name,json_string):
+    messages = get_json_validation_messages(json_string)
+
+    with tracing.span("json_validation"):
+        response = get_chatbot_response(client,model_name,messages)
+
+    return response
+
+async def async_jsonValidation(client,model_name,json_string):
+    messages = get_json_validation_messages(json_string)
 
-    response = get_chatbot_response(client,model_name,messages)
+    with tracing.span("json_validation"):
+        response = await async_get_chatbot_response(client,model_name,messages)
 
-    return response
\ No newline at end of file
+    return response
@@ -0,0 +1,120 @@
+import os
+import json
+import asyncio
+import numpy as np
+
+#Vector store backends the DetailsAgent can search for the knowledge base entries closest to the user's message.
+#Both answer query() with the same shape as a Pinecone query: {"matches": [{"id", "score", "metadata": {"text"}}]}
+#   pinecone: the hosted Pinecone index (one network hop per query)
+#   local: a NumPy matrix loaded from disk as a read-only memory map, so workers on the same machine share the pages
+
+VECTOR_STORE_BACKENDS = ("pinecone", "local")
+
+class PineconeVectorStore():
+    def __init__(self, index_name=None, namespace="ns1", api_key=None):
+        from pinecone import Pinecone
+
+        # Initialize Pinecone client to store and access the vector storage
+        self.pinecone_client = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
+        self.index_name = index_name or os.getenv("PINECONE_INDEX_NAME")
+        self.namespace = namespace
+        self.index = None
+
+    #Looking up the index host is a network call, so it happens on the first query instead of at startup
+    def get_index(self):
+        if self.index is None:
+            self.index = self.pinecone_client.Index(self.index_name)
+        return self.index
+
+    def query(self, vector, top_k=1):
+        return self.get_index().query(
+            namespace=self.namespace,
+            vector=np.asarray(vector, dtype=float).tolist(),
+            top_k=top_k,
+            include_values=False,
+            include_metadata=True
+        )
+
+    #The Pinecone client is blocking, so the query runs in a worker thread to keep the event loop free
+    async def aquery(self, vector, top_k=1):
+        return await asyncio.to_thread(self.query, vector, top_k)
+
+    #Replaces the upsert flow of pineconeDatabase.ipynb
+    def upsert(self, ids, embeddings, records, batch_size=100):
+        vectors = [{"id": id, "values": list(map(float, embedding)), "metadata": record}
+                   for id, embedding, record in zip(ids, embeddings, records)]
+        for start in range(0, len(vectors), batch_size):
+            self.get_index().upsert(vectors=vectors[start:start + batch_size], namespace=self.namespace)
+
+class LocalVectorStore():
+    def __init__(self, path=None):
+        self.path = path or os.getenv("LOCAL_VECTOR_INDEX_PATH", "vector_index")
+
+        with open(os.path.join(self.path, "metadata.json"), "r") as file:
+            metadata = json.load(file)
+        self.metric = metadata["metric"]
+        self.ids = metadata["ids"]
+        self.records = metadata["records"]
+
+        #Memory mapped and read-only: the OS page cache holds one copy for every worker process
+        self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+
+    def prepare_queries(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    #Top-k for a batch of query vectors with one matrix product
+    def query_batch(self, vectors, top_k=1):
+        queries = self.prepare_queries(vectors)
+        scores = queries @ self.vectors.T
+        top_k = min(top_k, scores.shape[1])
+
+        results = []
+        for row in scores:
+            if top_k < len(row):
+                candidates = np.argpartition(-row, top_k - 1)[:top_k]
+            else:
+                candidates = np.arange(len(row))
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append({"matches": [{"id": self.ids[i], "score": float(row[i]), "metadata": self.records[i]}
+                                        for i in ordered]})
+        return results
+
+    def query(self, vector, top_k=1):
+        return self.query_batch([vector], top_k)[0]
+
+    #The local search is only a matrix product, there is no point in handing it to a thread
+    async def aquery(self, vector, top_k=1):
+        return self.query(vector, top_k)
+
+#Writes a local index: vectors.npy (float32, normalized rows for cosine) and metadata.json with the ids and records.
+#The files are written next to the index and renamed into place so running workers never read a half written index.
+def build_local_index(path, ids, embeddings, records, metric="cosine"):
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if metric == "cosine":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+    os.makedirs(path, exist_ok=True)
+    vectors_path = os.path.join(path, "vectors.npy")
+    metadata_path = os.path.join(path, "metadata.json")
+
+    with open(vectors_path + ".tmp", "wb") as file:
+        np.save(file, vectors)
+    with open(metadata_path + ".tmp", "w") as file:
+        json.dump({"metric": metric, "ids": list(ids), "records": list(records)}, file)
+
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+#Builds the vector store selected by the VECTOR_STORE_BACKEND environment variable
+def get_vector_store(backend=None):
+    backend = backend or os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    if backend == "local":
+        return LocalVectorStore()
+    raise ValueError(f"Unknown vector store backend '{backend}', expected one of {VECTOR_STORE_BACKENDS}")
@@ -0,0 +1,98 @@
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from . import tracing
+
+#Memo of the guard and routing verdicts. Those agents only read the last 3 messages of the conversation, so the same
+#window gets the same verdict and a repeated one ("What do you recommend?" right after a greeting, a popular order) skips
+#the completion. The key is the whole window the prompt sees: the last message compared on role and normalized content
+#(case, punctuation and spacing do not count), the turns before it as they are, so a follow-up ("yes", "the second
+#one") only reuses a verdict given after the same exchange.
+#Entries are evicted least recently used first once max_size is reached and expire after ttl seconds, like the
+#ResponseCache. A memo belongs to one agent and so to one system prompt and generation profile.
+#Sized with VERDICT_MEMO_SIZE (0 turns it off) and VERDICT_MEMO_TTL.
+
+class VerdictMemo():
+    def __init__(self, max_size=10000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        #key -> (verdict, time stored)
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_size=int(os.getenv("VERDICT_MEMO_SIZE", "10000")), ttl=float(os.getenv("VERDICT_MEMO_TTL", "600")))
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def normalize_content(content):
+        content = content.lower().strip()
+        content = re.sub(r"[^\w\s]", "", content)
+        return re.sub(r"\s+", " ", content)
+
+    #The window the agent sends after its system prompt
+    def get_key(self, messages):
+        if not messages:
+            return ()
+        context = tuple((message["role"], message["content"].strip()) for message in messages[:-1])
+        return context + ((messages[-1]["role"], self.normalize_content(messages[-1]["content"])),)
+
+    #Returns the key of the window and its memoized verdict, or None as the verdict when there is none (or the memo is off)
+    def lookup(self, messages):
+        if not self.enabled:
+            return None, None
+        key = self.get_key(messages)
+        verdict = self.get(key)
+        if verdict is not None:
+            tracing.current().set(verdict_memo="hit")
+        return key, verdict
+
+    def store(self, key, verdict):
+        if key is not None:
+            self.put(key, verdict)
+
+    #A copy of the stored verdict, the caller is free to change it
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            verdict, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return copy.deepcopy(verdict)
+
+    def put(self, key, verdict):
+        with self.lock:
+            self.entries[key] = (copy.deepcopy(verdict), time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    #A hit is a completion saved
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
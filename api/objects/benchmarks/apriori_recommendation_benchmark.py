@@ -0,0 +1,88 @@
+#Microbenchmark of the apriori lookup: the compiled AprioriIndex against the original
+#concatenate, sort and linear scan implementation, on large synthetic rule sets.
+#
+#Usage (from api/objects):
+#   python benchmarks/apriori_recommendation_benchmark.py --products 2000 --rules 300 --categories 40
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.recommendation_store import AprioriIndex
+
+#The implementation RecommendationAgent.get_apriori_recommendation had before the index
+def legacy_apriori_recommendation(apriori_recommendations, products, top_k=5):
+    recommendation_list = []
+    for product in products:
+        if product in apriori_recommendations:
+            recommendation_list += apriori_recommendations[product]
+    recommendation_list = sorted(recommendation_list, key=lambda x: x['confidence'], reverse=True)
+
+    recommendations = []
+    recommendations_per_category = {}
+    for recommendation in recommendation_list:
+        if recommendation in recommendations:
+            continue
+        product_category = recommendation['product_category']
+        if product_category not in recommendations_per_category:
+            recommendations_per_category[product_category] = 0
+        if recommendations_per_category[product_category] >= 2:
+            continue
+        recommendations_per_category[product_category] += 1
+        recommendations.append(recommendation['product'])
+        if len(recommendations) >= top_k:
+            break
+    return recommendations
+
+def build_rules(products, rules_per_product, categories, seed):
+    generator = random.Random(seed)
+    names = [f"product {index}" for index in range(products)]
+    category_of = {name: f"category {generator.randrange(categories)}" for name in names}
+
+    apriori_recommendations = {}
+    for name in names:
+        consequents = generator.sample(names, min(rules_per_product, products))
+        apriori_recommendations[name] = [
+            {"product": consequent, "product_category": category_of[consequent], "confidence": generator.random()}
+            for consequent in consequents if consequent != name
+        ]
+    return names, apriori_recommendations
+
+def time_calls(function, orders, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for order in orders:
+            function(order)
+    return (time.perf_counter() - start) / (repeat * len(orders))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--rules", type=int, default=300, help="Rules per antecedent")
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    names, apriori_recommendations = build_rules(args.products, args.rules, args.categories, args.seed)
+
+    start = time.perf_counter()
+    apriori_index = AprioriIndex(apriori_recommendations)
+    compile_seconds = time.perf_counter() - start
+    print(f"compiled {args.products} antecedents x {args.rules} rules in {compile_seconds * 1000:.1f} ms")
+
+    generator = random.Random(args.seed + 1)
+    print(f"{'order size':<12}{'legacy (us)':>14}{'index (us)':>14}{'speedup':>10}")
+    for order_size in (1, 2, 5):
+        orders = [generator.sample(names, order_size) for _ in range(args.orders)]
+        legacy = time_calls(lambda order: legacy_apriori_recommendation(apriori_recommendations, order), orders, args.repeat)
+        indexed = time_calls(lambda order: apriori_index.recommend(order), orders, args.repeat)
+        print(f"{order_size:<12}{legacy * 1e6:>14.1f}{indexed * 1e6:>14.1f}{legacy / indexed:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
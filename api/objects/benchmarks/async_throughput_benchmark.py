@@ -0,0 +1,80 @@
+#Compares the throughput of the blocking AgentController.get_response with the async AgentController.aget_response.
+#Both run real agents and real OpenAI clients against the local fake OpenAI-compatible server,
+#so every turn pays actual HTTP round-trips with a fixed server side delay.
+#
+#Usage (from api/objects):
+#   python benchmarks/async_throughput_benchmark.py --latency 0.05 --conversations 40 --concurrency 20
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+
+#The user messages the scripted conversations open with, ordering goes through the longest chain of completions
+CONVERSATIONS = [
+    "I'd like a latte please",
+    "What do you recommend?",
+]
+
+def build_controller(server_url):
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server_url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server_url
+    os.environ["MODEL_NAME"] = "fake"
+    #Repeated messages would otherwise get the verdict memo's answer or share a single-flight call
+    os.environ["VERDICT_MEMO_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "false"
+    from agent_flow import AgentController
+
+    return AgentController(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                           os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"))
+
+def get_job(index):
+    message = CONVERSATIONS[index % len(CONVERSATIONS)]
+    return {"input": {"messages": [{"role": "user", "content": message}]}}
+
+def run_sync(controller, conversations):
+    start = time.perf_counter()
+    for index in range(conversations):
+        controller.get_response(get_job(index))
+    return time.perf_counter() - start
+
+async def run_async(controller, conversations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index):
+        async with semaphore:
+            await controller.aget_response(get_job(index))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_one(index) for index in range(conversations)])
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every fake completion takes")
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency).start()
+    try:
+        controller = build_controller(server.url)
+
+        sync_seconds = run_sync(controller, args.conversations)
+        async_seconds = asyncio.run(run_async(controller, args.conversations, args.concurrency))
+    finally:
+        server.stop()
+
+    print(f"{'pipeline':<10}{'seconds':>10}{'turns/s':>10}")
+    print(f"{'sync':<10}{sync_seconds:>10.2f}{args.conversations / sync_seconds:>10.1f}")
+    print(f"{'async':<10}{async_seconds:>10.2f}{args.conversations / async_seconds:>10.1f}")
+
+if __name__ == "__main__":
+    main()
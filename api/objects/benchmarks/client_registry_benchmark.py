@@ -0,0 +1,96 @@
+#Compares one shared ClientRegistry with one registry per agent (how every agent used to build its own OpenAI client).
+#Reports the time to build the agents and the number of connections opened while serving scripted turns
+#against the local fake OpenAI-compatible server.
+#
+#Usage (from api/objects):
+#   python benchmarks/client_registry_benchmark.py --turns 30
+
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+
+APRIORI_PATH = os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json")
+POPULAR_PATH = os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv")
+
+MESSAGES = [
+    "I'd like a latte please",
+    "What do you recommend?",
+]
+
+def build_agents(shared):
+    from agents import GuardAgent, ClassificationAgent, OrderTakingAgent, RecommendationAgent, ClientRegistry
+
+    registries = []
+    def new_registry():
+        if shared and registries:
+            return registries[0]
+        registry = ClientRegistry()
+        registries.append(registry)
+        return registry
+
+    start = time.perf_counter()
+    guard_agent = GuardAgent(new_registry())
+    classification_agent = ClassificationAgent(new_registry())
+    recommendation_agent = RecommendationAgent(APRIORI_PATH, POPULAR_PATH, client_registry=new_registry())
+    order_taking_agent = OrderTakingAgent(recommendation_agent, new_registry())
+    build_seconds = time.perf_counter() - start
+
+    agents = {
+        "guard_agent": guard_agent,
+        "classification_agent": classification_agent,
+        "order_taking_agent": order_taking_agent,
+        "recommendation_agent": recommendation_agent,
+    }
+    return agents, registries, build_seconds
+
+def run_turns(agents, turns):
+    start = time.perf_counter()
+    for index in range(turns):
+        messages = [{"role": "user", "content": MESSAGES[index % len(MESSAGES)]}]
+        agents["guard_agent"].get_response(messages)
+        chosen_agent = agents["classification_agent"].get_response(messages)["memory"]["classification_decision"]
+        agents[chosen_agent].get_response(messages)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds every fake completion takes")
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency).start()
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server.url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server.url
+    os.environ["MODEL_NAME"] = "fake"
+    #Repeated messages would otherwise get the verdict memo's answer or share a single-flight call
+    os.environ["VERDICT_MEMO_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "false"
+
+    print(f"{'registry':<12}{'build (ms)':>12}{'turns (s)':>12}{'requests':>10}{'connections':>13}")
+    try:
+        for shared in (False, True):
+            agents, registries, build_seconds = build_agents(shared)
+            turn_seconds = run_turns(agents, args.turns)
+
+            requests = 0
+            connections = 0
+            for registry in registries:
+                for stats in registry.get_pool_stats().values():
+                    requests += stats["requests"]
+                    connections += stats["connections_opened"]
+                registry.close()
+
+            name = "shared" if shared else "per-agent"
+            print(f"{name:<12}{build_seconds * 1000:>12.1f}{turn_seconds:>12.2f}{requests:>10}{connections:>13}")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
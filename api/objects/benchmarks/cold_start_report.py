@@ -0,0 +1,162 @@
+#Cold start report for the RunPod worker: where the time goes between starting the interpreter and answering the
+#first request. Every measurement runs in a fresh interpreter, so nothing is imported or built twice.
+#   imports: the slowest modules of `import runpod` + building the controller, from python -X importtime
+#   phases: import runpod, import agent_flow, build the controller (eager, lazy, with the recommendation snapshot),
+#           warm_up and the first request against the local fake OpenAI-compatible server
+#
+#Usage (from api/objects):
+#   python benchmarks/cold_start_report.py
+#   python benchmarks/cold_start_report.py --synthetic-products 3000 --rules 300
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+#Runs in the child interpreter: times every phase of one startup mode and prints them as json
+CHILD_SCRIPT = r"""
+import json, os, sys, time
+start = time.perf_counter()
+timings = {}
+sys.path.insert(0, os.environ["BASE_DIR"])
+
+def phase(name, function):
+    phase_start = time.perf_counter()
+    result = function()
+    timings[name] = time.perf_counter() - phase_start
+    return result
+
+phase("import runpod", lambda: __import__("runpod"))
+agent_flow = phase("import agent_flow", lambda: __import__("agent_flow"))
+controller = phase("AgentController()", lambda: agent_flow.AgentController(
+    os.environ["APRIORI_PATH"], os.environ["POPULAR_PATH"],
+    snapshot_path=os.environ.get("SNAPSHOT_PATH") or None,
+    lazy=os.environ["MODE"] == "lazy"))
+timings["ready for jobs"] = time.perf_counter() - start
+if os.environ["MODE"] == "lazy":
+    for name, seconds in phase("warm_up()", controller.warm_up).items():
+        timings[f"  warm_up: {name}"] = seconds
+job = {"input": {"messages": [{"role": "user", "content": "I'd like a latte please"}]}}
+phase("first request", lambda: controller.get_response(job))
+phase("second request", lambda: controller.get_response(job))
+timings["total"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+def child_environment(server_url, paths, mode, snapshot_path=None):
+    environment = dict(os.environ)
+    environment.update({
+        "BASE_DIR": BASE_DIR,
+        "RUNPOD_TOKEN": "benchmark",
+        "RUNPOD_CHATBOT_URL": server_url,
+        "RUNPOD_EMBEDDING_URL": server_url,
+        "MODEL_NAME": "fake",
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_INDEX_PATH": paths["vector_index"],
+        "EMBEDDING_CACHE_PATH": "",
+        "APRIORI_PATH": paths["apriori"],
+        "POPULAR_PATH": paths["popular"],
+        "SNAPSHOT_PATH": snapshot_path or "",
+        "MODE": mode,
+    })
+    return environment
+
+def run_child(environment, import_time=False):
+    command = [sys.executable] + (["-X", "importtime"] if import_time else []) + ["-c", CHILD_SCRIPT]
+    start = time.perf_counter()
+    result = subprocess.run(command, env=environment, cwd=BASE_DIR, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["interpreter wall clock"] = time.perf_counter() - start
+    return timings, result.stderr
+
+#Top level packages by cumulative import time, from the python -X importtime output
+def slowest_imports(stderr, count):
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith(" ") and not name.startswith("  "):
+            #One leading space is a module imported directly by the script
+            packages[name.strip()] = packages.get(name.strip(), 0) + int(cumulative)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+
+#A larger catalog so the difference between parsing the sources and unpickling the snapshot is visible
+def write_synthetic_recommendations(directory, products, rules, seed):
+    generator = random.Random(seed)
+    names = [f"product {index}" for index in range(products)]
+    category_of = {name: f"category {generator.randrange(40)}" for name in names}
+    apriori = {name: [{"product": consequent, "product_category": category_of[consequent], "confidence": generator.random()}
+                      for consequent in generator.sample(names, min(rules, products)) if consequent != name]
+               for name in names}
+    apriori_path = os.path.join(directory, "apriori_recommendations.json")
+    with open(apriori_path, "w") as file:
+        json.dump(apriori, file)
+    popular_path = os.path.join(directory, "popularity_recommendation.csv")
+    with open(popular_path, "w") as file:
+        file.write("product,product_category,number_of_transactions\n")
+        for name in names:
+            file.write(f"{name},{category_of[name]},{generator.randrange(1, 5000)}\n")
+    return apriori_path, popular_path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds every fake request takes")
+    parser.add_argument("--synthetic-products", type=int, default=0, help="Use a synthetic catalog of this many products")
+    parser.add_argument("--rules", type=int, default=200, help="Apriori rules per product of the synthetic catalog")
+    parser.add_argument("--top", type=int, default=12, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    from fake_openai_server import FakeOpenAIServer, fake_embedding
+    from agents.recommendation_store import save_snapshot
+    from agents.vector_store import build_local_index
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {"vector_index": os.path.join(directory, "vector_index")}
+        if args.synthetic_products:
+            paths["apriori"], paths["popular"] = write_synthetic_recommendations(directory, args.synthetic_products, args.rules, 7)
+        else:
+            paths["apriori"] = os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json")
+            paths["popular"] = os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv")
+        snapshot_path = os.path.join(directory, "recommendation_snapshot.pkl")
+        save_snapshot(snapshot_path, paths["apriori"], paths["popular"])
+        texts = ["Latte: espresso and steamed milk", "Cappuccino: espresso and foam"]
+        build_local_index(paths["vector_index"], ["latte", "cappuccino"], [fake_embedding(text) for text in texts],
+                          [{"text": text} for text in texts])
+
+        server = FakeOpenAIServer(latency=args.latency).start()
+        try:
+            #Throwaway run so the first measured mode does not also pay for a cold OS file cache
+            run_child(child_environment(server.url, paths, "eager"))
+
+            _, import_stderr = run_child(child_environment(server.url, paths, "eager"), import_time=True)
+            print(f"slowest imports (cumulative, eager startup)")
+            for name, microseconds in slowest_imports(import_stderr, args.top):
+                print(f"  {name:<40}{microseconds / 1000:>10.1f} ms")
+
+            modes = [
+                ("eager", child_environment(server.url, paths, "eager")),
+                ("eager + snapshot", child_environment(server.url, paths, "eager", snapshot_path)),
+                ("lazy + snapshot", child_environment(server.url, paths, "lazy", snapshot_path)),
+            ]
+            results = [(name, run_child(environment)[0]) for name, environment in modes]
+        finally:
+            server.stop()
+
+    #The lazy mode has every phase, in the order they ran
+    phases = list(dict.fromkeys(phase for _, timings in reversed(results) for phase in timings))
+    print()
+    print(f"{'phase (ms)':<28}" + "".join(f"{name:>18}" for name, _ in results))
+    for phase in phases:
+        row = "".join(f"{timings[phase] * 1000:>18.1f}" if phase in timings else f"{'-':>18}" for _, timings in results)
+        print(f"{phase:<28}{row}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#Allocations and time spent preparing the prompts of one turn (guard, classification and details agents) on long
+#histories: the previous deep copy of the messages in every agent against the read-only Conversation view.
+#
+#Usage (from api/objects):
+#   python benchmarks/conversation_view_benchmark.py --lengths 10 100 1000
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import ClientRegistry, GuardAgent, ClassificationAgent, DetailsAgent
+from agents.conversation import Conversation
+
+CLOSEST_MATCH = {"matches": [{"id": "latte", "score": 1.0, "metadata": {"text": "Latte: espresso and steamed milk."}}]}
+
+def build_history(length):
+    messages = []
+    for index in range(length):
+        if index % 2 == 0:
+            messages.append({"role": "user", "content": f"What is in the latte? ({index})"})
+        else:
+            messages.append({"role": "assistant", "content": "Espresso and steamed milk. " * 10,
+                             "memory": {"agent": "order_taking_agent", "step number": "2", "asked_recommendation_before": True,
+                                        "order": [{"item": "Latte", "quantity": 1, "price": "4.75"}]}})
+    return messages
+
+#How the three agents built their prompts before the view: every one deep copies the whole history first
+def legacy_turn(agents, messages):
+    guard_agent, classification_agent, details_agent = agents
+    prompts = []
+    for agent in (guard_agent, classification_agent):
+        copied = deepcopy(messages)
+        prompts.append([{"role": "system", "content": agent.get_system_prompt()}] + copied[-3:])
+    copied = deepcopy(messages)
+    copied[-1]['content'] = f"Contexts: {CLOSEST_MATCH['matches'][0]['metadata']['text']} Query: {copied[-1]['content']}"
+    prompts.append([{"role": "system", "content": "details"}] + copied[-3:])
+    return prompts
+
+def view_turn(agents, messages):
+    guard_agent, classification_agent, details_agent = agents
+    conversation = Conversation(messages)
+    return [guard_agent.get_input_messages(conversation),
+            classification_agent.get_input_messages(conversation),
+            details_agent.get_input_messages(conversation, CLOSEST_MATCH)]
+
+def measure(function, agents, messages, repeat):
+    tracemalloc.start()
+    function(agents, messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(agents, messages)
+    return peak, (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    #The clients are only built, no request is sent, and only the prompt building of the details agent is used
+    os.environ["DETAILS_CACHE_ENABLED"] = "false"
+    client_registry = ClientRegistry(api_key="benchmark", chatbot_url="http://127.0.0.1:9/v1",
+                                     embedding_url="http://127.0.0.1:9/v1", model_name="fake")
+    agents = (GuardAgent(client_registry), ClassificationAgent(client_registry),
+              DetailsAgent(client_registry, vector_store=object()))
+
+    print(f"{'messages':<10}{'deepcopy peak (KB)':>20}{'view peak (KB)':>16}{'deepcopy (us)':>15}{'view (us)':>11}")
+    for length in args.lengths:
+        messages = build_history(length)
+        legacy_peak, legacy_seconds = measure(legacy_turn, agents, messages, args.repeat)
+        view_peak, view_seconds = measure(view_turn, agents, messages, args.repeat)
+        print(f"{length:<10}{legacy_peak / 1024:>20.1f}{view_peak / 1024:>16.1f}{legacy_seconds * 1e6:>15.1f}{view_seconds * 1e6:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#Compares one embeddings.create call per text with the cached and batched EmbeddingService under a burst of
+#concurrent requests against the local fake OpenAI-compatible server. Reports the calls the endpoint received
+#and the latency the callers saw.
+#
+#Usage (from api/objects):
+#   python benchmarks/embedding_batching_benchmark.py --burst 200 --distinct 40
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+from agents import ClientRegistry
+from agents.embedding_cache import EmbeddingService, EmbeddingCache
+from agents.utils import async_get_embedding
+
+async def run_burst(embed, texts):
+    timings = []
+
+    async def run_one(text):
+        start = time.perf_counter()
+        await embed(text)
+        timings.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[run_one(text) for text in texts])
+    return sorted(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every fake request takes")
+    parser.add_argument("--burst", type=int, default=200, help="Concurrent embed requests")
+    parser.add_argument("--distinct", type=int, default=40, help="Distinct phrasings among the requests")
+    args = parser.parse_args()
+
+    texts = [f"what is in drink number {index % args.distinct}?" for index in range(args.burst)]
+
+    server = FakeOpenAIServer(latency=args.latency).start()
+    try:
+        client_registry = ClientRegistry(api_key="benchmark", embedding_url=server.url, model_name="fake")
+        async_client = client_registry.get_async_embedding_client()
+        embedding_service = EmbeddingService(client_registry.get_embedding_client(), async_client, "fake",
+                                             cache=EmbeddingCache(max_size=10000))
+
+        runs = [
+            ("direct", lambda text: async_get_embedding(async_client, "fake", text)),
+            ("service", lambda text: embedding_service.async_get_embedding(text)),
+        ]
+
+        #Both runs share one event loop since the async client's connections belong to it
+        async def run_all():
+            print(f"{'embedding path':<16}{'api calls':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+            for name, embed in runs:
+                calls_before = sum(server.request_counts.values())
+                timings = await run_burst(embed, texts)
+                calls = sum(server.request_counts.values()) - calls_before
+                p50 = timings[len(timings) // 2] * 1000
+                p99 = timings[int(0.99 * (len(timings) - 1))] * 1000
+                print(f"{name:<16}{calls:>10}{p50:>10.1f}{p99:>10.1f}")
+
+        asyncio.run(run_all())
+        print(embedding_service.get_stats())
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#A local stand-in for the RunPod OpenAI-compatible chat and embedding endpoints used by the benchmarks.
+#It answers /v1/chat/completions with canned JSON that each agent's postprocess can parse
+#(picked by looking at the agent's prompt) and /v1/embeddings with deterministic vectors, after a configurable delay.
+#Delays are a fixed number of seconds or a distribution ("uniform:0.02,0.08", "exponential:0.05", "lognormal:0.05,0.5").
+#Completions are generated one word every token_latency seconds, sent as server-sent events when the request streams.
+#prefill_latency adds that many seconds per 1000 prompt characters, so longer prompts answer later like a real model.
+#error_rate is the share of requests answered with a 503 after their delay, like an unhealthy replica.
+#
+#Usage (from api/objects):
+#   python benchmarks/fake_openai_server.py --port 8000 --latency 0.1
+#   python benchmarks/fake_openai_server.py --port 8000 --latency lognormal:0.3,0.4 --embedding-latency 0.02
+#   then point RUNPOD_CHATBOT_URL and RUNPOD_EMBEDDING_URL to http://127.0.0.1:8000/v1
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_SIZE = 384
+
+#Server side delay of a request, sampled per request
+#   fixed: always `seconds`
+#   uniform: between low and high
+#   exponential: exponential with the given mean
+#   lognormal: log-normal with the given median and sigma, a long tail like a loaded model server
+class LatencyModel():
+    DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, distribution="fixed", *parameters, seed=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}', expected one of {self.DISTRIBUTIONS}")
+        self.distribution = distribution
+        self.parameters = [float(parameter) for parameter in parameters]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    #"0.05", "fixed:0.05", "uniform:0.02,0.08", "exponential:0.05" or "lognormal:0.05,0.5"; a LatencyModel is returned as is
+    @classmethod
+    def parse(cls, spec):
+        if isinstance(spec, LatencyModel):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", spec)
+        distribution, _, parameters = spec.partition(":")
+        if not parameters:
+            return cls("fixed", distribution)
+        return cls(distribution, *parameters.split(","))
+
+    def sample(self):
+        with self.lock:
+            if self.distribution == "fixed":
+                return self.parameters[0]
+            if self.distribution == "uniform":
+                return self.random.uniform(self.parameters[0], self.parameters[1])
+            if self.distribution == "exponential":
+                return self.random.expovariate(1 / self.parameters[0]) if self.parameters[0] > 0 else 0.0
+            return self.random.lognormvariate(math.log(self.parameters[0]), self.parameters[1]) if self.parameters[0] > 0 else 0.0
+
+    def __repr__(self):
+        return f"{self.distribution}:{','.join(str(parameter) for parameter in self.parameters)}"
+
+#Messages with these words are rejected by the fake guard, so the benchmarks can mix in off-topic traffic
+OFF_TOPIC_WORDS = ("homework", "weather", "stock market")
+
+def guard_decision(user_message):
+    user_message = user_message.lower()
+    return "not allowed" if any(word in user_message for word in OFF_TOPIC_WORDS) else "allowed"
+
+#Picks the routing decision from the user's message the same way a well behaved model would for the scripted benchmarks
+def classify_message(user_message):
+    user_message = user_message.lower()
+    if re.search(r"recommend|suggest|goes well|what should i", user_message):
+        return "recommendation_agent"
+    if re.search(r"order|i'd like|i want|get me|can i (also )?get|\badd\b|that's all|that's it|nothing else|no thanks", user_message):
+        return "order_taking_agent"
+    return "details_agent"
+
+#Which agent prompt a list of chat messages is, the completions are counted per kind
+def get_prompt_kind(messages):
+    system_prompt = (messages[0]["content"] if messages and messages[0]["role"] == "system" else "").lower()
+    user_message = messages[-1]["content"] if messages else ""
+    if "You will check this json string" in user_message:
+        return "json_validation"
+    if "two tasks" in system_prompt and "decide whether the user's request is relevant" in system_prompt:
+        return "guard_classification"
+    if "decide whether the user's request is relevant" in system_prompt:
+        return "guard"
+    if "decide which agent should handle" in system_prompt:
+        return "classification"
+    if "we have 3 types of recommendations" in system_prompt:
+        return "recommendation_classification"
+    if "customer support bot for a coffee shop" in system_prompt:
+        return "order_taking"
+    return "answer"
+
+#The names listed after `title` in a prompt, one per line as "name - $price" or comma separated on the next line
+def get_menu_items(system_prompt):
+    return re.findall(r"^\s*(.+?) - \$\d", system_prompt, re.M)
+
+def get_listed_names(system_prompt, title):
+    match = re.search(re.escape(title) + r"\s*\n\s*(.+)", system_prompt)
+    return [name.strip() for name in match.group(1).split(",")] if match else []
+
+#The names of the list mentioned in the text, longest first so "Chocolate Croissant" wins over "Croissant"
+def find_mentions(text, names):
+    text = text.lower()
+    mentions = []
+    for name in sorted(set(names), key=len, reverse=True):
+        if name.lower() in text and not any(name.lower() in mention.lower() for mention in mentions):
+            mentions.append(name)
+    return mentions
+
+#The OrderTakingAgent's output: the order in the state line at the start of the user message plus the menu items
+#mentioned after it, complete once the user says they are done
+def fake_order(system_prompt, user_message):
+    state, _, message = user_message.rpartition(" \n ")
+    order = {name: int(quantity) for quantity, name in re.findall(r"(\d+) x (.+?) \(\$", state)}
+    for name in find_mentions(message, get_menu_items(system_prompt)):
+        order[name] = order.get(name, 0) + 1
+    complete = any(phrase in message.lower() for phrase in ("that's all", "that's it", "nothing else", "no thanks"))
+    return json.dumps({
+        "chain of thought": "",
+        "step number": "6" if complete else "4",
+        "order": [{"item": name, "quantity": str(quantity)} for name, quantity in order.items()],
+        "order complete": "yes" if complete else "no",
+        "response": "Thank you for your order!" if complete else "Got it, anything else?",
+    })
+
+#The RecommendationAgent's classification: apriori for items of the list, popular by category for categories, popular otherwise
+def fake_recommendation_classification(system_prompt, user_message):
+    products = find_mentions(user_message, get_listed_names(system_prompt, "Here is the list of items in the coffee shop:"))
+    categories = find_mentions(user_message, get_listed_names(system_prompt, "Here is the list of Categories we have in the coffee shop:"))
+    if products:
+        recommendation_type, parameters = "apriori", products
+    elif categories:
+        recommendation_type, parameters = "popular by category", categories
+    else:
+        recommendation_type, parameters = "popular", []
+    return json.dumps({"chain of thought": "", "recommendation_type": recommendation_type, "parameters": parameters})
+
+#Returns the completion text for a list of chat messages, valid output for the schema of the agent that sent it
+#What a model writes in the "chain of thought" of the guard and routing agents, generated word by word like the rest
+REASONING = ("The message is about the coffee shop and its menu, which is one of the allowed topics. It does not ask for a "
+             "recipe, for staff details or for anything unrelated to the shop. Going through the agents, the main intent "
+             "of the message best matches the agent chosen below.")
+
+def fake_completion(messages):
+    kind = get_prompt_kind(messages)
+    system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    user_message = messages[-1]["content"] if messages else ""
+
+    #jsonValidation: the json string to check is embedded in the prompt, hand it back untouched
+    if kind == "json_validation":
+        match = re.search(r"\{.*\}", user_message, re.S)
+        return match.group(0) if match else "{}"
+    #The compact prompts of the guard and routing agents ask for the decisions only, the full ones for a reasoning first
+    reasoning = {"chain of thought": REASONING} if "chain of thought" in system_prompt else {}
+    if kind == "guard_classification":
+        decision = guard_decision(user_message)
+        agent = classify_message(user_message) if decision == "allowed" else ""
+        return json.dumps({**reasoning, "decision": decision, "agent": agent, **({"message": ""} if reasoning else {})})
+    if kind == "guard":
+        return json.dumps({**reasoning, "decision": guard_decision(user_message), **({"message": ""} if reasoning else {})})
+    if kind == "classification":
+        return json.dumps({**reasoning, "decision": classify_message(user_message), **({"message": ""} if reasoning else {})})
+    if kind == "recommendation_classification":
+        return fake_recommendation_classification(system_prompt, user_message)
+    if kind == "order_taking":
+        return fake_order(system_prompt, user_message)
+    return "Here is what I can tell you about Joy's Cafe."
+
+#Deterministic unit vector for a piece of text so equal inputs always get equal embeddings
+def fake_embedding(text):
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    values = [(seed[i % len(seed)] - 127.5) / 127.5 for i in range(EMBEDDING_SIZE)]
+    norm = sum(value * value for value in values) ** 0.5
+    return [value / norm for value in values]
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #Keep-alive connections would otherwise wait on delayed ACKs between the header and the body writes
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        is_embedding = self.path.endswith("/embeddings")
+        time.sleep((server.embedding_latency if is_embedding else server.latency).sample())
+        with server.lock:
+            server.request_counts[self.path] = server.request_counts.get(self.path, 0) + 1
+            failed = server.error_rate > 0 and server.random.random() < server.error_rate
+        if failed:
+            self.send_error_response(503)
+            return
+
+        if self.path.endswith("/chat/completions"):
+            messages = body.get("messages", [])
+            prompt_characters = sum(len(message.get("content") or "") for message in messages)
+            time.sleep(server.prefill_latency * prompt_characters / 1000)
+            content = fake_completion(messages)
+            with server.lock:
+                kind = get_prompt_kind(messages)
+                server.completion_counts[kind] = server.completion_counts.get(kind, 0) + 1
+            if body.get("stream"):
+                self.stream_completion(body, content)
+                return
+            time.sleep(server.token_latency * len(split_tokens(content)))
+            payload = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model") or "fake",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                #Roughly 4 characters per prompt token and one token per generated word
+                "usage": {"prompt_tokens": prompt_characters // 4, "completion_tokens": len(split_tokens(content)),
+                          "total_tokens": prompt_characters // 4 + len(split_tokens(content))},
+            }
+        elif is_embedding:
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            payload = {
+                "object": "list",
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(inputs)],
+                "model": body.get("model") or "fake",
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_response(self, status):
+        data = json.dumps({"error": {"message": "Injected failure", "type": "server_error"}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    #Sends the completion as chat.completion.chunk events over a chunked response, one word per event
+    def stream_completion(self, body, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        for index, token in enumerate(split_tokens(content) + [None]):
+            if index:
+                time.sleep(self.server.token_latency)
+            delta = {"content": token} if token is not None else {}
+            send_event(json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model") or "fake",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None if token is not None else "stop"}],
+            }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+#Words with their trailing whitespace, the unit the fake endpoint generates and streams
+def split_tokens(content):
+    return re.findall(r"\S+\s*", content) or [content]
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    #latency and embedding_latency are seconds or LatencyModel specs, the embeddings take the chat latency by default
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, token_latency=0.0, prefill_latency=0.0, embedding_latency=None,
+                 error_rate=0.0, seed=None):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = LatencyModel.parse(latency)
+        self.embedding_latency = LatencyModel.parse(embedding_latency) if embedding_latency is not None else self.latency
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        #Completions per prompt kind (guard, classification, order_taking...)
+        self.completion_counts = {}
+
+    #A client that went away (a cancelled or hedged request) is not an error of the server
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    #Total requests and completions per kind so far, for the benchmarks to diff
+    def get_counts(self):
+        with self.lock:
+            return {**self.request_counts, **{f"completions/{kind}": count for kind, count in self.completion_counts.items()}}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    #Serves from a background thread so the benchmark can run in the same process
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="0.05", help="Seconds every request takes, or a distribution like lognormal:0.05,0.5")
+    parser.add_argument("--embedding-latency", default=None, help="Same for the embedding requests, the chat latency by default")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds every generated word takes")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="Seconds every 1000 prompt characters take")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the requests answered with a 503")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.token_latency, args.prefill_latency, args.embedding_latency,
+                              args.error_rate)
+    print(f"Fake OpenAI-compatible server listening on {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
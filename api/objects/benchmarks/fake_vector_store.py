@@ -0,0 +1,48 @@
+#A stand-in for the Pinecone index used by the benchmarks: the knowledge base (products.jsonl and the store description)
+#embedded with the fake server's deterministic vectors and searched in memory, after a network-like delay.
+#It answers query() and aquery() in the same shape as PineconeVectorStore, so it can replace the DetailsAgent's store.
+
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from fake_openai_server import LatencyModel, fake_embedding
+
+PRODUCTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "products")
+
+#The records build_vector_index.py upserts: one per product and one per paragraph of the store description
+def load_knowledge_base(products_dir=PRODUCTS_DIR):
+    records = []
+    with open(os.path.join(products_dir, "products.jsonl"), "r") as file:
+        for line in file:
+            if line.strip():
+                product = json.loads(line)
+                records.append({"text": f"{product['name']}: {product['description']}"})
+    with open(os.path.join(products_dir, "Store_Description.txt"), "r") as file:
+        records += [{"text": paragraph.strip()} for paragraph in file.read().split("\n\n") if paragraph.strip()]
+    return records
+
+class FakeVectorStore():
+    def __init__(self, latency=0.02, records=None):
+        self.latency = LatencyModel.parse(latency)
+        self.records = records if records is not None else load_knowledge_base()
+        self.ids = [f"record-{index}" for index in range(len(self.records))]
+        self.vectors = np.asarray([fake_embedding(record["text"]) for record in self.records], dtype=np.float32)
+        self.queries = 0
+
+    def search(self, vector, top_k):
+        scores = self.vectors @ np.asarray(vector, dtype=np.float32)
+        ordered = np.argsort(-scores)[:top_k]
+        self.queries += 1
+        return {"matches": [{"id": self.ids[i], "score": float(scores[i]), "metadata": self.records[i]} for i in ordered]}
+
+    def query(self, vector, top_k=1):
+        time.sleep(self.latency.sample())
+        return self.search(vector, top_k)
+
+    async def aquery(self, vector, top_k=1):
+        await asyncio.sleep(self.latency.sample())
+        return self.search(vector, top_k)
@@ -0,0 +1,144 @@
+#Offline evaluation of the fast-path router against a labelled set of customer messages.
+#For every threshold it reports the share of messages decided locally (the ClassificationAgent calls avoided),
+#the accuracy of those local decisions and the confusion between agents. Messages below the threshold go to the
+#ClassificationAgent, which is not called here.
+#The centroid mode embeds the examples and the messages through the embedding endpoint of the environment.
+#
+#Usage (from api/objects):
+#   python benchmarks/fast_router_evaluation.py
+#   python benchmarks/fast_router_evaluation.py --mode centroid --thresholds 0.1 0.2 0.3
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.fast_router import RuleBasedRouter, EmbeddingCentroidRouter, ROUTED_AGENTS
+
+#(message, agent of the previous assistant message, expected agent)
+LABELLED_MESSAGES = [
+    ("What time do you open on Sundays?", None, "details_agent"),
+    ("Where is the coffee shop located?", None, "details_agent"),
+    ("Do you have wifi?", None, "details_agent"),
+    ("What's in the Jumbo Savory Scone?", None, "details_agent"),
+    ("Is the almond croissant gluten free?", None, "details_agent"),
+    ("How much is a cappuccino?", None, "details_agent"),
+    ("How many calories are in a latte?", None, "details_agent"),
+    ("What pastries do you have?", None, "details_agent"),
+    ("Can I see the menu?", None, "details_agent"),
+    ("Tell me about the hazelnut biscotti", None, "details_agent"),
+    ("Does the dark chocolate contain dairy?", None, "details_agent"),
+    ("What is the price of the ginger scone?", None, "details_agent"),
+    ("Do you deliver to my area?", None, "details_agent"),
+    ("What are your hours?", None, "details_agent"),
+    ("Is there parking nearby?", None, "details_agent"),
+    ("What is the rating of the cranberry scone?", None, "details_agent"),
+    ("What kind of coffee beans do you use?", None, "details_agent"),
+    ("Describe the chocolate croissant", None, "details_agent"),
+    ("Do you sell drinking chocolate?", None, "details_agent"),
+    ("Who makes your pastries?", None, "details_agent"),
+    ("I'd like a latte please", None, "order_taking_agent"),
+    ("Can I get two croissants?", None, "order_taking_agent"),
+    ("I want an espresso shot", None, "order_taking_agent"),
+    ("2 cappuccinos and a ginger scone", None, "order_taking_agent"),
+    ("Add a chocolate croissant to my order", None, "order_taking_agent"),
+    ("Remove the biscotti", None, "order_taking_agent"),
+    ("I'll have the oatmeal scone", None, "order_taking_agent"),
+    ("Give me a hazelnut syrup with that", None, "order_taking_agent"),
+    ("Make it two lattes instead", None, "order_taking_agent"),
+    ("One more almond croissant please", None, "order_taking_agent"),
+    ("That's all, thanks", "order_taking_agent", "order_taking_agent"),
+    ("Yes please", "order_taking_agent", "order_taking_agent"),
+    ("No thanks", "order_taking_agent", "order_taking_agent"),
+    ("Nope, that's it", "order_taking_agent", "order_taking_agent"),
+    ("Could I have a cranberry scone?", None, "order_taking_agent"),
+    ("I would like to order a dark chocolate", None, "order_taking_agent"),
+    ("Cancel the cappuccino", "order_taking_agent", "order_taking_agent"),
+    ("a latte and a croissant", None, "order_taking_agent"),
+    ("Sure, add it", "order_taking_agent", "order_taking_agent"),
+    ("Checkout please", "order_taking_agent", "order_taking_agent"),
+    ("Let me order something", None, "order_taking_agent"),
+    ("I'm ready to order", None, "order_taking_agent"),
+    ("What do you recommend?", None, "recommendation_agent"),
+    ("What should I get?", None, "recommendation_agent"),
+    ("Any suggestions for a pastry?", None, "recommendation_agent"),
+    ("What's your most popular coffee?", None, "recommendation_agent"),
+    ("What goes well with a latte?", None, "recommendation_agent"),
+    ("Surprise me", None, "recommendation_agent"),
+    ("What's good here?", None, "recommendation_agent"),
+    ("Recommend me a drink", None, "recommendation_agent"),
+    ("What are your best sellers?", None, "recommendation_agent"),
+    ("Can you suggest something sweet?", None, "recommendation_agent"),
+    ("What should I try with my cappuccino?", None, "recommendation_agent"),
+    ("Any ideas for breakfast?", None, "recommendation_agent"),
+    ("What would pair well with a scone?", None, "recommendation_agent"),
+    ("I don't know what to get", None, "recommendation_agent"),
+    ("Which biscotti is the most popular?", None, "recommendation_agent"),
+    ("What do people usually order?", None, "recommendation_agent"),
+    #Mixed or vague messages the ClassificationAgent should decide
+    ("Can I get a latte, and what goes well with it?", None, "recommendation_agent"),
+    ("How much is a latte? I'll take two", None, "order_taking_agent"),
+    ("Hmm, something with chocolate", None, "recommendation_agent"),
+    ("Hello!", None, "details_agent"),
+    ("Is the ginger scone good? I might order one", None, "recommendation_agent"),
+    ("What's the difference between the latte and the cappuccino?", None, "details_agent"),
+]
+
+def evaluate(router, threshold):
+    decided = correct = 0
+    confusion = Counter()
+    for message, previous_agent, label in LABELLED_MESSAGES:
+        messages = []
+        if previous_agent is not None:
+            messages.append({"role": "assistant", "content": "...", "memory": {"agent": previous_agent}})
+        messages.append({"role": "user", "content": message})
+        agent, confidence = router.classify(messages)
+        if agent is None or confidence < threshold:
+            continue
+        decided += 1
+        correct += agent == label
+        confusion[(label, agent)] += 1
+    return decided, correct, confusion
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the fast-path router on labelled messages")
+    parser.add_argument("--mode", choices=("rules", "centroid"), default="rules")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.7, 0.8, 0.9])
+    parser.add_argument("--show-errors", action="store_true", help="print the messages routed to the wrong agent")
+    args = parser.parse_args()
+
+    if args.mode == "rules":
+        router = RuleBasedRouter()
+    else:
+        from agents import ClientRegistry
+        router = EmbeddingCentroidRouter(ClientRegistry().get_embedding_service())
+
+    total = len(LABELLED_MESSAGES)
+    print(f"{args.mode} router, {total} labelled messages\n")
+    print(f"{'threshold':>10} {'decided locally':>16} {'llm calls avoided':>18} {'local accuracy':>15}")
+    for threshold in args.thresholds:
+        decided, correct, confusion = evaluate(router, threshold)
+        accuracy = correct / decided if decided else 0.0
+        print(f"{threshold:>10.2f} {decided:>16} {decided / total:>17.1%} {accuracy:>14.1%}")
+        errors = {key: count for key, count in confusion.items() if key[0] != key[1]}
+        for (label, agent), count in sorted(errors.items()):
+            print(f"{'':>10} {count} x {label} routed to {agent}")
+
+    if args.show_errors:
+        threshold = args.thresholds[0]
+        print(f"\nwrong local decisions at threshold {threshold}:")
+        for message, previous_agent, label in LABELLED_MESSAGES:
+            messages = [{"role": "user", "content": message}]
+            if previous_agent is not None:
+                messages.insert(0, {"role": "assistant", "content": "...", "memory": {"agent": previous_agent}})
+            agent, confidence = router.classify(messages)
+            if agent is not None and confidence >= threshold and agent != label:
+                print(f"   {message!r}: {agent} ({confidence:.2f}), expected {label}")
+
+    print("\nagents:", ", ".join(ROUTED_AGENTS))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#Compares the latency of the guard/routing modes of the AgentController (sequential, parallel and fused)
+#The agents talk to a fake chat client that sleeps for a fixed time instead of calling the RunPod endpoint,
+#so the numbers show how many round-trips sit on the critical path of every turn.
+#
+#Usage (from api/objects):
+#   python benchmarks/guard_routing_benchmark.py --latency 0.3 --turns 20
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RUNPOD_TOKEN", "benchmark")
+
+from agent_flow import GuardRouter, GUARD_ROUTING_MODES
+from agents import GuardAgent, ClassificationAgent, GuardClassificationAgent, VerdictMemo
+
+# A stand-in for the OpenAI client that answers every completion with the same canned output after a delay
+class FakeChatClient():
+    #Single-flight keys and admission limits go by the endpoint url
+    base_url = "http://fake-chat/v1"
+
+    def __init__(self, output, latency):
+        self.output = json.dumps(output)
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        message = SimpleNamespace(content=self.output)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+#Every turn sends the same message, the verdict memo is off so each one reaches the client
+def build_router(mode, latency, guard_decision):
+    guard_output = {"chain of thought": "", "decision": guard_decision, "message": ""}
+    classification_output = {"chain of thought": "", "decision": "details_agent", "message": ""}
+    fused_output = {"chain of thought": "", "decision": guard_decision, "agent": "details_agent", "message": ""}
+
+    if mode == "fused":
+        agent = GuardClassificationAgent(memo=VerdictMemo(max_size=0))
+        agent.client = FakeChatClient(fused_output, latency)
+        return GuardRouter(mode, guard_classification_agent=agent)
+
+    guard_agent = GuardAgent(memo=VerdictMemo(max_size=0))
+    guard_agent.client = FakeChatClient(guard_output, latency)
+    classification_agent = ClassificationAgent(memo=VerdictMemo(max_size=0))
+    classification_agent.client = FakeChatClient(classification_output, latency)
+    return GuardRouter(mode, guard_agent=guard_agent, classification_agent=classification_agent)
+
+def run(mode, latency, turns, guard_decision):
+    router = build_router(mode, latency, guard_decision)
+    messages = [{"role": "user", "content": "How much is a latte?"}]
+
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        router.route(messages)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds every fake completion takes")
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'guard':<14}{'mean (ms)':>12}{'p95 (ms)':>12}")
+    for guard_decision in ("allowed", "not allowed"):
+        for mode in GUARD_ROUTING_MODES:
+            timings = sorted(run(mode, args.latency, args.turns, guard_decision))
+            mean = statistics.mean(timings) * 1000
+            p95 = timings[int(0.95 * (len(timings) - 1))] * 1000
+            print(f"{mode:<12}{guard_decision:<14}{mean:>12.1f}{p95:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#Tail latency of completions over several equivalent endpoints: round robin (what a plain proxy would do) against
+#least outstanding requests, EWMA latency balancing and EWMA with hedged requests. Every endpoint is a local fake
+#server with its own latency (and share of failed requests), so one slow or failing replica can be injected next to
+#healthy ones. Reports p50/p95/p99 latency and failed requests per configuration, how the requests spread over the
+#endpoints, the hedged requests and the ejections.
+#
+#Usage (from api/objects):
+#   python benchmarks/load_balancer_benchmark.py --latencies 0.05 0.05 lognormal:0.05,1.2 --hedge-delay-ms 120
+#   python benchmarks/load_balancer_benchmark.py --latencies 0.05 0.05 0.05 --error-rates 0 0 0.5 --mode sync
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+#Every request is a different prompt, identical in-flight prompts would otherwise share one call
+os.environ["LLM_SINGLE_FLIGHT"] = "false"
+
+from fake_openai_server import FakeOpenAIServer
+from agents.client_registry import ClientRegistry
+from agents.utils import get_chatbot_response, async_get_chatbot_response
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+def get_messages(index):
+    return [{"role": "user", "content": f"Can I get a latte? (request {index})"}]
+
+def run_sync(client, requests, concurrency):
+    def one(index):
+        start = time.perf_counter()
+        try:
+            get_chatbot_response(client, "fake", get_messages(index), maxTokens=32)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(one, range(requests)))
+
+async def run_async(client, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await async_get_chatbot_response(client, "fake", get_messages(index), maxTokens=32)
+            except Exception:
+                return None
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*[one(index) for index in range(requests)])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencies", nargs="+", default=["0.05", "0.05", "lognormal:0.05,1.2"],
+                        help="Latency of every fake endpoint, seconds or a distribution")
+    parser.add_argument("--error-rates", nargs="+", type=float, help="Share of failed requests of every endpoint")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--hedge-delay-ms", type=float, default=120)
+    parser.add_argument("--mode", choices=("async", "sync"), default="async")
+    args = parser.parse_args()
+
+    error_rates = args.error_rates or [0.0] * len(args.latencies)
+    servers = [FakeOpenAIServer(latency=latency, error_rate=error_rate, seed=index).start()
+               for index, (latency, error_rate) in enumerate(zip(args.latencies, error_rates))]
+    urls = [server.url for server in servers]
+    configurations = {
+        "round robin": dict(base_url=",".join(urls), load_balancer="round_robin"),
+        "least outstanding": dict(base_url=",".join(urls), load_balancer="least_outstanding"),
+        "ewma": dict(base_url=",".join(urls), load_balancer="ewma"),
+        f"ewma, hedged {args.hedge_delay_ms:g} ms": dict(base_url=",".join(urls), load_balancer="ewma",
+                                                       hedge_delay=args.hedge_delay_ms / 1000),
+    }
+
+    try:
+        print(f"{args.mode} mode, {args.requests} requests, concurrency {args.concurrency}, endpoints "
+              + ", ".join(f"{latency} ({error_rate:.0%} errors)" for latency, error_rate in zip(args.latencies, error_rates)))
+        print(f"\n{'configuration':<28}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'failed':>8}   requests per endpoint")
+        for name, configuration in configurations.items():
+            base_url = configuration.pop("base_url")
+            #No retries on the same endpoint, failing over is the balancer's job
+            registry = ClientRegistry(api_key="benchmark", chatbot_url=base_url, embedding_url=base_url, model_name="fake",
+                                      max_retries=0, eject_seconds=5, **configuration)
+            counts_before = [server.get_counts().get("/v1/chat/completions", 0) for server in servers]
+            if args.mode == "sync":
+                latencies = run_sync(registry.get_client(base_url), args.requests, args.concurrency)
+            else:
+                latencies = asyncio.run(run_async(registry.get_client(base_url, is_async=True), args.requests, args.concurrency))
+            counts = [server.get_counts().get("/v1/chat/completions", 0) - before for server, before in zip(servers, counts_before)]
+            registry.close()
+
+            answered = [latency * 1000 for latency in latencies if latency is not None]
+            endpoint_stats = registry.get_endpoint_stats()
+            spread = " / ".join(str(count) for count in counts)
+            hedges = sum(stats["hedges"] for stats in endpoint_stats.values())
+            ejections = sum(stats["ejections"] for stats in endpoint_stats.values())
+            print(f"{name:<28}{percentile(answered, 0.50):>10.1f}{percentile(answered, 0.95):>10.1f}"
+                  f"{percentile(answered, 0.99):>10.1f}{len(latencies) - len(answered):>8}   {spread}, {hedges} hedged, "
+                  f"{ejections} ejections")
+    finally:
+        for server in servers:
+            server.stop()
+
+if __name__ == "__main__":
+    main()
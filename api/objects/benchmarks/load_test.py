@@ -0,0 +1,253 @@
+#Offline load test of the AgentController: scripted conversations (ordering, details, recommendations and guard
+#rejections) are replayed by concurrent virtual users against the local fake OpenAI-compatible server and the fake
+#vector index, so no RunPod or Pinecone endpoint is needed.
+#Reports p50/p95/p99 turn latency and llm calls per turn for each scenario, the throughput and the completions per
+#prompt kind. --save writes the results as json and --baseline compares a run against saved results and exits with
+#status 1 when a scenario got slower than the tolerance or makes more llm calls per turn.
+#The deployment settings (GUARD_ROUTING_MODE, FAST_ROUTER, SPECULATIVE_PREFETCH...) are read from the environment as usual.
+#
+#Usage (from api/objects):
+#   python benchmarks/load_test.py --conversations 100 --concurrency 16 --latency lognormal:0.1,0.3
+#   python benchmarks/load_test.py --mode sync --concurrency 4 --save baseline.json
+#   GUARD_ROUTING_MODE=parallel python benchmarks/load_test.py --baseline baseline.json --tolerance 0.2
+#   LLM_MAX_CONCURRENCY=4 LLM_QUEUE_TIMEOUT=1 python benchmarks/load_test.py --concurrency 64 --latency 0.2
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+from fake_vector_store import FakeVectorStore
+
+#The user messages of every scripted conversation, the agent's answers are appended between them like the app does
+SCENARIOS = {
+    "ordering": ["Hi, I'd like a latte please", "Can I also get a Chocolate Croissant?", "That's all, thanks"],
+    "details": ["What are your opening hours?", "Is the Almond Croissant gluten free?", "Where are you located?"],
+    "recommendation": ["What do you recommend?", "What goes well with a Cappuccino?", "Can you recommend something from the Bakery?"],
+    "guard_rejection": ["Can you help me with my homework?", "What's the weather like today?"],
+}
+
+def build_controller(server_url, vector_latency, cache):
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server_url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server_url
+    os.environ["MODEL_NAME"] = "fake"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    #The llm calls of every turn are read from the trace summary
+    os.environ["TRACE_TIMINGS"] = "true"
+    #The Pinecone store built with the DetailsAgent is replaced by the fake index before any query
+    os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+    if not cache:
+        #Replaying the same scripts would otherwise be answered from the caches after the first round
+        os.environ["DETAILS_CACHE_ENABLED"] = "false"
+        os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["VERDICT_MEMO_SIZE"] = "0"
+        os.environ["LLM_SINGLE_FLIGHT"] = "false"
+    from agent_flow import AgentController
+
+    controller = AgentController(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                                 os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"),
+                                 lazy=False)
+    controller.agent_dict["details_agent"].vector_store = FakeVectorStore(vector_latency)
+    return controller
+
+#The scenario of every conversation, drawn from the mix with a fixed seed so runs replay the same traffic
+def plan_conversations(count, mix, seed):
+    scenarios = list(mix)
+    return random.Random(seed).choices(scenarios, weights=[mix[scenario] for scenario in scenarios], k=count)
+
+def parse_mix(spec):
+    if not spec:
+        return {scenario: 1.0 for scenario in SCENARIOS}
+    mix = {}
+    for part in spec.split(","):
+        scenario, _, weight = part.partition("=")
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{scenario}', expected one of {tuple(SCENARIOS)}")
+        mix[scenario] = float(weight or 1)
+    return mix
+
+#Records the latency and llm calls of a turn and whether it got the degraded answer of admission control, returns the response without its timings to append to the conversation
+def record_turn(results, scenario, start, response):
+    latency = time.perf_counter() - start
+    timings = response.get("memory", {}).get("timings") or {}
+    results.append({"scenario": scenario, "latency": latency, "llm_calls": timings.get("llm_calls", 0),
+                    "degraded": response.get("memory", {}).get("agent") == "degraded"})
+    response = {**response, "memory": {key: value for key, value in response.get("memory", {}).items() if key != "timings"}}
+    return response
+
+def run_conversation(controller, scenario, results, errors):
+    messages = []
+    for text in SCENARIOS[scenario]:
+        messages.append({"role": "user", "content": text})
+        start = time.perf_counter()
+        try:
+            response = controller.get_response({"input": {"messages": list(messages)}})
+        except Exception as error:
+            errors.append(f"{scenario}: {type(error).__name__}: {error}")
+            return
+        messages.append(record_turn(results, scenario, start, response))
+
+async def arun_conversation(controller, scenario, results, errors):
+    messages = []
+    for text in SCENARIOS[scenario]:
+        messages.append({"role": "user", "content": text})
+        start = time.perf_counter()
+        try:
+            response = await controller.aget_response({"input": {"messages": list(messages)}})
+        except Exception as error:
+            errors.append(f"{scenario}: {type(error).__name__}: {error}")
+            return
+        messages.append(record_turn(results, scenario, start, response))
+
+def run_sync(controller, plan, concurrency, results, errors):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda scenario: run_conversation(controller, scenario, results, errors), plan))
+
+async def run_async(controller, plan, concurrency, results, errors):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(scenario):
+        async with semaphore:
+            await arun_conversation(controller, scenario, results, errors)
+
+    await asyncio.gather(*[run_one(scenario) for scenario in plan])
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+def summarize(results):
+    groups = {}
+    for result in results:
+        groups.setdefault(result["scenario"], []).append(result)
+    groups["all"] = results
+
+    summary = {}
+    for scenario, group in groups.items():
+        latencies = [result["latency"] * 1000 for result in group]
+        summary[scenario] = {
+            "turns": len(group),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "llm_calls_per_turn": sum(result["llm_calls"] for result in group) / len(group),
+            "degraded": sum(result["degraded"] for result in group),
+        }
+    return summary
+
+#Regressions of a run against a saved one: slower p95 than the tolerance allows, or more llm calls per turn
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for scenario, expected in baseline["scenarios"].items():
+        actual = summary.get(scenario)
+        if actual is None:
+            continue
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {actual['p95_ms']:.1f} ms against {expected['p95_ms']:.1f} ms")
+        if actual["llm_calls_per_turn"] > expected["llm_calls_per_turn"] + 0.01:
+            regressions.append(f"{scenario}: {actual['llm_calls_per_turn']:.2f} llm calls per turn "
+                               f"against {expected['llm_calls_per_turn']:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay scripted conversations against the AgentController")
+    parser.add_argument("--mode", choices=("async", "sync"), default="async",
+                        help="aget_response on one event loop, or get_response from a thread pool")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations in flight at the same time")
+    parser.add_argument("--mix", default="", help="Scenario weights, e.g. ordering=2,details=1 (all equal by default)")
+    parser.add_argument("--latency", default="0.05", help="Chat completion delay: seconds or a distribution like lognormal:0.05,0.5")
+    parser.add_argument("--embedding-latency", default="0.01", help="Embedding delay, same format")
+    parser.add_argument("--vector-latency", default="0.01", help="Vector query delay, same format")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds every generated word takes")
+    parser.add_argument("--cache", action="store_true", help="Keep the details, embedding and verdict caches and the single-flight calls enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results to this json file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    plan = plan_conversations(args.conversations, parse_mix(args.mix), args.seed)
+    server = FakeOpenAIServer(latency=args.latency, token_latency=args.token_latency,
+                              embedding_latency=args.embedding_latency).start()
+    try:
+        controller = build_controller(server.url, args.vector_latency, args.cache)
+
+        #One conversation of every scenario first, so connections and lazy setup are not measured
+        warm_up = list(SCENARIOS)
+        results, errors = [], []
+        if args.mode == "sync":
+            run_sync(controller, warm_up, args.concurrency, [], [])
+            counts_before = server.get_counts()
+            start = time.perf_counter()
+            run_sync(controller, plan, args.concurrency, results, errors)
+            elapsed = time.perf_counter() - start
+        else:
+            #Everything shares one event loop since the async clients' connections belong to it
+            async def run_all():
+                await run_async(controller, warm_up, args.concurrency, [], [])
+                counts_before = server.get_counts()
+                start = time.perf_counter()
+                await run_async(controller, plan, args.concurrency, results, errors)
+                return counts_before, time.perf_counter() - start
+            counts_before, elapsed = asyncio.run(run_all())
+        counts = {key: value - counts_before.get(key, 0) for key, value in server.get_counts().items()}
+    finally:
+        server.stop()
+
+    if not results:
+        print("No turn completed:", *errors[:5], sep="\n   ")
+        sys.exit(1)
+
+    summary = summarize(results)
+    print(f"{args.mode} mode, {args.conversations} conversations, concurrency {args.concurrency}, "
+          f"latency {server.latency}, embedding {server.embedding_latency}, vector {args.vector_latency}")
+    print(f"routing {os.getenv('GUARD_ROUTING_MODE', 'sequential')}, fast router {os.getenv('FAST_ROUTER', 'off')}, "
+          f"speculative prefetch {os.getenv('SPECULATIVE_PREFETCH', 'false')}\n")
+    print(f"{'scenario':<18}{'turns':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'llm calls/turn':>16}{'degraded':>10}")
+    for scenario, row in summary.items():
+        print(f"{scenario:<18}{row['turns']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+              f"{row['llm_calls_per_turn']:>16.2f}{row['degraded']:>10}")
+
+    throughput = len(results) / elapsed
+    print(f"\nthroughput: {throughput:.1f} turns/s over {elapsed:.1f} s, {len(errors)} failed conversations")
+    print("requests:", ", ".join(f"{key} {value}" for key, value in sorted(counts.items()) if value))
+    for error in errors[:5]:
+        print("   ", error)
+    coalescing = controller.get_coalescing_stats()
+    print(f"completions saved: {coalescing['single_flight']['coalesced']} shared in flight, "
+          + ", ".join(f"{memo['hits']} {name} verdicts memoized"
+                      for name, memo in coalescing["verdict_memo"].items()))
+
+    admission = controller.get_admission_stats()
+    for endpoint, stats in admission.items():
+        print(f"admission {endpoint}: cap {stats['max_concurrency']}, max queue depth {stats['max_queue_depth']}, "
+              f"wait p50 {stats['wait_ms_p50']:.1f} ms p95 {stats['wait_ms_p95']:.1f} ms, {stats['rejected']} rejected, "
+              f"{stats['shed']} shed, {stats['timed_out']} timed out")
+
+    report = {"mode": args.mode, "concurrency": args.concurrency, "throughput": throughput, "errors": len(errors),
+              "scenarios": summary, "requests": counts, "coalescing": coalescing,
+              "admission": admission}
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = compare(summary, json.load(file), args.tolerance)
+        print("\nagainst the baseline:", "no regression" if not regressions else "")
+        for regression in regressions:
+            print("   ", regression)
+        if regressions or errors:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#Prompt size and latency of the OrderTakingAgent over long conversations: the order state plus a bounded window of
+#recent messages against the previous prompt (the whole history with the last order status prepended to the user message).
+#Both run against the local fake OpenAI-compatible server with a per-character prefill delay, so longer prompts are slower.
+#
+#Usage (from api/objects):
+#   python benchmarks/order_state_benchmark.py --turns 50 --prefill-latency 0.002
+
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+from agents import ClientRegistry, OrderTakingAgent, RecommendationAgent
+from agents.utils import get_chatbot_response
+
+USER_MESSAGES = [
+    "I'd like a latte please",
+    "Can I also get a croissant?",
+    "Actually make it two lattes",
+    "What else do you have with chocolate?",
+    "Add a chocolate croissant",
+]
+
+#The prompt OrderTakingAgent built before the order state: the system prompt and every message of the conversation,
+#with the last order status found by scanning the history backwards prepended to the user's message
+def legacy_input_messages(agent, messages):
+    messages = [{"role": message["role"], "content": message["content"], "memory": message.get("memory", {})} for message in messages]
+    last_order_taking_status = ""
+    for message in reversed(messages):
+        if message["role"] == "assistant" and message["memory"].get("agent", "") == "order_taking_agent":
+            last_order_taking_status = f"""
+                step number: {message["memory"]["step number"]}
+                order: {message["memory"]["order"]}
+                """
+            break
+    messages[-1]['content'] = last_order_taking_status + " \n "+ messages[-1]['content']
+    return [{"role": "system", "content": agent.get_system_prompt()}] + messages
+
+def prompt_characters(input_messages):
+    return sum(len(message["content"]) for message in input_messages)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds every fake request takes")
+    parser.add_argument("--prefill-latency", type=float, default=0.002, help="Seconds every 1000 prompt characters take")
+    parser.add_argument("--report-every", type=int, default=10)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency, prefill_latency=args.prefill_latency).start()
+    try:
+        client_registry = ClientRegistry(api_key="benchmark", chatbot_url=server.url, embedding_url=server.url, model_name="fake")
+        recommendation_agent = RecommendationAgent(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                                                   os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"),
+                                                   client_registry=client_registry)
+        agent = OrderTakingAgent(recommendation_agent, client_registry)
+
+        print(f"{'turn':<6}{'legacy chars':>14}{'state chars':>13}{'legacy (ms)':>13}{'state (ms)':>12}{'total':>9}")
+        messages = []
+        for turn in range(1, args.turns + 1):
+            messages.append({"role": "user", "content": USER_MESSAGES[(turn - 1) % len(USER_MESSAGES)]})
+
+            legacy_messages = legacy_input_messages(agent, messages)
+            start = time.perf_counter()
+            get_chatbot_response(agent.client, agent.model_name, legacy_messages)
+            legacy_seconds = time.perf_counter() - start
+
+            input_messages, _, _ = agent.get_input_messages(messages)
+            start = time.perf_counter()
+            response = agent.get_response(messages)
+            state_seconds = time.perf_counter() - start
+            messages.append(response)
+
+            if turn == 1 or turn % args.report_every == 0:
+                print(f"{turn:<6}{prompt_characters(legacy_messages):>14}{prompt_characters(input_messages):>13}"
+                      f"{legacy_seconds * 1000:>13.1f}{state_seconds * 1000:>12.1f}{response['memory']['total']:>9}")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
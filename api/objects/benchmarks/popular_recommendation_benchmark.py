@@ -0,0 +1,69 @@
+#Microbenchmark of the popularity lookup: the precomputed PopularityIndex against the original pandas
+#filter and sort per call, on a large synthetic catalog. Needs pandas, which the worker no longer depends on.
+#
+#Usage (from api/objects):
+#   python benchmarks/popular_recommendation_benchmark.py --products 5000 --categories 50
+
+import argparse
+import os
+import random
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.recommendation_store import PopularityIndex
+
+#The implementation RecommendationAgent.get_popular_recommendation had before the index
+def legacy_popular_recommendation(popular_recommendations, product_categories=None, top_k=5):
+    recommendations_df = popular_recommendations
+    if type(product_categories) == str:
+        product_categories = [product_categories]
+    if product_categories is not None:
+        recommendations_df = popular_recommendations[popular_recommendations['product_category'].isin(product_categories)]
+    recommendations_df = recommendations_df.sort_values(by='number_of_transactions', ascending=False)
+    if recommendations_df.shape[0] == 0:
+        return []
+    return recommendations_df['product'].tolist()[:top_k]
+
+def build_catalog(products, categories, seed):
+    generator = random.Random(seed)
+    return [(f"product {index}", f"category {generator.randrange(categories)}", generator.randrange(1, 5000))
+            for index in range(products)]
+
+def time_calls(function, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            function(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = build_catalog(args.products, args.categories, args.seed)
+    popular_recommendations = pd.DataFrame(rows, columns=['product', 'product_category', 'number_of_transactions'])
+
+    start = time.perf_counter()
+    popularity_index = PopularityIndex(rows)
+    compile_seconds = time.perf_counter() - start
+    print(f"compiled {args.products} products in {args.categories} categories in {compile_seconds * 1000:.1f} ms")
+
+    generator = random.Random(args.seed + 1)
+    categories = sorted(popularity_index.category_rankings)
+    print(f"{'categories':<12}{'pandas (us)':>14}{'index (us)':>14}{'speedup':>10}")
+    for label, size in (("all", None), ("1", 1), ("3", 3)):
+        queries = [None if size is None else generator.sample(categories, size) for _ in range(args.queries)]
+        legacy = time_calls(lambda query: legacy_popular_recommendation(popular_recommendations, query), queries, args.repeat)
+        indexed = time_calls(lambda query: popularity_index.recommend(query), queries, args.repeat)
+        print(f"{label:<12}{legacy * 1e6:>14.1f}{indexed * 1e6:>14.1f}{legacy / indexed:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
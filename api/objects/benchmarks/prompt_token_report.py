@@ -0,0 +1,55 @@
+#Size of every agent's compiled system prompt against the prompt as written in the source, and a check that the prompt
+#is the same prefix on every turn (what lets a prefix-caching backend reuse its KV cache).
+#Token counts use tiktoken when it is installed, otherwise an estimate of 4 characters per token.
+#
+#Usage (from api/objects):
+#   python benchmarks/prompt_token_report.py
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import agents
+
+TURNS = [
+    [{"role": "user", "content": "What do you recommend?"}],
+    [{"role": "user", "content": "I'd like a latte"}, {"role": "assistant", "content": "Anything else?"},
+     {"role": "user", "content": "What goes well with it?"}],
+]
+
+def main():
+    os.environ.setdefault("RUNPOD_TOKEN", "report")
+    os.environ.setdefault("RUNPOD_CHATBOT_URL", "http://localhost:1")
+    os.environ.setdefault("RUNPOD_EMBEDDING_URL", "http://localhost:1")
+    os.environ.setdefault("PINECONE_API_KEY", "report")
+    registry = agents.ClientRegistry()
+
+    recommendation_agent = agents.RecommendationAgent(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                                                      os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"),
+                                                      client_registry=registry)
+    order_taking_agent = agents.OrderTakingAgent(recommendation_agent, registry)
+    agents.DetailsAgent(registry)
+    prompt_builders = {
+        "guard": agents.GuardAgent(registry).get_input_messages,
+        "classification": agents.ClassificationAgent(registry).get_input_messages,
+        "guard_classification": agents.GuardClassificationAgent(registry).get_input_messages,
+        "recommendation_classification": recommendation_agent.get_classification_messages,
+        "order_taking": lambda messages: order_taking_agent.get_input_messages(messages)[0],
+    }
+
+    stats = agents.get_prompt_stats()
+    print(f"{'prompt':<32}{'source tokens':>15}{'compiled tokens':>17}{'characters':>12}{'same prefix':>13}")
+    for name, row in stats.items():
+        same_prefix = ""
+        if name in prompt_builders:
+            system_prompts = {prompt_builders[name](messages)[0]["content"] for messages in TURNS}
+            same_prefix = "yes" if len(system_prompts) == 1 else "no"
+        print(f"{name:<32}{row['source_tokens']:>15}{row['tokens']:>17}{row['characters']:>12}{same_prefix:>13}")
+
+    print(f"\n{sum(row['source_tokens'] for row in stats.values())} tokens as written, "
+          f"{sum(row['tokens'] for row in stats.values())} compiled")
+
+if __name__ == "__main__":
+    main()
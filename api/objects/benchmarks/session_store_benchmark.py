@@ -0,0 +1,75 @@
+#Per-request cost of shipping the whole conversation against a session id plus the new message, over long conversations:
+#the job payload size, decoding it, and (for sessions) loading the history window from the store.
+#No llm calls are made, only the work that grows with the conversation length is measured.
+#
+#Usage (from api/objects):
+#   python benchmarks/session_store_benchmark.py --turns 200
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.session_store import InMemorySessionStore, SQLiteSessionStore
+
+def user_message(turn):
+    return {"role": "user", "content": f"Could I also get a croissant and a latte with oat milk? (turn {turn})"}
+
+#An assistant message about the size the agents produce, every fifth one carries the order state
+def assistant_message(turn):
+    message = {"role": "assistant", "content": "Sure! " + "Here is a little more about our menu. " * 8, "memory": {"agent": "details_agent"}}
+    if turn % 5 == 0:
+        message["memory"] = {"agent": "order_taking_agent", "step number": "3", "total": "8.00", "asked_recommendation_before": True,
+                             "order": [{"item": "Latte", "quantity": 1, "price": "4.75"}, {"item": "Croissant", "quantity": 1, "price": "3.25"}]}
+    return message
+
+def time_repeated(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--window", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        stores = {"memory": InMemorySessionStore(), "sqlite": SQLiteSessionStore(os.path.join(directory, "sessions.sqlite"))}
+
+        print(f"{'turn':<6}{'full bytes':>12}{'decode (us)':>13}{'session bytes':>15}"
+              + "".join(f"{name + ' (us)':>14}" for name in stores))
+        messages = []
+        for turn in range(1, args.turns + 1):
+            messages.append(user_message(turn))
+            if turn == 1 or turn % (args.turns // 5 or 1) == 0:
+                full_payload = json.dumps({"input": {"messages": messages}})
+                session_payload = json.dumps({"input": {"session_id": "benchmark", "message": messages[-1]}})
+                decode = time_repeated(lambda: json.loads(full_payload), args.repeat)
+
+                row = f"{turn:<6}{len(full_payload):>12}{decode * 1e6:>13.1f}{len(session_payload):>15}"
+                for store in stores.values():
+                    #What a session turn costs the worker before the agents run: decode the small job and load the window
+                    def session_turn():
+                        job_input = json.loads(session_payload)["input"]
+                        window = store.load("benchmark", args.window) + [job_input["message"]]
+                        return window
+                    row += f"{time_repeated(session_turn, args.repeat) * 1e6:>14.1f}"
+                print(row)
+
+            response = assistant_message(turn)
+            messages.append(response)
+            for store in stores.values():
+                store.append("benchmark", [messages[-2], response])
+
+        for name, store in stores.items():
+            print(f"{name}: {store.get_stats()}")
+
+if __name__ == "__main__":
+    main()
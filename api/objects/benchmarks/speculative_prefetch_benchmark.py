@@ -0,0 +1,94 @@
+#Latency of the controller with and without SPECULATIVE_PREFETCH, and the prefetch work thrown away on rejected messages.
+#Real agents and OpenAI clients run against the local fake OpenAI-compatible server, whose guard rejects the off-topic
+#messages. The routing decision is known early either from the fast-path router (sequential mode) or from the
+#classification running next to the guard (parallel mode).
+#
+#Usage (from api/objects):
+#   python benchmarks/speculative_prefetch_benchmark.py --latency 0.1 --turns 5
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer, fake_embedding
+
+MESSAGES = {
+    "details": "What are your opening hours?",
+    "recommendation": "What do you recommend?",
+    "off-topic": "Recommend me a stock market investment",
+}
+
+#(GUARD_ROUTING_MODE, FAST_ROUTER)
+ROUTINGS = [("sequential", "rules"), ("parallel", "off")]
+
+def build_controller(server_url, directory, routing_mode, fast_router, speculative):
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server_url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server_url
+    os.environ["MODEL_NAME"] = "fake"
+    os.environ["VECTOR_STORE_BACKEND"] = "local"
+    os.environ["LOCAL_VECTOR_INDEX_PATH"] = os.path.join(directory, "vector_index")
+    #Every turn has to do its retrieval, cached answers and embeddings would hide it
+    os.environ["DETAILS_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+    #Repeated messages would otherwise get the verdict memo's answer or share a single-flight call
+    os.environ["VERDICT_MEMO_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "false"
+    os.environ["GUARD_ROUTING_MODE"] = routing_mode
+    os.environ["FAST_ROUTER"] = fast_router
+    os.environ["SPECULATIVE_PREFETCH"] = "true" if speculative else "false"
+    from agents.vector_store import build_local_index
+    from agent_flow import AgentController
+
+    if not os.path.exists(os.environ["LOCAL_VECTOR_INDEX_PATH"]):
+        texts = ["Joy's Cafe is open from 7am to 7pm every day.", "Latte: espresso and steamed milk."]
+        build_local_index(os.environ["LOCAL_VECTOR_INDEX_PATH"], ["hours", "latte"], [fake_embedding(text) for text in texts],
+                          [{"text": text} for text in texts])
+    return AgentController(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                           os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"))
+
+def run(controller, message, turns):
+    job = {"input": {"messages": [{"role": "user", "content": message}]}}
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        controller.get_response(job)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds every fake request takes")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per message and configuration")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f"{'routing':<24}{'message':<16}{'off (ms)':>10}{'speculative (ms)':>18}")
+            for routing_mode, fast_router in ROUTINGS:
+                controllers = {speculative: build_controller(server.url, directory, routing_mode, fast_router, speculative)
+                               for speculative in (False, True)}
+                routing = f"{routing_mode}, fast {fast_router}"
+                for name, message in MESSAGES.items():
+                    off = run(controllers[False], message, args.turns)
+                    speculative = run(controllers[True], message, args.turns)
+                    print(f"{routing:<24}{name:<16}{off:>10.1f}{speculative:>18.1f}")
+
+                #Let the discarded prefetches that could not be cancelled finish before reading the wasted time
+                time.sleep(args.latency * 3)
+                stats = controllers[True].get_speculation_stats()
+                print(f"{'':<24}prefetches: {stats['started']} started, {stats['used']} used, {stats['discarded']} discarded, "
+                      f"{stats['failed']} failed; saved {stats['saved_seconds'] * 1000:.0f} ms, "
+                      f"wasted {stats['wasted_seconds'] * 1000:.0f} ms\n")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#Time to first token against total time for the streaming and the non-streaming controller paths.
+#Real agents and OpenAI clients run against the local fake OpenAI-compatible server, which generates one word
+#every --token-latency seconds, so the last word of a long answer arrives well after the first.
+#
+#Usage (from api/objects):
+#   python benchmarks/streaming_benchmark.py --latency 0.05 --token-latency 0.02 --turns 5
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer, fake_embedding
+
+#One user message per agent whose answer is streamed
+MESSAGES = {
+    "details_agent": "What are your opening hours?",
+    "recommendation_agent": "What do you recommend?",
+    "order_taking_agent": "I'd like a latte please",
+}
+
+def build_controller(server_url, directory):
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server_url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server_url
+    os.environ["MODEL_NAME"] = "fake"
+    os.environ["VECTOR_STORE_BACKEND"] = "local"
+    os.environ["LOCAL_VECTOR_INDEX_PATH"] = os.path.join(directory, "vector_index")
+    #Every turn has to reach the endpoint, cached answers would not be generated at all
+    os.environ["DETAILS_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    #Repeated messages would otherwise get the verdict memo's answer or share a single-flight call
+    os.environ["VERDICT_MEMO_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "false"
+    from agents.vector_store import build_local_index
+    from agent_flow import AgentController
+
+    texts = ["Joy's Cafe is open from 7am to 7pm every day.", "Latte: espresso and steamed milk."]
+    build_local_index(os.environ["LOCAL_VECTOR_INDEX_PATH"], ["hours", "latte"], [fake_embedding(text) for text in texts],
+                      [{"text": text} for text in texts])
+    return AgentController(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                           os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"))
+
+def get_job(message):
+    return {"input": {"messages": [{"role": "user", "content": message}]}}
+
+#Returns (time to first token, total time) of one turn, the non-streaming path gets its text at the very end
+def run_blocking(controller, message):
+    start = time.perf_counter()
+    controller.get_response(get_job(message))
+    total = time.perf_counter() - start
+    return total, total
+
+def run_streaming(controller, message):
+    start = time.perf_counter()
+    first_token = None
+    for chunk in controller.get_response_stream(get_job(message)):
+        if first_token is None and chunk.get("delta"):
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+async def arun_streaming(controller, message):
+    start = time.perf_counter()
+    first_token = None
+    async for chunk in controller.aget_response_stream(get_job(message)):
+        if first_token is None and chunk.get("delta"):
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the fake endpoint starts answering")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Seconds every generated word takes")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per agent and path")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency, token_latency=args.token_latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            controller = build_controller(server.url, directory)
+
+            results = {}
+            for agent, message in MESSAGES.items():
+                results[(agent, "blocking")] = [run_blocking(controller, message) for _ in range(args.turns)]
+                results[(agent, "stream")] = [run_streaming(controller, message) for _ in range(args.turns)]
+
+            #All the async turns share one event loop since the async client's connections belong to it
+            async def run_async_turns():
+                for agent, message in MESSAGES.items():
+                    results[(agent, "async stream")] = [await arun_streaming(controller, message) for _ in range(args.turns)]
+            asyncio.run(run_async_turns())
+
+            print(f"{'agent':<22}{'path':<14}{'first token (ms)':>18}{'total (ms)':>12}")
+            for agent in MESSAGES:
+                for path in ("blocking", "stream", "async stream"):
+                    timings = results[(agent, path)]
+                    first_token = statistics.median(first for first, _ in timings) * 1000
+                    total = statistics.median(total for _, total in timings) * 1000
+                    print(f"{agent:<22}{path:<14}{first_token:>18.1f}{total:>12.1f}")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#Cost of the tracing instrumentation: a span opened outside of a trace (tracing off) against one inside a trace,
+#and one full turn of the controller with TRACING off and with the trace summarised into memory["timings"].
+#The turns run against the local fake OpenAI-compatible server with no latency, so the instrumentation is not hidden.
+#
+#Usage (from api/objects):
+#   python benchmarks/tracing_overhead_benchmark.py --spans 200000 --turns 200
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import FakeOpenAIServer
+from agents import tracing
+
+def time_spans(count, traced):
+    trace = tracing.start_trace("benchmark", log=False, timings=traced)
+    with trace:
+        start = time.perf_counter()
+        for _ in range(count):
+            with tracing.span("stage") as span:
+                span.add("http_requests")
+        elapsed = time.perf_counter() - start
+    return elapsed / count * 1e9
+
+def time_turns(server_url, turns, traced):
+    os.environ["RUNPOD_TOKEN"] = "benchmark"
+    os.environ["RUNPOD_CHATBOT_URL"] = server_url
+    os.environ["RUNPOD_EMBEDDING_URL"] = server_url
+    os.environ["MODEL_NAME"] = "fake"
+    os.environ["TRACE_TIMINGS"] = "true" if traced else "false"
+    #Repeated messages would otherwise get the verdict memo's answer or share a single-flight call
+    os.environ["VERDICT_MEMO_SIZE"] = "0"
+    os.environ["LLM_SINGLE_FLIGHT"] = "false"
+    from agent_flow import AgentController
+
+    controller = AgentController(os.path.join(BASE_DIR, "recommendation_data", "apriori_recommendations.json"),
+                                 os.path.join(BASE_DIR, "recommendation_data", "popularity_recommendation.csv"))
+    job = {"input": {"messages": [{"role": "user", "content": "What do you recommend?"}]}}
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        controller.get_response(job)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spans", type=int, default=200000)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"span outside a trace: {time_spans(args.spans, False):8.0f} ns")
+    print(f"span inside a trace:  {time_spans(args.spans, True):8.0f} ns")
+
+    server = FakeOpenAIServer(latency=0).start()
+    try:
+        off = time_turns(server.url, args.turns, False)
+        on = time_turns(server.url, args.turns, True)
+        print(f"turn, tracing off:    {off:8.2f} ms")
+        print(f"turn, timings on:     {on:8.2f} ms")
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#Measures the query latency of the local vector index against the Pinecone path.
+#By default the knowledge base is embedded with the fake server's deterministic embeddings and only the local index runs.
+#With --pinecone the queries are embedded through the real embedding endpoint and both the local index at --index
+#(built with build_vector_index.py) and the Pinecone index from the environment are queried.
+#
+#Usage (from api/objects):
+#   python benchmarks/vector_store_benchmark.py --queries 1000
+#   python benchmarks/vector_store_benchmark.py --pinecone --index vector_index --queries 50
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fake_openai_server import fake_embedding
+from agents.vector_store import LocalVectorStore, PineconeVectorStore, build_local_index
+from build_vector_index import load_knowledge_base, PRODUCTS_DIR
+
+QUESTIONS = [
+    "What are your opening hours?",
+    "How much is a latte?",
+    "Does the almond croissant contain nuts?",
+    "Where is the shop located?",
+    "What is in a cappuccino?",
+]
+
+def time_queries(vector_store, vectors, queries):
+    timings = []
+    for index in range(queries):
+        start = time.perf_counter()
+        vector_store.query(vectors[index % len(vectors)], top_k=3)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+def report(name, timings):
+    mean = statistics.mean(timings) * 1000
+    p95 = timings[int(0.95 * (len(timings) - 1))] * 1000
+    print(f"{name:<22}{mean:>12.3f}{p95:>12.3f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--pinecone", action="store_true")
+    parser.add_argument("--index", default="vector_index", help="Local index to compare with Pinecone")
+    args = parser.parse_args()
+
+    if args.pinecone:
+        from agents import get_default_registry
+        from agents.utils import get_embedding
+
+        client_registry = get_default_registry()
+        vectors = get_embedding(client_registry.get_embedding_client(), client_registry.model_name, QUESTIONS)
+        local_store = LocalVectorStore(args.index)
+        pinecone_store = PineconeVectorStore()
+    else:
+        ids, records = load_knowledge_base(os.path.join(PRODUCTS_DIR, "products.jsonl"),
+                                           os.path.join(PRODUCTS_DIR, "Store_Description.txt"))
+        index_path = tempfile.mkdtemp()
+        build_local_index(index_path, ids, [fake_embedding(record["text"]) for record in records], records)
+        vectors = [fake_embedding(question) for question in QUESTIONS]
+        local_store = LocalVectorStore(index_path)
+        pinecone_store = None
+
+    print(f"{'backend':<22}{'mean (ms)':>12}{'p95 (ms)':>12}")
+    report("local", time_queries(local_store, vectors, args.queries))
+
+    #Batched queries: one matrix product for every question
+    start = time.perf_counter()
+    rounds = max(1, args.queries // len(vectors))
+    for _ in range(rounds):
+        local_store.query_batch(vectors, top_k=3)
+    per_query = (time.perf_counter() - start) / (rounds * len(vectors))
+    print(f"{'local (batched)':<22}{per_query * 1000:>12.3f}{'':>12}")
+
+    if pinecone_store is not None:
+        report("pinecone", time_queries(pinecone_store, vectors, args.queries))
+
+if __name__ == "__main__":
+    main()
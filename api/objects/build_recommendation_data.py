@@ -0,0 +1,235 @@
+#Builds recommendation_data/apriori_recommendations.json and recommendation_data/popularity_recommendation.csv, the files
+#AgentController loads by default (agent_flow.RECOMMENDATION_DIR), from the sales receipts. This replaces the flow of
+#recommendationEngine.ipynb.
+#The steps are the notebook's, vectorized: the receipt lines of menu products are kept, a receipt is a transaction id and
+#customer id of one receipts file, only the receipts with more than one menu line count, and a product is matched by name
+#whatever its size ("Latte Rg", "Latte Lg") or category ("Dark chocolate" is sold as a drink and packaged).
+#Every file is read in chunks and only its menu lines are kept, as a few integer arrays, so memory depends on the lines of
+#one file and the menu, not on the months of receipts. Each file becomes a sparse boolean basket matrix (receipts x menu
+#products) whose co-occurrence counts are added up; support, confidence and lift of every product pair are then computed
+#at once on the count matrix.
+#With --state the counts are kept in a compact .npz file and the receipt files given are added to them as deltas (files
+#already applied are skipped), so a daily update only reads the new day's receipts. The rules and the popularity ranking
+#are re-derived from the counts, and running workers pick up the new files (RECOMMENDATION_RELOAD_INTERVAL).
+#
+#Usage (from api/objects):
+#   python build_recommendation_data.py
+#   python build_recommendation_data.py ../../coffee_data/2019*.csv --min-support 0.02 --chunk-size 500000
+#   python build_recommendation_data.py --state recommendation_data/basket_counts.npz receipts/2019-05-01.csv
+
+import argparse
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RECOMMENDATION_DIR = os.path.join(BASE_DIR, "recommendation_data")
+COFFEE_DATA_DIR = os.path.join(BASE_DIR, "..", "..", "coffee_data")
+PRODUCTS_DIR = os.path.join(BASE_DIR, "..", "..", "products")
+
+#The notebook's receipt: the same transaction id and customer id within a file
+RECEIPT_KEY = ["transaction_id", "customer_id"]
+
+#Returns the names and categories of the products on the menu, the only ones worth recommending
+def load_menu(products_path):
+    names = []
+    categories = []
+    with open(products_path, "r") as file:
+        for line in file:
+            if line.strip():
+                product = json.loads(line)
+                names.append(product["name"])
+                categories.append(product["category"])
+    return names, categories
+
+#Maps every product_id of the catalog to the index of its menu product and to the index of its (product, category) in
+#units, -1 when it is not on the menu. The popularity file counts the units, like the notebook's groupby on both columns.
+def load_product_ids(catalog_path, names):
+    catalog = pd.read_csv(catalog_path, usecols=["product_id", "product_category", "product"])
+    catalog["product"] = catalog["product"].str.replace(r" (Rg|Lg|Sm)", "", regex=True)
+
+    menu = {name: index for index, name in enumerate(names)}
+    on_menu = catalog["product"].isin(menu)
+    units = sorted(set(zip(catalog["product"][on_menu], catalog["product_category"][on_menu])))
+    unit_indexes = {unit: index for index, unit in enumerate(units)}
+
+    name_ids = np.full(catalog["product_id"].max() + 1, -1, dtype=np.int64)
+    unit_ids = np.full(len(name_ids), -1, dtype=np.int64)
+    name_ids[catalog["product_id"].to_numpy()] = [menu.get(name, -1) for name in catalog["product"]]
+    unit_ids[catalog["product_id"].to_numpy()] = [unit_indexes.get(unit, -1)
+                                                  for unit in zip(catalog["product"], catalog["product_category"])]
+    return name_ids, unit_ids, units
+
+#Returns the receipt id, menu product and unit of every menu line of a receipts file, read in chunks
+def read_menu_lines(path, name_ids, unit_ids, chunk_size):
+    receipts, products, units = [], [], []
+    for chunk in pd.read_csv(path, usecols=RECEIPT_KEY + ["product_id"], chunksize=chunk_size):
+        product_ids = chunk["product_id"].to_numpy()
+        known = product_ids < len(name_ids)
+        chunk_products = np.full(len(chunk), -1, dtype=np.int64)
+        chunk_products[known] = name_ids[product_ids[known]]
+        on_menu = chunk_products >= 0
+
+        receipts.append(chunk[RECEIPT_KEY].fillna(-1).to_numpy(dtype=np.int64)[on_menu])
+        products.append(chunk_products[on_menu])
+        units.append(unit_ids[product_ids[on_menu]])
+    if not receipts:
+        return np.zeros((0, len(RECEIPT_KEY)), dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(receipts), np.concatenate(products), np.concatenate(units)
+
+class BasketCounts():
+    def __init__(self, product_count, unit_count):
+        #pair_counts[i, j]: receipts with both products, the diagonal holds the receipts with the product
+        self.pair_counts = np.zeros((product_count, product_count), dtype=np.int64)
+        #Receipt lines of every (product, category), what the popularity file counts
+        self.line_counts = np.zeros(unit_count, dtype=np.int64)
+        self.receipts = 0
+        #Names of the receipt files the counts were built from
+        self.applied = []
+
+    #Loads counts saved with save(), re-indexed for the given menu: products new on the menu start from zero
+    #and products that left it are dropped
+    @classmethod
+    def load(cls, path, names, units):
+        counts = cls(len(names), len(units))
+        with np.load(path, allow_pickle=False) as state:
+            if "unit_names" not in state:
+                raise ValueError(f"{path} was written by an older version of this script, rebuild it from the receipts")
+            positions = {name: index for index, name in enumerate(state["names"].tolist())}
+            kept = [(index, positions[name]) for index, name in enumerate(names) if name in positions]
+            if kept:
+                new, old = (np.asarray(indexes) for indexes in zip(*kept))
+                counts.pair_counts[np.ix_(new, new)] = state["pair_counts"][np.ix_(old, old)]
+            unit_positions = {unit: index for index, unit in
+                              enumerate(zip(state["unit_names"].tolist(), state["unit_categories"].tolist()))}
+            kept = [(index, unit_positions[unit]) for index, unit in enumerate(units) if unit in unit_positions]
+            if kept:
+                new, old = (np.asarray(indexes) for indexes in zip(*kept))
+                counts.line_counts[new] = state["line_counts"][old]
+            counts.receipts = int(state["receipts"])
+            counts.applied = state["applied"].tolist()
+        return counts
+
+    #Written to a temporary file and renamed, an interrupted update leaves the previous state
+    def save(self, path, names, units):
+        with open(path + ".tmp", "wb") as file:
+            np.savez_compressed(file, names=np.asarray(names, dtype=str), pair_counts=self.pair_counts,
+                                unit_names=np.asarray([name for name, _ in units], dtype=str),
+                                unit_categories=np.asarray([category for _, category in units], dtype=str),
+                                line_counts=self.line_counts, receipts=np.int64(self.receipts),
+                                applied=np.asarray(self.applied, dtype=str))
+        os.replace(path + ".tmp", path)
+
+    #Adds the menu lines of one receipts file
+    def add(self, receipt_keys, products, units):
+        if len(receipt_keys) == 0:
+            return
+        _, receipts = np.unique(receipt_keys, axis=0, return_inverse=True)
+        receipts = receipts.ravel()
+
+        #Like the notebook, only the receipts with more than one menu line say something about what is bought together
+        keep = np.bincount(receipts)[receipts] > 1
+        receipts, products, units = receipts[keep], products[keep], units[keep]
+        if len(receipts) == 0:
+            return
+        _, rows = np.unique(receipts, return_inverse=True)
+
+        basket = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, products)),
+                                   shape=(rows.max() + 1, self.pair_counts.shape[0]))
+        #Two lines of the same product (two sizes) are one item of the basket
+        basket.sum_duplicates()
+        basket.data[:] = 1
+
+        self.pair_counts += (basket.T @ basket).toarray()
+        self.line_counts += np.bincount(units, minlength=len(self.line_counts))
+        self.receipts += basket.shape[0]
+
+#Returns the support, confidence and lift of every antecedent -> consequent pair as matrices
+def association_metrics(counts):
+    receipts = max(counts.receipts, 1)
+    item_counts = np.diag(counts.pair_counts).astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        support = counts.pair_counts / receipts
+        confidence = np.nan_to_num(counts.pair_counts / item_counts[:, None])
+        lift = np.nan_to_num(confidence / (item_counts[None, :] / receipts))
+    return support, confidence, lift
+
+#{antecedent: [{"product", "product_category", "confidence"}]} with the rules of every antecedent by confidence
+def build_apriori_recommendations(counts, names, categories, min_support, min_lift):
+    support, confidence, lift = association_metrics(counts)
+    rules = (support >= min_support) & (lift >= min_lift)
+    np.fill_diagonal(rules, False)
+
+    apriori_recommendations = {}
+    for antecedent in np.flatnonzero(rules.any(axis=1)):
+        consequents = np.flatnonzero(rules[antecedent])
+        consequents = consequents[np.argsort(-confidence[antecedent, consequents], kind="stable")]
+        apriori_recommendations[names[antecedent]] = [
+            {"product": names[consequent], "product_category": categories[consequent],
+             "confidence": float(confidence[antecedent, consequent])}
+            for consequent in consequents
+        ]
+    return apriori_recommendations
+
+def build_popular_recommendations(counts, units):
+    popular = pd.DataFrame({"product": [name for name, _ in units], "product_category": [category for _, category in units],
+                            "number_of_transactions": counts.line_counts})
+    return popular[popular["number_of_transactions"] > 0]
+
+#Both files are written next to their destination and renamed into place once both are complete,
+#so a worker (or the snapshot builder) never reads a half written or mismatched pair
+def write_recommendation_data(apriori_recommendations, popular_recommendations, apriori_path, popular_path):
+    with open(apriori_path + ".tmp", "w") as file:
+        json.dump(apriori_recommendations, file)
+    popular_recommendations.to_csv(popular_path + ".tmp", index=False)
+
+    os.replace(apriori_path + ".tmp", apriori_path)
+    os.replace(popular_path + ".tmp", popular_path)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("receipts", nargs="*", help="Sales receipts csv files (every month and outlet), the April 2019 export by default")
+    parser.add_argument("--catalog", default=os.path.join(COFFEE_DATA_DIR, "product.csv"))
+    parser.add_argument("--products", default=os.path.join(PRODUCTS_DIR, "products.jsonl"))
+    parser.add_argument("--apriori-output", default=os.path.join(RECOMMENDATION_DIR, "apriori_recommendations.json"))
+    parser.add_argument("--popular-output", default=os.path.join(RECOMMENDATION_DIR, "popularity_recommendation.csv"))
+    parser.add_argument("--min-support", type=float, default=0.05, help="Share of the receipts a pair has to appear in")
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--chunk-size", type=int, default=200000, help="Receipt lines read at a time")
+    parser.add_argument("--state", help="Counts file to update with the receipts given instead of starting from zero")
+    args = parser.parse_args()
+
+    paths = args.receipts or sorted(glob.glob(os.path.join(COFFEE_DATA_DIR, "*sales reciepts.csv")))
+    names, categories = load_menu(args.products)
+    name_ids, unit_ids, units = load_product_ids(args.catalog, names)
+
+    if args.state and os.path.exists(args.state):
+        counts = BasketCounts.load(args.state, names, units)
+    else:
+        counts = BasketCounts(len(names), len(units))
+    #A file is identified by its name, daily exports are named after their day
+    skipped = [path for path in paths if os.path.basename(path) in counts.applied]
+    paths = [path for path in paths if os.path.basename(path) not in counts.applied]
+    for path in skipped:
+        print(f"Skipping {path}, already in the counts")
+
+    for path in paths:
+        counts.add(*read_menu_lines(path, name_ids, unit_ids, args.chunk_size))
+    counts.applied += [os.path.basename(path) for path in paths]
+    if args.state:
+        counts.save(args.state, names, units)
+
+    apriori_recommendations = build_apriori_recommendations(counts, names, categories, args.min_support, args.min_lift)
+    popular_recommendations = build_popular_recommendations(counts, units)
+    write_recommendation_data(apriori_recommendations, popular_recommendations, args.apriori_output, args.popular_output)
+
+    rule_count = sum(len(recommendations) for recommendations in apriori_recommendations.values())
+    print(f"{counts.receipts} receipts, {len(paths)} files read: wrote {rule_count} rules for {len(apriori_recommendations)} "
+          f"products to {args.apriori_output} and {len(popular_recommendations)} products to {args.popular_output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+#Compiles the apriori and popularity recommendation files into the indexes RecommendationAgent uses and pickles them,
+#so a cold worker unpickles them instead of parsing and sorting the source files.
+#Point RECOMMENDATION_SNAPSHOT_PATH at the output. A snapshot whose source files changed is ignored.
+#
+#Usage (from api/objects):
+#   python build_recommendation_snapshot.py --output recommendation_data/recommendation_snapshot.pkl
+
+import argparse
+import os
+from agents.recommendation_store import save_snapshot
+
+RECOMMENDATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendation_data")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apriori", default=os.path.join(RECOMMENDATION_DIR, "apriori_recommendations.json"))
+    parser.add_argument("--popular", default=os.path.join(RECOMMENDATION_DIR, "popularity_recommendation.csv"))
+    parser.add_argument("--output", default=os.getenv("RECOMMENDATION_SNAPSHOT_PATH",
+                                                      os.path.join(RECOMMENDATION_DIR, "recommendation_snapshot.pkl")))
+    args = parser.parse_args()
+
+    apriori_index, popularity_index = save_snapshot(args.output, args.apriori, args.popular)
+    print(f"Wrote {len(apriori_index.rules)} apriori antecedents and {len(popularity_index.products)} products to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#Builds the DetailsAgent knowledge base from products/products.jsonl and products/Store_Description.txt,
+#embeds it with the RunPod embedding endpoint and writes it to the local vector index (and optionally upserts it to Pinecone).
+#This replaces the upsert flow of pineconeDatabase.ipynb.
+#
+#The embeddings are kept in the on-disk embedding cache (--embedding-cache, embedding_cache.sqlite next to this script by
+#default), so rebuilding an unchanged knowledge base does not call the embedding endpoint again.
+#
+#Usage (from api/objects):
+#   python build_vector_index.py --output vector_index
+#   python build_vector_index.py --output vector_index --pinecone
+#   python build_vector_index.py --output vector_index --embedding-cache ""
+
+import argparse
+import json
+import os
+from agents import get_default_registry
+from agents.vector_store import build_local_index, PineconeVectorStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PRODUCTS_DIR = os.path.join(BASE_DIR, "..", "..", "products")
+
+#Returns the ids and records ({"text": ...}) of every knowledge base entry
+def load_knowledge_base(products_path, store_description_path):
+    ids = []
+    records = []
+
+    with open(products_path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            product = json.loads(line)
+            text = (f"{product['name']}: {product['description']} -- "
+                    f"Ingredients: {', '.join(product['ingredients'])} -- "
+                    f"Price: {product['price']} -- "
+                    f"Rating: {product['rating']}")
+            ids.append(product['name'])
+            records.append({"text": text})
+
+    with open(store_description_path, "r") as file:
+        ids.append("store_description")
+        records.append({"text": file.read()})
+
+    return ids, records
+
+#Goes through the embedding cache, its disk tier is the EMBEDDING_CACHE_PATH set by main()
+def embed_records(records, batch_size):
+    embedding_service = get_default_registry().get_embedding_service()
+
+    embeddings = []
+    texts = [record["text"] for record in records]
+    for start in range(0, len(texts), batch_size):
+        embeddings += embedding_service.get_embedding(texts[start:start + batch_size])
+    return embeddings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", default=os.path.join(PRODUCTS_DIR, "products.jsonl"))
+    parser.add_argument("--store-description", default=os.path.join(PRODUCTS_DIR, "Store_Description.txt"))
+    parser.add_argument("--output", default=os.getenv("LOCAL_VECTOR_INDEX_PATH", "vector_index"))
+    parser.add_argument("--metric", default="cosine", choices=["cosine", "dotproduct"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--pinecone", action="store_true", help="Also upsert the entries to the Pinecone index")
+    parser.add_argument("--embedding-cache", default=os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(BASE_DIR, "embedding_cache.sqlite"),
+                        help="SQLite file of the embeddings kept between builds, empty to embed every entry again")
+    args = parser.parse_args()
+    #Read when the embedding service is built, on the first embedding
+    os.environ["EMBEDDING_CACHE_PATH"] = args.embedding_cache
+
+    ids, records = load_knowledge_base(args.products, args.store_description)
+    embeddings = embed_records(records, args.batch_size)
+
+    build_local_index(args.output, ids, embeddings, records, metric=args.metric)
+    print(f"Wrote {len(ids)} entries to {args.output}")
+
+    if args.pinecone:
+        PineconeVectorStore().upsert(ids, embeddings, records)
+        print(f"Upserted {len(ids)} entries to Pinecone")
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ def main():
 if __name__ == "__main__":
     guardAgent = GuardAgent()
     classificationAgent = ClassificationAgent()
-    recommendationAgent = RecommendationAgent("api\objects\recommendation_data\apriori_recommendations.json","api\objects\recommendation_data\popular_recommendations.csv")
+    recommendation_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendation_data")
+    recommendationAgent = RecommendationAgent(os.path.join(recommendation_dir, "apriori_recommendations.json"),
+                                              os.path.join(recommendation_dir, "popularity_recommendation.csv"))
 
     #To enforce the agent protocol standards for the computing agents
     agents_dict : Dict[str, AgentProtocol] = {
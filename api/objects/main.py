@@ -1,9 +1,30 @@
-from agent_flow import AgentController
+import os
+import threading
 import runpod
+from agent_flow import AgentController
 
 def main():
+    # With LAZY_STARTUP the controller is only built on the first request, WARM_UP=background builds it in a thread
+    # while the worker starts polling for jobs, so neither the import nor the build delays registering the worker
     agent_controller = AgentController()
-    runpod.serverless.start({"handler": agent_controller.get_response})
+    if os.getenv("WARM_UP", "false").lower() == "background":
+        threading.Thread(target=agent_controller.warm_up, daemon=True).start()
+
+    # With STREAM_RESPONSES enabled the handler is a generator: the final agent's answer is streamed to /stream as it is
+    # generated, and /run still gets every item at once (return_aggregate_stream), the last one being the full message
+    stream_responses = os.getenv("STREAM_RESPONSES", "false").lower() == "true"
+
+    # With ASYNC_HANDLER enabled the worker awaits the llm calls and takes up to MAX_CONCURRENCY conversations at once
+    if os.getenv("ASYNC_HANDLER", "false").lower() == "true":
+        max_concurrency = int(os.getenv("MAX_CONCURRENCY", "16"))
+        handler = agent_controller.aget_response_stream if stream_responses else agent_controller.aget_response
+        runpod.serverless.start({"handler": handler,
+                                 "concurrency_modifier": lambda current_concurrency: max_concurrency,
+                                 "return_aggregate_stream": stream_responses})
+    else:
+        handler = agent_controller.get_response_stream if stream_responses else agent_controller.get_response
+        runpod.serverless.start({"handler": handler,
+                                 "return_aggregate_stream": stream_responses})
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
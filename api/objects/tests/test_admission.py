@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.admission import AdmissionError, AdmissionScheduler, EndpointLimiter
+from agents.load_balancer import BalancedClient, EndpointState, call
+
+class FakeClient():
+    base_url = "http://endpoint/v1/"
+
+def test_zero_length_queue_rejects_over_the_cap():
+    limiter = EndpointLimiter("http://endpoint/v1", max_concurrency=1, max_queue=0, queue_timeout=1.0)
+    limiter.acquire(priority=1)
+
+    with pytest.raises(AdmissionError) as error:
+        limiter.acquire(priority=0)
+    assert error.value.reason == "queue_full"
+
+    stats = limiter.get_stats()
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 1
+    assert stats["queue_depth"] == 0
+
+    #The slot is free again once the first request is done
+    limiter.release()
+    limiter.acquire(priority=1)
+    limiter.release()
+    assert limiter.get_stats()["admitted"] == 2
+
+def test_zero_length_queue_rejects_async_requests():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue=0, queue_timeout=1.0)
+
+    async def run():
+        async with scheduler.aadmit(FakeClient()):
+            with pytest.raises(AdmissionError) as error:
+                async with scheduler.aadmit(FakeClient()):
+                    pass
+            return error.value.reason
+
+    assert asyncio.run(run()) == "queue_full"
+    assert scheduler.get_stats()["http://endpoint/v1"]["rejected"] == 1
+
+def test_full_queue_sheds_a_worse_priority():
+    limiter = EndpointLimiter("http://endpoint/v1", max_concurrency=1, max_queue=1, queue_timeout=1.0)
+    limiter.acquire(priority=1)
+    waiter = limiter.enqueue(priority=1)
+
+    #A request of the same priority does not take the waiting one's place, a better one does
+    with pytest.raises(AdmissionError):
+        limiter.enqueue(priority=1)
+    limiter.enqueue(priority=0)
+    assert waiter.shed
+
+    stats = limiter.get_stats()
+    assert stats["shed"] == 1
+    assert stats["rejected"] == 1
+
+def test_queue_wait_is_not_endpoint_latency():
+    states = [EndpointState("http://a/v1"), EndpointState("http://b/v1")]
+    client = BalancedClient("http://a/v1,http://b/v1", states, [FakeClient(), FakeClient()])
+
+    @contextmanager
+    def slow_admit(client):
+        #Counted as load only once the slot is granted
+        assert all(state.outstanding == 0 for state in states)
+        time.sleep(0.05)
+        yield
+
+    assert call(client, lambda endpoint_client: "answer", slow_admit) == "answer"
+    state = next(state for state in states if state.stats["requests"])
+    assert state.ewma < 0.05
+    assert state.outstanding == 0
+
+def test_sync_hedge_loser_is_not_counted_as_load():
+    slow, fast = EndpointState("http://slow/v1"), EndpointState("http://fast/v1")
+    #The slow endpoint has no latency yet, it is tried first
+    fast.ewma, fast.ewma_updated_at = 1.0, time.monotonic()
+    release = threading.Event()
+
+    def create(endpoint_client):
+        if endpoint_client == "slow":
+            release.wait(5)
+        return endpoint_client
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        client = BalancedClient("http://slow/v1,http://fast/v1", [slow, fast], ["slow", "fast"], balancer="ewma",
+                                hedge_delay=0.01, executor=executor)
+        assert client.call(create) == "fast"
+        assert slow.outstanding == 0
+        release.set()
+
+    #The loser's own end is not recorded either
+    assert slow.outstanding == 0
+    assert slow.ewma is None
+    assert fast.stats["hedge_wins"] == 1
@@ -0,0 +1,107 @@
+import itertools
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import build_recommendation_data as pipeline
+
+CATALOG = [
+    (1, "Coffee", "Latte Rg"), (2, "Coffee", "Latte Lg"), (3, "Coffee", "Cappuccino Rg"),
+    (4, "Bakery", "Croissant"), (5, "Bakery", "Almond Croissant"), (6, "Drinking Chocolate", "Dark chocolate Rg"),
+    (7, "Packaged Chocolate", "Dark chocolate"), (8, "Coffee beans", "Civet Cat"), (9, "Branded", "I Need My Bean! T-shirt"),
+]
+MENU = [("Latte", "Coffee"), ("Cappuccino", "Coffee"), ("Croissant", "Bakery"), ("Almond Croissant", "Bakery"),
+        ("Dark chocolate", "Drinking Chocolate")]
+#(transaction_id, transaction_date, sales_outlet_id, customer_id, product_id)
+RECEIPTS = [
+    (1, "2019-04-01", 3, 10, 1), (1, "2019-04-01", 3, 10, 4),
+    #One menu line and lines that are not on the menu: left out, like the notebook does
+    (2, "2019-04-01", 3, 11, 5), (2, "2019-04-01", 3, 11, 8), (2, "2019-04-01", 3, 11, 9),
+    (3, "2019-04-01", 3, 12, 2), (3, "2019-04-01", 3, 12, 1), (3, "2019-04-01", 3, 12, 6),
+    #The same transaction id and customer on another day is the same receipt for the notebook
+    (4, "2019-04-01", 5, 0, 3), (4, "2019-04-02", 8, 0, 5),
+    (5, "2019-04-02", 8, 13, 7), (5, "2019-04-02", 8, 13, 4), (5, "2019-04-02", 8, 13, 3),
+    (6, "2019-04-02", 8, 14, 3), (6, "2019-04-02", 8, 14, 1), (6, "2019-04-02", 8, 14, 4),
+    (7, "2019-04-02", 8, 15, 6), (7, "2019-04-02", 8, 15, 5), (7, "2019-04-02", 8, 15, 1),
+    (8, "2019-04-03", 3, 16, 4),
+]
+
+@pytest.fixture
+def paths(tmp_path):
+    catalog_path = tmp_path / "product.csv"
+    pd.DataFrame(CATALOG, columns=["product_id", "product_category", "product"]).to_csv(catalog_path, index=False)
+    receipts_path = tmp_path / "201904 sales reciepts.csv"
+    pd.DataFrame(RECEIPTS, columns=["transaction_id", "transaction_date", "sales_outlet_id", "customer_id", "product_id"]
+                 ).to_csv(receipts_path, index=False)
+    products_path = tmp_path / "products.jsonl"
+    products_path.write_text("".join(json.dumps({"name": name, "category": category}) + "\n" for name, category in MENU))
+    return str(catalog_path), str(receipts_path), str(products_path)
+
+#The cells of recommendationEngine.ipynb, with the pairs of the basket in place of mlxtend's apriori
+def notebook(catalog_path, receipts_path, min_support, min_lift):
+    sales_receipts = pd.read_csv(receipts_path)[["transaction_id", "customer_id", "product_id"]]
+    all_products = pd.read_csv(catalog_path)[["product_id", "product_category", "product"]]
+    data = pd.merge(sales_receipts, all_products, on="product_id", how="left")
+    for size in (" Rg", " Lg", " Sm"):
+        data["product"] = data["product"].str.replace(size, "")
+    data = data[data["product"].isin([name for name, _ in MENU])]
+    data["transaction"] = data["transaction_id"].astype(str) + "_" + data["customer_id"].astype(str)
+    items_bought = data["transaction"].value_counts().reset_index()
+    data = data[data["transaction"].isin(items_bought[items_bought["count"] > 1]["transaction"])]
+
+    popular = data.groupby(["product", "product_category"]).count().reset_index()
+    popular = popular[["product", "product_category", "transaction_id"]].rename(columns={"transaction_id": "number_of_transactions"})
+
+    basket = pd.crosstab(data["transaction"], data["product"]) > 0
+    support = basket.mean()
+    rules = {}
+    for antecedent, consequent in itertools.permutations(basket.columns, 2):
+        pair_support = (basket[antecedent] & basket[consequent]).mean()
+        confidence = pair_support / support[antecedent]
+        if pair_support >= min_support and confidence / support[consequent] >= min_lift:
+            rules.setdefault(antecedent, {})[consequent] = confidence
+    return popular, rules
+
+def run_pipeline(catalog_path, receipts_path, products_path, min_support, min_lift, chunk_size):
+    names, categories = pipeline.load_menu(products_path)
+    name_ids, unit_ids, units = pipeline.load_product_ids(catalog_path, names)
+    counts = pipeline.BasketCounts(len(names), len(units))
+    counts.add(*pipeline.read_menu_lines(receipts_path, name_ids, unit_ids, chunk_size))
+    apriori = pipeline.build_apriori_recommendations(counts, names, categories, min_support, min_lift)
+    return pipeline.build_popular_recommendations(counts, units), apriori, counts
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_same_results_as_the_notebook(paths, chunk_size):
+    catalog_path, receipts_path, products_path = paths
+    popular, apriori, counts = run_pipeline(catalog_path, receipts_path, products_path, 0.3, 1.0, chunk_size)
+    expected_popular, expected_rules = notebook(catalog_path, receipts_path, 0.3, 1.0)
+
+    assert counts.receipts == 6
+    pd.testing.assert_frame_equal(popular.reset_index(drop=True), expected_popular.reset_index(drop=True),
+                                  check_dtype=False)
+    assert {antecedent: {rule["product"]: pytest.approx(rule["confidence"]) for rule in rules}
+            for antecedent, rules in apriori.items()} == expected_rules
+    for rules in apriori.values():
+        confidences = [rule["confidence"] for rule in rules]
+        assert confidences == sorted(confidences, reverse=True)
+
+def test_incremental_counts_match_a_full_rebuild(paths, tmp_path):
+    catalog_path, receipts_path, products_path = paths
+    names, _ = pipeline.load_menu(products_path)
+    name_ids, unit_ids, units = pipeline.load_product_ids(catalog_path, names)
+    state_path = str(tmp_path / "counts.npz")
+
+    counts = pipeline.BasketCounts(len(names), len(units))
+    counts.add(*pipeline.read_menu_lines(receipts_path, name_ids, unit_ids, 4))
+    counts.save(state_path, names, units)
+    loaded = pipeline.BasketCounts.load(state_path, names, units)
+
+    assert (loaded.pair_counts == counts.pair_counts).all()
+    assert (loaded.line_counts == counts.line_counts).all()
+    assert loaded.receipts == counts.receipts
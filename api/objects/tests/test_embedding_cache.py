@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import agents.embedding_cache as embedding_cache
+from agents.embedding_cache import AsyncEmbeddingBatcher
+
+async def fake_embedding(client, model_name, texts):
+    return [[float(len(text))] for text in texts]
+
+def test_async_batcher_survives_a_new_event_loop(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "async_get_embedding", fake_embedding)
+    batcher = AsyncEmbeddingBatcher(None, "fake", max_wait=0.01)
+
+    #The first loop closes with a text still waiting for its flush
+    async def abandon():
+        task = asyncio.ensure_future(batcher.embed(["left behind"]))
+        await asyncio.sleep(0)
+        task.cancel()
+    asyncio.run(abandon())
+
+    assert asyncio.run(asyncio.wait_for(batcher.embed(["latte"]), timeout=1)) == [[5.0]]
@@ -0,0 +1,43 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.response_cache import ResponseCache
+
+def conversation(*contents):
+    roles = ["user", "assistant"]
+    return [{"role": roles[index % 2], "content": content} for index, content in enumerate(contents)]
+
+def test_exact_hits_need_the_same_window():
+    cache = ResponseCache(source_paths=[])
+    cache.put(conversation("Tell me about the latte", "A latte is...", "How much is it?"), None, "4.75")
+
+    assert cache.get_exact(conversation("tell me about the LATTE!", "A latte is...", "how much is it")) == "4.75"
+    #The same follow-up in another conversation is about something else
+    assert cache.get_exact(conversation("Tell me about the scone", "A scone is...", "How much is it?")) is None
+
+def test_exact_key_only_covers_the_context_window():
+    cache = ResponseCache(source_paths=[], context_window=3)
+    cache.put(conversation("Hi", "Hello!", "What are your opening hours?"), None, "7am to 8pm")
+
+    #Messages before the window are not sent to the model, they do not change the answer
+    assert cache.get_exact(conversation("Earlier", "Earlier answer", "Hi", "Hello!", "What are your opening hours?")) == "7am to 8pm"
+    assert cache.get_exact(conversation("Hey", "Hello!", "What are your opening hours?")) is None
+
+def test_semantic_level_is_off_by_default():
+    cache = ResponseCache(source_paths=[])
+    cache.put(conversation("What are your opening hours?"), [1.0, 0.0], "7am to 8pm")
+
+    assert cache.get_semantic(conversation("When are you open?"), [1.0, 0.0]) is None
+    assert cache.get_stats()["misses"] == 1
+
+def test_semantic_hits_need_the_same_items_and_context():
+    cache = ResponseCache(source_paths=[], similarity_threshold=0.9, item_names=["Latte", "Cappuccino"])
+    cache.put(conversation("Price of latte"), [1.0, 0.0], "4.75")
+
+    assert cache.get_semantic(conversation("How much is a latte?"), [0.99, 0.05]) == "4.75"
+    assert cache.get_semantic(conversation("Price of cappuccino"), [0.99, 0.05]) is None
+    assert cache.get_semantic(conversation("Hi", "Hello!", "How much is a latte?"), [0.99, 0.05]) is None
+    assert cache.get_stats()["semantic_hits"] == 1
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.decision_agent import DecisionAgent
+from agents.classification_agent import ClassificationAgent
+from agents.guard_classification_agent import GuardClassificationAgent
+
+#postprocess only parses the completion, the agents are not built
+def test_unknown_agent_falls_back_to_the_details_agent():
+    for agent in ["", "Detail agent", "barista_agent"]:
+        response = GuardClassificationAgent.postprocess(None, '{"decision": "allowed", "agent": "%s"}' % agent)
+        assert response["memory"]["classification_decision"] == "details_agent"
+    response = ClassificationAgent.postprocess(None, '{"message": ""}')
+    assert response["memory"]["classification_decision"] == "details_agent"
+
+def test_known_agent_and_rejection_are_kept():
+    response = GuardClassificationAgent.postprocess(None, '{"decision": "allowed", "agent": " Order_Taking_Agent"}')
+    assert response["memory"]["classification_decision"] == "order_taking_agent"
+
+    response = GuardClassificationAgent.postprocess(None, '{"decision": "not allowed", "agent": ""}')
+    assert response["memory"]["classification_decision"] == ""
+    assert response["content"]
+
+def test_decision_agent_is_abstract():
+    with pytest.raises(TypeError):
+        DecisionAgent()
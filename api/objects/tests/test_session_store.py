@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.conversation import Conversation
+from agents.order_state import Menu, OrderState
+from agents.session_store import InMemorySessionStore, SQLiteSessionStore
+
+def order_answer(items, step="2"):
+    return {"role": "assistant", "content": "Anything else?",
+            "memory": {"agent": "order_taking_agent", "step number": step, "order": items, "total": "0.00",
+                       "asked_recommendation_before": True}}
+
+def details_answer():
+    return {"role": "assistant", "content": "We open at 7am.", "memory": {"agent": "details_agent"}}
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemorySessionStore()
+    return SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite"))
+
+def test_order_is_updated_every_turn(store):
+    assert store.load_order("session") == {}
+
+    store.append("session", [{"role": "user", "content": "A latte please"}, order_answer([{"item": "Latte", "quantity": 1}])])
+    store.append("session", [{"role": "user", "content": "When do you open?"}, details_answer()])
+    assert store.load_order("session")["order"] == [{"item": "Latte", "quantity": 1}]
+
+    store.append("session", [{"role": "user", "content": "And a croissant"},
+                             order_answer([{"item": "Latte", "quantity": 1}, {"item": "Croissant", "quantity": 1}], step="3")])
+    order = store.load_order("session")
+    assert order["step number"] == "3"
+    assert len(order["order"]) == 2
+    assert store.load_order("other session") == {}
+
+def test_sqlite_store_adds_the_order_column(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    database = sqlite3.connect(path)
+    database.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, expires_at REAL, length INTEGER)")
+    database.commit()
+    database.close()
+
+    store = SQLiteSessionStore(path=path)
+    store.append("session", [{"role": "user", "content": "A latte please"}, order_answer([{"item": "Latte", "quantity": 1}])])
+    assert store.load_order("session")["step number"] == "2"
+
+def test_order_state_prefers_the_session_order():
+    menu = Menu()
+    messages = [{"role": "user", "content": "A latte please"}, order_answer([{"item": "Latte", "quantity": 1}]),
+                {"role": "user", "content": "And a croissant"}]
+
+    #The window no longer holds the order taking answer, the session store still has its memory
+    conversation = Conversation(messages[2:], order_memory=order_answer([{"item": "Croissant", "quantity": 2}])["memory"])
+    assert [(item.item, item.quantity) for item in OrderState.of(conversation, menu).items] == [("Croissant", 2)]
+    #Without a session the order is found in the messages
+    assert [item.item for item in OrderState.of(Conversation(messages), menu).items] == ["Latte"]
+    assert OrderState.of(Conversation(messages[2:], order_memory={}), menu).items == []
@@ -0,0 +1,26 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from agents.verdict_memo import VerdictMemo
+
+#The last message is the user's, the roles alternate before it
+def window(*contents):
+    return [{"role": "user" if (len(contents) - index) % 2 else "assistant", "content": content}
+            for index, content in enumerate(contents)]
+
+def test_follow_up_needs_the_same_exchange():
+    memo = VerdictMemo()
+    key, _ = memo.lookup(window("Can I get a latte?", "Sure, anything else?", "yes"))
+    memo.store(key, {"memory": {"guard_decision": "allowed"}})
+
+    assert memo.lookup(window("Can I get a latte?", "Sure, anything else?", "Yes!"))[1] is not None
+    #The same answer to another question is not the same verdict
+    assert memo.lookup(window("How do I brew it at home?", "Do you want the steps?", "yes"))[1] is None
+
+def test_off_memo_never_hits():
+    memo = VerdictMemo(max_size=0)
+    key, verdict = memo.lookup(window("Hi"))
+    assert key is None and verdict is None
@@ -6,7 +6,8 @@ import {MessageInterface} from '@/types/types';
 import { widthPercentageToDP as wp, heightPercentageToDP as hp } from 'react-native-responsive-screen'
 import { GestureHandlerRootView, TextInput } from 'react-native-gesture-handler'
 import { Feather } from '@expo/vector-icons'
-import {callChatBotAPI } from '@/services/chatBot'
+import {callChatBotAPI, streamChatBotAPI } from '@/services/chatBot'
+import { STREAM_RESPONSES } from '@/config/runpodConfigs'
 import PageHeader from '@/components/PageHeader'
 import {  useCart } from '@/components/CartContext'
 
@@ -17,6 +18,8 @@ const ChatRoom = () => {
   const [isTyping, setIsTyping] = useState<boolean>(false);
   const textRef = useRef('')
   const inputRef = useRef<TextInput>(null)
+  // Identifies this conversation to the worker's session store (EXPO_PUBLIC_RUNPOD_SESSIONS)
+  const sessionIdRef = useRef(`${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`)
 
   useEffect(() => {
   }, [messages]);
@@ -33,9 +36,24 @@ const ChatRoom = () => {
         textRef.current = ''
         if(inputRef) inputRef?.current?.clear();
         setIsTyping(true)
-        let resposnseMessage = await callChatBotAPI(InputMessages);
-        setIsTyping(false)
-        setMessages(prevMessages => [...prevMessages, resposnseMessage]);
+        let resposnseMessage: MessageInterface;
+        if (STREAM_RESPONSES) {
+            // Show the answer as it streams in, then replace it with the final message and its memory
+            let streamedContent = '';
+            resposnseMessage = await streamChatBotAPI(InputMessages, (delta) => {
+                if (!streamedContent) setIsTyping(false)
+                streamedContent += delta;
+                setMessages([...InputMessages, { content: streamedContent, role: 'assistant' }]);
+            }, sessionIdRef.current, () => {
+                streamedContent = '';
+            });
+            setIsTyping(false)
+            setMessages([...InputMessages, resposnseMessage]);
+        } else {
+            resposnseMessage = await callChatBotAPI(InputMessages, sessionIdRef.current);
+            setIsTyping(false)
+            setMessages(prevMessages => [...prevMessages, resposnseMessage]);
+        }
         
         if (resposnseMessage) {
             if (resposnseMessage.memory ) {
@@ -1,4 +1,10 @@
 const API_URL = process.env.EXPO_PUBLIC_RUNPOD_API_URL as string;;
 const API_KEY = process.env.EXPO_PUBLIC_RUNPOD_API_KEY as string;; 
 
-export { API_URL, API_KEY };
\ No newline at end of file
+// Set when the worker runs with STREAM_RESPONSES, the chat then shows the answer while it is generated
+const STREAM_RESPONSES = process.env.EXPO_PUBLIC_RUNPOD_STREAM === 'true';
+
+// Set when the worker keeps the conversations (session store), only the session id and the new message are sent
+const USE_SESSIONS = process.env.EXPO_PUBLIC_RUNPOD_SESSIONS === 'true';
+
+export { API_URL, API_KEY, STREAM_RESPONSES, USE_SESSIONS };
\ No newline at end of file
@@ -1,20 +1,35 @@
 import axios from 'axios';
 import { MessageInterface } from '@/types/types';
-import { API_KEY, API_URL } from '@/config/runpodConfigs';
+import { API_KEY, API_URL, USE_SESSIONS } from '@/config/runpodConfigs';
 
-async function callChatBotAPI(messages: MessageInterface[]): Promise<MessageInterface> {
+const headers = {
+    'Content-Type': 'application/json',
+    'Authorization': `Bearer ${API_KEY}`
+};
+
+// A worker running with STREAM_RESPONSES returns every streamed item at once, the last one is the full message
+function getOutputMessage(output: any): MessageInterface {
+    return Array.isArray(output) ? output[output.length - 1] : output;
+}
+
+// With sessions the worker already has the history, so only the new message is sent
+function getJobInput(messages: MessageInterface[], sessionId?: string) {
+    if (USE_SESSIONS && sessionId) {
+        return { session_id: sessionId, message: messages[messages.length - 1] };
+    }
+    return { messages };
+}
+
+async function callChatBotAPI(messages: MessageInterface[], sessionId?: string): Promise<MessageInterface> {
     try {
         const response = await axios.post(API_URL, {
-            input: { messages }
+            input: getJobInput(messages, sessionId)
         }, {
-            headers: {
-                'Content-Type': 'application/json',
-                'Authorization': `Bearer ${API_KEY}`
-            }
+            headers
         });
         
         let output = response.data;
-        let outputMessage: MessageInterface = output['output'];
+        let outputMessage: MessageInterface = getOutputMessage(output['output']);
 
         return outputMessage;
     } catch (error) {
@@ -23,4 +38,42 @@ async function callChatBotAPI(messages: MessageInterface[]): Promise<MessageInte
     }
 }
 
-export { callChatBotAPI };
\ No newline at end of file
+// Streams the answer of a worker running with STREAM_RESPONSES: the job is queued with /run and /stream is polled,
+// onDelta gets the text as it is generated and the final message (with its memory) is returned. onReset is called when
+// the worker drops the answer streamed so far (it could not finish it and sends a different one)
+async function streamChatBotAPI(messages: MessageInterface[], onDelta: (delta: string) => void, sessionId?: string, onReset?: () => void): Promise<MessageInterface> {
+    const baseUrl = API_URL.replace(/\/runsync\/?$/, '');
+    try {
+        const job = await axios.post(`${baseUrl}/run`, { input: getJobInput(messages, sessionId) }, { headers });
+        const jobId = job.data['id'];
+
+        let outputMessage: MessageInterface | null = null;
+        while (true) {
+            const response = await axios.get(`${baseUrl}/stream/${jobId}`, { headers });
+            for (const item of response.data['stream'] ?? []) {
+                const output = item['output'];
+                if (output?.delta !== undefined) {
+                    onDelta(output.delta);
+                } else if (output?.reset) {
+                    onReset?.();
+                } else if (output) {
+                    outputMessage = output;
+                }
+            }
+
+            const status = response.data['status'];
+            if (status === 'COMPLETED') {
+                if (!outputMessage) throw new Error('Chat bot job returned no message');
+                return outputMessage;
+            }
+            if (status === 'FAILED' || status === 'CANCELLED' || status === 'TIMED_OUT') {
+                throw new Error(`Chat bot job ${status.toLowerCase()}`);
+            }
+        }
+    } catch (error) {
+        console.error('Error calling the API:', error);
+        throw error;
+    }
+}
+
+export { callChatBotAPI, streamChatBotAPI };